@@ -5,18 +5,24 @@ from setuptools import Distribution
 from setuptools import Extension
 from distutils.command.build_ext import build_ext
 
-extra_compile_args = [] if os.name == 'nt' else ["-g", "-O2"]
-extra_link_args = [] if os.name == 'nt' else ["-g"]
+extra_compile_args = [] if os.name == 'nt' else ["-g", "-O2", "-pthread"]
+extra_link_args = [] if os.name == 'nt' else ["-g", "-pthread"]
 platform_src = ["src/windows.cpp"] if os.name == 'nt' else []
 
 ext_modules = [
     Extension('cv_algorithms._cv_algorithms',
         include_dirs = [os.path.join(os.path.dirname(__file__), "src")],
         sources=['src/thinning.cpp',
+                'src/thinning3d.cpp',
                 'src/distance.cpp',
                 'src/grassfire.cpp',
                 'src/popcount.cpp',
-                'src/neighbours.cpp'] + platform_src,
+                'src/neighbours.cpp',
+                'src/packed.cpp',
+                'src/skeleton.cpp',
+                'src/chaincode.cpp',
+                'src/hamming.cpp',
+                'src/cpu.cpp'] + platform_src,
         extra_compile_args=extra_compile_args,
         extra_link_args=extra_link_args)
 ]
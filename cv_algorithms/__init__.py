@@ -8,8 +8,16 @@ from .classification import *
 from .neighbours import *
 from .morphology import *
 from .popcount import *
+from .hamming import *
+from .packed import *
 from .thinning import *
+from .skeleton import *
+from .chaincode import *
 from .grassfire import *
 from .distance import *
 from .utils import *
 from .colorspace import *
+from .parallel import *
+from .cpu import *
+from .workspace import *
+from .instrumentation import *
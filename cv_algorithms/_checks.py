@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
+import mmap
 import numpy as np
+from .instrumentation import _record_input_copy
 
 __all__ = ["__check_image_c_order", "__check_image_grayscale_2d",
+           "__check_volume_3d",
            "__check_image_min_wh", "__check_array_uint8",
-           "force_c_order_contiguous"]
+           "__check_roi", "__check_out_array", "__strided_2d",
+           "__resolve_chunk_size", "__chunk_rows", "__release_chunk", "force_c_order_contiguous"]
+
+# Chunk size used for np.memmap-backed arrays if chunk_size=None
+_memmap_chunk_size = 64 * 1024 * 1024
+
+try: # numpy >= 2.0
+    from numpy.lib.array_utils import byte_bounds as _byte_bounds
+except ImportError:
+    _byte_bounds = np.byte_bounds
 
 
 def __check_image_min_wh(img, min_width, min_height):
-    """Raise if the image does not have a given minimum width and height"""
-    height, width = img.shape
+    """
+    Raise if the image (or every image of a (N, H, W) stack)
+    does not have a given minimum width and height
+    """
+    height, width = img.shape[-2:]
     if height < min_height or width < min_width:
         raise ValueError("Thinning algorithm needs an image at least 3px wide and 3px high but size is {}".format(img.shape))
 
@@ -22,14 +37,35 @@ def __check_image_c_order(img):
         raise ValueError("cv_algorithms works only on contiguous arrays")
 
 
-def force_c_order_contiguous(img):
-    """Raise if the image is not in FORTRAN memory order"""
+def force_c_order_contiguous(img, function=None):
+    """
+    Return a C-contiguous version of img, copying it if required.
+    Copies are recorded for input_copies() under the given function name.
+    """
     # Check array memory order
     if not img.flags['C_CONTIGUOUS']: # i.e. not C-ordered
+        _record_input_copy(function, img)
         return np.ascontiguousarray(img)
     return img
 
 
+def __strided_2d(img, function=None):
+    """
+    Prepare a 2D array for C code that supports strided input,
+    e.g. a view like img[:, 100:900].
+    Returns (img, row_stride, pixel_stride) with the strides in elements.
+    Only if the strides are not a multiple of the element size or
+    the array is unaligned, img is copied (recorded for input_copies()).
+    """
+    itemsize = img.dtype.itemsize
+    row_stride, pixel_stride = img.strides
+    if not img.flags['ALIGNED'] or row_stride % itemsize != 0 or pixel_stride % itemsize != 0:
+        _record_input_copy(function, img)
+        img = np.ascontiguousarray(img)
+        row_stride, pixel_stride = img.strides
+    return img, row_stride // itemsize, pixel_stride // itemsize
+
+
 def __check_image_grayscale_2d(img):
     """Raise if the image  is not a 2D image"""
     nd = len(img.shape)
@@ -38,7 +74,123 @@ def __check_image_grayscale_2d(img):
     if nd != 2:
         raise ValueError("Image has wrong number of dimensions ({0} instead of 2)".format(nd))  
 
+def __check_volume_3d(volume):
+    """Raise if the volume is not a 3D (depth, height, width) array"""
+    nd = len(volume.shape)
+    if nd != 3:
+        raise ValueError("Volume has wrong number of dimensions ({0} instead of 3)".format(nd))
+
 def __check_array_uint8(img):
     """Raise if the image  is not a 2D image"""
     if img.dtype != np.uint8:
         raise ValueError("Can only use images that have np.uint8 dtype")
+
+
+def __check_roi(img, roi):
+    """
+    Raise if the region of interest is not inside the image.
+    roi is either None (i.e. the whole image)
+    or a (x, y, width, height) tuple.
+    Returns the (x, y, width, height) tuple
+    """
+    height, width = img.shape[:2]
+    if roi is None:
+        return (0, 0, width, height)
+    if len(roi) != 4:
+        raise ValueError("ROI must be a (x, y, width, height) tuple but is {0}".format(roi))
+    x, y, w, h = [int(v) for v in roi]
+    if x < 0 or y < 0 or w < 0 or h < 0 or x + w > width or y + h > height:
+        raise ValueError("ROI {0} is not inside the image of size {1}".format(roi, img.shape))
+    return (x, y, w, h)
+
+
+def __check_out_array(out, shape, dtype, name="out"):
+    """
+    Raise if the caller-provided output array can't be used to
+    store a result with the given shape & dtype.
+    If out is None, allocate a new zero-initialized array.
+    name is the parameter name used in error messages.
+    Returns the output array
+    """
+    if out is None:
+        return np.zeros(shape, dtype=dtype, order="C")
+    if not isinstance(out, np.ndarray):
+        raise ValueError("{0} must be a numpy array".format(name))
+    if out.shape != tuple(shape):
+        raise ValueError("{0} has shape {1} but {2} is required".format(name, out.shape, tuple(shape)))
+    if out.dtype != dtype:
+        raise ValueError("{0} has dtype {1} but {2} is required".format(name, out.dtype, np.dtype(dtype)))
+    if not out.flags['C_CONTIGUOUS']:
+        raise ValueError("{0} must be a C-contiguous array".format(name))
+    if not out.flags['WRITEABLE']:
+        raise ValueError("{0} must be writeable".format(name))
+    return out
+
+
+def _is_memmap(arr):
+    """Is arr an np.memmap or a view of one?"""
+    while isinstance(arr, np.ndarray):
+        if isinstance(arr, np.memmap):
+            return True
+        arr = arr.base
+    return False
+
+
+def __resolve_chunk_size(chunk_size, *arrays):
+    """
+    Resolve a user-supplied chunk_size argument (in bytes):
+    None means 64 MiB chunks if any of the arrays is backed by
+    an np.memmap, else no chunking. Returns 0 for no chunking.
+    """
+    if chunk_size is None:
+        return _memmap_chunk_size if any(_is_memmap(arr) for arr in arrays) else 0
+    if chunk_size < 0:
+        raise ValueError("chunk_size must be >= 0, not {0}".format(chunk_size))
+    return int(chunk_size)
+
+
+def __chunk_rows(chunk_size, rows, row_nbytes):
+    """
+    Number of rows of row_nbytes bytes each to process at a time
+    for a resolved chunk_size (see __resolve_chunk_size()).
+    Returns rows if there is no chunking.
+    """
+    if chunk_size == 0:
+        return max(1, rows)
+    return max(1, chunk_size // max(1, int(row_nbytes)))
+
+
+def _memmap_root(arr):
+    """The np.memmap that owns the memory of arr, or None"""
+    while isinstance(arr, np.ndarray):
+        if isinstance(arr, np.memmap) and isinstance(arr.base, mmap.mmap):
+            return arr
+        arr = arr.base
+    return None
+
+
+def __release_chunk(source, chunk, written=False):
+    """
+    After a chunk (a view of source) of an np.memmap-backed array has been
+    processed, release its pages, so streaming over a huge file doesn't
+    accumulate it in RAM. If written is True, the chunk has been modified
+    and its pages are written to disk first.
+    Does nothing for other arrays.
+    """
+    root = _memmap_root(source)
+    # Copy-on-write mappings would lose their modifications
+    if root is None or root.mode == "c" or chunk.size == 0:
+        return
+    mm = root.base
+    # The mapping starts at the allocation granularity boundary before the offset
+    mmap_address = root.ctypes.data - root.offset % mmap.ALLOCATIONGRANULARITY
+    low, high = _byte_bounds(chunk)
+    start = max(0, low - mmap_address)
+    start -= start % mmap.PAGESIZE
+    end = min(len(mm), high - mmap_address)
+    if end <= start:
+        return
+    if written and root.mode != "r":
+        mm.flush(start, end - start)
+    if hasattr(mmap, "MADV_DONTNEED"):
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Freeman chain codes of pixel paths
+"""
+import numpy as np
+import enum
+from ._ffi import *
+from .neighbours import Direction
+
+__all__ = ["chain_encode", "ChainCode", "ChainCodeFormat"]
+
+_ffi.cdef('''
+int chain_encode(uint8_t* dst, size_t* dst_size, const int32_t* path,
+                 size_t num_points, int format);
+int chain_decode(int32_t* path, const uint8_t* data, size_t data_size,
+                 size_t num_steps, int format, int32_t start_y, int32_t start_x);
+''')
+
+_chain_invalid_code = -4
+_int32_info = np.iinfo(np.int32)
+
+
+class ChainCodeFormat(enum.IntEnum):
+    """
+    How the steps of a ChainCode are stored.
+    The code of every step is Direction - 1, i.e. 0-7.
+
+    Plain:
+        One byte per step
+    Packed:
+        3 bits per step. Step i is stored in bits 3*i to 3*i+2
+        of the data, read as a little-endian bit stream.
+    RunLength:
+        One byte per run of up to 32 equal steps: The code in bits 0-2,
+        the number of steps - 1 in bits 3-7. Straight lines
+        need only one byte per 32 pixels.
+    """
+    Plain = 0
+    Packed = 1
+    RunLength = 2
+
+
+class ChainCode(object):
+    """
+    A path of 8-connected pixels, stored as
+    start point and compact Freeman chain code.
+
+    Attributes
+    ==========
+    start : (y, x) tuple
+        The first point of the path
+    num_steps : int
+        The number of steps, i.e. the number of points - 1
+    format : ChainCodeFormat
+        How the steps are stored in data
+    data : uint8 numpy array
+        The encoded steps
+    """
+    def __init__(self, start, num_steps, format, data):
+        self.start = (int(start[0]), int(start[1]))
+        self.num_steps = int(num_steps)
+        self.format = ChainCodeFormat(format)
+        self.data = np.ascontiguousarray(data, dtype=np.uint8)
+
+    @property
+    def nbytes(self):
+        """Number of bytes used by the encoded steps"""
+        return self.data.nbytes
+
+    def decode(self):
+        """
+        Decode to a (num_steps + 1, 2) int32 array of
+        (y, x) coordinates, i.e. numpy index order.
+        """
+        path = np.empty((self.num_steps + 1, 2), dtype=np.int32)
+        pathptr = _ffi.cast("int32_t*", path.ctypes.data)
+        dataptr = _ffi.cast("uint8_t*", self.data.ctypes.data)
+        rc = _libcv_algorithms.chain_decode(pathptr, dataptr, self.data.size, self.num_steps,
+                                            self.format, self.start[0], self.start[1])
+        if rc == -2:
+            if self.format == ChainCodeFormat.Plain:
+                raise ValueError("Plain chain code data has {0} bytes but {1} steps require {1}".format(
+                    self.data.size, self.num_steps))
+            if self.format == ChainCodeFormat.Packed:
+                raise ValueError("Packed chain code data has {0} bytes but {1} steps require {2}".format(
+                    self.data.size, self.num_steps, (3 * self.num_steps + 7) // 8))
+            raise ValueError("Chain code data does not contain {0} steps".format(self.num_steps))
+        if rc == _chain_invalid_code:
+            raise ValueError("Plain chain code data contains step codes > 7")
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        return path
+
+    def convert(self, format):
+        """Return a ChainCode of the same path using the given ChainCodeFormat"""
+        if ChainCodeFormat(format) == self.format:
+            return self
+        return chain_encode(self.decode(), format)
+
+    def directions(self):
+        """List of the Direction of every step"""
+        codes = self.convert(ChainCodeFormat.Plain).data
+        return [Direction(code + 1) for code in codes.tolist()]
+
+    def __len__(self):
+        return self.num_steps
+
+    def __eq__(self, other):
+        return isinstance(other, ChainCode) and self.start == other.start \
+            and self.num_steps == other.num_steps and self.format == other.format \
+            and np.array_equal(self.data, other.data)
+
+    def __repr__(self):
+        return "ChainCode(start={0}, num_steps={1}, format={2}, nbytes={3})".format(
+            self.start, self.num_steps, self.format.name, self.nbytes)
+
+
+def chain_encode(path, format=ChainCodeFormat.RunLength):
+    """
+    Encode a path of 8-connected pixels, e.g. an edge of a
+    SkeletonGraph, as Freeman chain code.
+
+    Parameters
+    ==========
+    path : (n, 2) array-like
+        The (y, x) coordinates (numpy index order) of the path.
+        Consecutive points must be 8-neighbours.
+        For OpenCV contours, use contour[:, 0, ::-1].
+    format : ChainCodeFormat
+        How the steps are stored
+
+    Returns
+    =======
+    A ChainCode instance. Use its decode() method
+    to get the coordinates back.
+    """
+    format = ChainCodeFormat(format)
+    path = np.asarray(path)
+    if path.size > 0 and (path.min() < _int32_info.min or path.max() > _int32_info.max):
+        raise ValueError("path coordinates must fit into int32")
+    path = np.ascontiguousarray(path, dtype=np.int32)
+    if path.ndim != 2 or path.shape[1] != 2 or path.shape[0] == 0:
+        raise ValueError("path must be a (n, 2) array of (y, x) coordinates with n > 0")
+    num_steps = path.shape[0] - 1
+    # Plain needs one byte per step, the other formats less
+    data = np.empty(num_steps, dtype=np.uint8)
+    size = _ffi.new("size_t*")
+
+    dataptr = _ffi.cast("uint8_t*", data.ctypes.data)
+    pathptr = _ffi.cast("int32_t*", path.ctypes.data)
+
+    rc = _libcv_algorithms.chain_encode(dataptr, size, pathptr, path.shape[0], format)
+    if rc == -2:
+        raise ValueError("Consecutive points of the path must be 8-neighbours")
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return ChainCode(path[0], num_steps, format, data[:size[0]].copy())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runtime selection of the CPU-specific kernel variants
+"""
+import os
+import enum
+import warnings
+from ._ffi import *
+
+__all__ = ["CpuFeatureLevel", "get_cpu_feature_level",
+           "get_supported_cpu_feature_level", "set_cpu_feature_level"]
+
+_ffi.cdef('''
+int cpu_supported_feature_level();
+int cpu_get_feature_level();
+int cpu_set_feature_level(int level);
+''')
+
+
+class CpuFeatureLevel(enum.IntEnum):
+    """
+    Instruction set extensions used by the hot kernels
+    (popcount(), popcount_sum(), binary_neighbours() and its reductions).
+    Every level includes the lower levels.
+
+    Baseline:
+        No extensions beyond what the module was compiled for
+        (SSE2 on x86-64)
+    Popcnt:
+        POPCNT & SSE4.2
+    AVX2:
+        AVX2
+    AVX512:
+        AVX-512 F, BW & VPOPCNTDQ
+    """
+    Baseline = 0
+    Popcnt = 1
+    AVX2 = 2
+    AVX512 = 3
+
+
+def get_supported_cpu_feature_level():
+    """
+    The highest CpuFeatureLevel supported by this CPU,
+    as detected using CPUID when the module is loaded.
+    Always Baseline on non-x86 platforms and compilers
+    without function multiversioning.
+    """
+    return CpuFeatureLevel(_libcv_algorithms.cpu_supported_feature_level())
+
+
+def get_cpu_feature_level():
+    """
+    The CpuFeatureLevel the kernels currently use.
+    See set_cpu_feature_level()
+    """
+    return CpuFeatureLevel(_libcv_algorithms.cpu_get_feature_level())
+
+
+def set_cpu_feature_level(level=None):
+    """
+    Force the kernels to use the given CpuFeatureLevel,
+    e.g. to benchmark or test the variants against each other.
+    The setting applies to all threads.
+
+    The initial level can also be set using the CV_ALGORITHMS_CPU_LEVEL
+    environment variable (e.g. CV_ALGORITHMS_CPU_LEVEL=AVX2).
+
+    Parameters
+    ==========
+    level : CpuFeatureLevel, str or None
+        The level to use, or its name.
+        None selects the highest level supported by this CPU (the default).
+        Raises ValueError if the CPU does not support the level.
+    """
+    if level is None:
+        level = -1
+    elif isinstance(level, str):
+        try:
+            level = CpuFeatureLevel[level]
+        except KeyError:
+            raise ValueError("Unknown CPU feature level {0}".format(level)) from None
+    else:
+        level = CpuFeatureLevel(level)
+    rc = _libcv_algorithms.cpu_set_feature_level(level)
+    if rc == -2:
+        raise ValueError("CPU feature level {0} is not supported by this CPU (supported: {1})".format(
+            level.name, get_supported_cpu_feature_level().name))
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+
+
+if os.environ.get("CV_ALGORITHMS_CPU_LEVEL"):
+    try:
+        set_cpu_feature_level(os.environ["CV_ALGORITHMS_CPU_LEVEL"])
+    except ValueError as ex:
+        warnings.warn("Ignoring CV_ALGORITHMS_CPU_LEVEL: {0}".format(ex), RuntimeWarning)
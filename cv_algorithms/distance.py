@@ -6,36 +6,152 @@ data structures
 """
 # -*- coding: utf-8 -*-
 from ._ffi import *
+from ._checks import *
+from .parallel import _resolve_num_threads
 import numpy as np
 
-__all__ = ["pairwise_diff", "rgb_distance", "grayscale_distance"]
+__all__ = ["pairwise_diff", "pairwise_diff_knn", "rgb_distance", "grayscale_distance"]
 
 _ffi.cdef('''
-int pairwise_diff(const double* a, const double* b, double* result, size_t awidth, size_t bwidth);
+int pairwise_diff_float(float* dst, const float* a, const float* b,
+                        size_t a_size, size_t b_size, size_t num_threads);
+int pairwise_diff_double(double* dst, const double* a, const double* b,
+                         size_t a_size, size_t b_size, size_t num_threads);
+int pairwise_diff_knn_float(int64_t* indices, float* distances,
+                            const float* a, const float* b, size_t a_size, size_t b_size,
+                            size_t k, float max_distance, size_t num_threads);
+int pairwise_diff_knn_double(int64_t* indices, double* distances,
+                             const double* a, const double* b, size_t a_size, size_t b_size,
+                             size_t k, double max_distance, size_t num_threads);
 ''')
 
-def pairwise_diff(a, b):
+# dtype => (C type, pairwise function, k nearest neighbours function)
+_pairwise_diff_functions = {
+    np.dtype(np.float32): ("float", "pairwise_diff_float", "pairwise_diff_knn_float"),
+    np.dtype(np.float64): ("double", "pairwise_diff_double", "pairwise_diff_knn_double")
+}
+
+
+def _check_diff_arrays(a, b, function):
+    """
+    Internal: Check the 1D arrays a and b and return them as
+    C-contiguous arrays of their common float32 or float64 dtype
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.ndim != 1 or b.ndim != 1:
+        raise ValueError("The arrays must have a 1D shape. Actual shape: {0} and {1}".format(a.shape, b.shape))
+    dtype = np.result_type(a.dtype, b.dtype, np.float32)
+    if dtype not in _pairwise_diff_functions:
+        raise ValueError("The arrays need to have float32 or float64 elements, not {0} and {1}".format(
+            a.dtype, b.dtype))
+    a = force_c_order_contiguous(a.astype(dtype, copy=False), function)
+    b = force_c_order_contiguous(b.astype(dtype, copy=False), function)
+    return a, b
+
+
+def pairwise_diff(a, b, out=None, num_threads=None):
     """
     Compute the pairwise |a-b| absolute difference between two 1D float arrays, a and b
     Returns a (a.size, b.size) float distance matrix.
 
-    Uses a C-optimized backend.
+    Uses a cache-blocked, multithreaded C backend.
+    The result is float32 if both arrays are float32
+    (or smaller types), else float64.
+
+    For nearest neighbour search, use pairwise_diff_knn() which
+    does not store the full distance matrix.
+
+    Parameters
+    ==========
+    a : (N,) numpy array-like
+    b : (M,) numpy array-like
+    out : numpy array or None
+        If given, the result is stored in this (N, M)
+        array of the result dtype instead of a new array.
+    num_threads : int or None
+        The number of threads to use.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+
+    Returns
+    =======
+    A (N, M) float32 or float64 numpy array of distances
     """
-    if len(a.shape) != 1 or len(b.shape) != 1:
-        raise ValueError("The arrays must have a 1D shape. Actual shape: {0} and {1}".format(a.shape, b.shape))
-    if (a.nbytes // a.size) != 8 or (b.nbytes // b.size) != 8:
-        raise ValueError("The arrays need to have 64-bit float elements")
+    a, b = _check_diff_arrays(a, b, "pairwise_diff")
+    num_threads = _resolve_num_threads(num_threads)
+    ctype, pairwise_fn, _ = _pairwise_diff_functions[a.dtype]
     #  Allocate output array
-    out = np.zeros((a.shape[0], b.shape[0]), np.float64)
-
-    aptr = _ffi.cast("const double*", a.ctypes.data)
-    bptr = _ffi.cast("const double*", b.ctypes.data)
-    outptr = _ffi.cast("double*", out.ctypes.data)
+    out = __check_out_array(out, (a.shape[0], b.shape[0]), a.dtype)
 
-    _libcv_algorithms.pairwise_diff(aptr, bptr, outptr, a.shape[0], b.shape[0])
+    aptr = _ffi.cast("const {0}*".format(ctype), a.ctypes.data)
+    bptr = _ffi.cast("const {0}*".format(ctype), b.ctypes.data)
+    outptr = _ffi.cast("{0}*".format(ctype), out.ctypes.data)
 
+    rc = getattr(_libcv_algorithms, pairwise_fn)(outptr, aptr, bptr, a.shape[0], b.shape[0], num_threads)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
     return out
 
+
+def pairwise_diff_knn(a, b, k=1, max_distance=None, num_threads=None):
+    """
+    For every element of a, find the k elements of b with the
+    smallest absolute difference |a-b| (k nearest neighbours)
+    without computing the full distance matrix.
+
+    b is sorted once and searched for every element of a,
+    so this needs O((N + M) log M + N k) time and
+    O(M + N k) memory, even for N and M in the millions.
+
+    Parameters
+    ==========
+    a : (N,) numpy array-like
+    b : (M,) numpy array-like
+        a and b must not contain NaN or infinite values.
+    k : int
+        The number of neighbours to find for every element of a
+    max_distance : float or None
+        If given, ignore matches with a distance > max_distance,
+        i.e. only find matches within this threshold.
+    num_threads : int or None
+        The number of threads to use.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+
+    Returns
+    =======
+    (indices, distances) where indices is a (N, k) int64 array
+    of indices into b and distances the (N, k) array of their
+    distances (float32 or float64 like pairwise_diff()),
+    sorted by distance (and index for equal distances).
+    If fewer than k elements match, the remaining
+    indices are -1 and their distances infinity.
+    """
+    a, b = _check_diff_arrays(a, b, "pairwise_diff_knn")
+    num_threads = _resolve_num_threads(num_threads)
+    ctype, _, knn_fn = _pairwise_diff_functions[a.dtype]
+    k = int(k)
+    if k < 1:
+        raise ValueError("k must be >= 1, not {0}".format(k))
+    if max_distance is None:
+        max_distance = np.inf
+    elif not max_distance >= 0:
+        raise ValueError("max_distance must be >= 0, not {0}".format(max_distance))
+
+    indices = np.empty((a.shape[0], k), dtype=np.int64)
+    distances = np.empty((a.shape[0], k), dtype=a.dtype)
+    idxptr = _ffi.cast("int64_t*", indices.ctypes.data)
+    distptr = _ffi.cast("{0}*".format(ctype), distances.ctypes.data)
+    aptr = _ffi.cast("const {0}*".format(ctype), a.ctypes.data)
+    bptr = _ffi.cast("const {0}*".format(ctype), b.ctypes.data)
+    rc = getattr(_libcv_algorithms, knn_fn)(idxptr, distptr, aptr, bptr, a.shape[0], b.shape[0],
+                                           k, max_distance, num_threads)
+    if rc == -2:
+        raise ValueError("a and b must not contain NaN or infinite values")
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return indices, distances
+
 def rgb_distance(img, color):
     """
     Compute the euclidean distance between
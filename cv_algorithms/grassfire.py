@@ -4,16 +4,76 @@
 Thinning algorithms
 """
 import numpy as np
+import enum
 from ._ffi import *
 from ._checks import *
+from .parallel import _resolve_num_threads
 
-__all__ = ["grassfire"]
+__all__ = ["grassfire", "grassfire_update", "grassfire3d", "GrassfireMetric", "GrassfireMethod"]
 
 _ffi.cdef('''
-int grassfire(uint32_t* dst, const uint8_t* mask, int width, int height);
+int grassfire(void* dst, int dtype, const uint8_t* mask,
+              ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+              size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+              int metric, int method, uint32_t max_distance, int check_overflow, size_t num_threads);
+int grassfire_update(uint32_t* dist, const uint8_t* mask,
+              ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+              const int32_t* pixels, size_t num_pixels,
+              size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int metric, size_t* updates);
+int grassfire3d(uint32_t* dst, const uint8_t* volume,
+              size_t width, size_t height, size_t depth, int connectivity, int method, size_t num_threads);
 ''')
 
-def grassfire(img):
+# Supported output dtypes => C code. Keep in sync with GrassfireDtype in grassfire.cpp
+_grassfire_dtypes = {
+    np.dtype(np.uint8): 0,
+    np.dtype(np.uint16): 1,
+    np.dtype(np.uint32): 2,
+    np.dtype(np.float32): 3
+}
+
+# Return code of the C code if a distance doesn't fit into the dtype
+_grassfire_overflow = -4
+
+
+class GrassfireMetric(enum.IntEnum):
+    """
+    Distance metric for grassfire()
+
+    Cityblock:
+        4-connected (L1 / Manhattan) distance
+    Chessboard:
+        8-connected (L∞) distance
+    Euclidean:
+        Exact Euclidean distance
+    """
+    Cityblock = 0
+    Chessboard = 1
+    Euclidean = 2
+
+
+class GrassfireMethod(enum.IntEnum):
+    """
+    How grassfire() computes the transform.
+    Both methods produce identical results.
+
+    TwoPass:
+        Two sequential passes over the image (top-left to bottom-right
+        and back), each pixel depending on its already computed neighbours.
+        Fastest on a single thread.
+    Separable:
+        Independent 1D passes over all columns, then over all rows.
+        These are distributed over num_threads threads, so this scales
+        with the number of CPU cores for very large images.
+        The Euclidean metric always uses this method.
+    """
+    TwoPass = 0
+    Separable = 1
+
+
+def grassfire(img, roi=None, out=None, metric=GrassfireMetric.Cityblock,
+              method=GrassfireMethod.TwoPass, num_threads=None,
+              dtype=None, max_distance=None, saturate=True):
     """
     Perform a grassfire transform on the given binary image.
 
@@ -23,31 +83,221 @@ def grassfire(img):
         A grayscale image that is assumed to be binary
         (every non-zero value is interpreted as 0).
         For example a countour image.
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+    roi : (x, y, width, height) tuple or None
+        If given, only compute the transform inside this region.
+        Pixels outside the region are treated as background,
+        the output outside the region is 0.
+    out : numpy array or None
+        If given, the result is stored in this array
+        (same shape as img, dtype see below) instead of a new array.
+    metric : GrassfireMetric
+        The distance metric. Euclidean distances are exact,
+        not approximated by a chamfer mask.
+    method : GrassfireMethod
+        The algorithm used to compute the transform
+    num_threads : int or None
+        Number of threads for GrassfireMethod.Separable.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+    dtype : numpy dtype or None
+        The output dtype: np.uint8, np.uint16, np.uint32 or np.float32.
+        Compact dtypes reduce the memory (bandwidth) required.
+        Euclidean distances are rounded for integer dtypes.
+        Default: The dtype of out if given, else uint32
+        for Cityblock & Chessboard and float32 for Euclidean.
+    max_distance : int or None
+        If given, distances are not propagated beyond this value,
+        i.e. the result is min(distance, max_distance).
+    saturate : bool
+        What to do if a distance (below max_distance)
+        does not fit into the dtype.
+        If True, it is set to the maximum value of the dtype.
+        If False, a ValueError is raised.
 
     Returns
     =======
-    A uint32-type numpy array of the same dimensions
-    as img, representing the grassfire count.
+    A numpy array of the same dimensions as img,
+    containing the distance of every foreground pixel
+    to the nearest background pixel.
+    Pixels outside the image count as background.
     """
     # Check if image has the correct type
     __check_image_grayscale_2d(img)
-    img = force_c_order_contiguous(img)
     __check_array_uint8(img)
+    img, row_stride, pixel_stride = __strided_2d(img, "grassfire")
+    roi = __check_roi(img, roi)
+    metric = GrassfireMetric(metric)
+    method = GrassfireMethod(method)
+    num_threads = _resolve_num_threads(num_threads)
+    if max_distance is None:
+        max_distance = 0xFFFFFFFF
+    elif max_distance < 0:
+        raise ValueError("max_distance must be >= 0, not {0}".format(max_distance))
+    max_distance = min(int(max_distance), 0xFFFFFFFF)
 
     height, width = img.shape
 
     # Allocate output array
-    # uint32 is used so there is no overflow for large inputs
-    out = np.zeros(img.shape, dtype=np.uint32, order="C")
-    assert not np.isfortran(out)
+    # uint32 is used by default so there is no overflow for large inputs
+    if dtype is None:
+        if out is not None:
+            dtype = out.dtype
+        else:
+            dtype = np.float32 if metric == GrassfireMetric.Euclidean else np.uint32
+    dtype = np.dtype(dtype)
+    if dtype not in _grassfire_dtypes:
+        raise ValueError("grassfire output dtype must be uint8, uint16, uint32 or float32, not {0}".format(dtype))
+    out_given = out is not None
+    out = __check_out_array(out, img.shape, dtype)
+    if out_given and roi != (0, 0, width, height):
+        # The C code only writes to the ROI
+        out.fill(0)
 
     # Extract pointer to binary data
     maskptr = _ffi.cast("uint8_t*", img.ctypes.data)
-    outptr = _ffi.cast("uint32_t*", out.ctypes.data)
+    outptr = _ffi.cast("void*", out.ctypes.data)
 
-    rc = _libcv_algorithms.grassfire(outptr, maskptr, width, height)
+    rc = _libcv_algorithms.grassfire(outptr, _grassfire_dtypes[dtype], maskptr,
+                                     row_stride, pixel_stride, width, height, *roi,
+                                     metric, method, max_distance, not saturate, num_threads)
+    if rc == _grassfire_overflow:
+        raise ValueError("grassfire distance exceeds the range of {0}. Use a larger dtype, max_distance or saturate=True".format(dtype))
     if rc != 0:
         raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
     return out
 
-    
+
+def grassfire_update(img, dist, changed=None, metric=GrassfireMetric.Cityblock):
+    """
+    Incrementally update a grassfire distance map after the mask
+    has been modified (e.g. by painting or erasing a brush stroke),
+    instead of recomputing it using grassfire().
+
+    Only the distances affected by the change are recomputed,
+    so the cost is proportional to the affected area instead of
+    the image size. The result is identical to grassfire(img, metric=metric).
+
+    Parameters
+    ==========
+    img : numpy array-like
+        The modified binary uint8 mask
+    dist : numpy array
+        The uint32 distance map of the previous mask, as computed
+        by grassfire(previous_img, metric=metric) (without roi
+        or max_distance). It is updated in place.
+        The previous mask is not required since background pixels
+        are exactly the pixels with distance 0.
+    changed : (x, y, width, height) tuple, (N, 2) array-like or None
+        Where the mask has been modified: Either a region
+        or a list of (y, x) pixel coordinates (numpy index order).
+        Only these pixels are checked for modifications.
+        None means: Check all pixels.
+    metric : GrassfireMetric
+        Cityblock or Chessboard. Must be the same metric
+        that has been used to compute dist.
+
+    Returns
+    =======
+    The number of distance values that have been updated
+    """
+    # Check if image has the correct type
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    img, row_stride, pixel_stride = __strided_2d(img, "grassfire_update")
+    metric = GrassfireMetric(metric)
+    if metric == GrassfireMetric.Euclidean:
+        raise ValueError("grassfire_update() supports only the Cityblock and Chessboard metrics")
+    if dist is None:
+        raise ValueError("dist must be the distance map of the previous mask")
+    dist = __check_out_array(dist, img.shape, np.uint32, "dist")
+
+    height, width = img.shape
+
+    # Either a region or a list of pixels
+    roi = (0, 0, width, height)
+    pixels = None
+    if changed is not None:
+        changed_arr = np.asarray(changed)
+        if changed_arr.ndim == 1 and changed_arr.shape[0] == 4:
+            roi = __check_roi(img, changed)
+        elif changed_arr.ndim == 2 and changed_arr.shape[1] == 2:
+            pixels = np.ascontiguousarray(changed_arr, dtype=np.int32)
+        else:
+            raise ValueError("changed must be a (x, y, width, height) tuple or a (N, 2) array of (y, x) coordinates")
+
+    # Extract pointer to binary data
+    maskptr = _ffi.cast("uint8_t*", img.ctypes.data)
+    distptr = _ffi.cast("uint32_t*", dist.ctypes.data)
+    if pixels is not None:
+        pixelsptr = _ffi.cast("int32_t*", pixels.ctypes.data)
+        num_pixels = pixels.shape[0]
+    else:
+        pixelsptr = _ffi.NULL
+        num_pixels = 0
+    updates = _ffi.new("size_t*")
+
+    rc = _libcv_algorithms.grassfire_update(distptr, maskptr, row_stride, pixel_stride,
+                                            width, height, pixelsptr, num_pixels,
+                                            *roi, metric, updates)
+    if rc == -2:
+        raise ValueError("changed pixel coordinates are outside the image")
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return int(updates[0])
+
+
+def grassfire3d(volume, connectivity=6, out=None,
+                method=GrassfireMethod.TwoPass, num_threads=None):
+    """
+    Perform a grassfire transform on a binary volume,
+    e.g. a stack of images.
+
+    Parameters
+    ==========
+    volume : numpy array-like
+        A (depth, height, width) uint8 volume that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Non-contiguous volumes are copied.
+    connectivity : int
+        6 (face neighbours, i.e. the 3D city-block distance),
+        18 (face & edge neighbours) or
+        26 (all neighbours, i.e. the 3D chessboard distance)
+    out : numpy array or None
+        If given, the result is stored in this C-contiguous
+        uint32 array (same shape as volume) instead of a new array.
+    method : GrassfireMethod
+        The algorithm used to compute the transform.
+        GrassfireMethod.Separable distributes the planes over
+        num_threads threads. 18-connectivity always uses TwoPass.
+    num_threads : int or None
+        Number of threads for GrassfireMethod.Separable.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+
+    Returns
+    =======
+    A uint32 numpy array of the same dimensions as volume,
+    containing the distance of every foreground voxel
+    to the nearest background voxel.
+    Voxels outside the volume count as background.
+    """
+    __check_volume_3d(volume)
+    __check_array_uint8(volume)
+    volume = force_c_order_contiguous(volume, "grassfire3d")
+    if connectivity not in (6, 18, 26):
+        raise ValueError("connectivity must be 6, 18 or 26, not {0}".format(connectivity))
+    method = GrassfireMethod(method)
+    num_threads = _resolve_num_threads(num_threads)
+
+    depth, height, width = volume.shape
+    out = __check_out_array(out, volume.shape, np.uint32)
+
+    volptr = _ffi.cast("uint8_t*", volume.ctypes.data)
+    outptr = _ffi.cast("uint32_t*", out.ctypes.data)
+
+    rc = _libcv_algorithms.grassfire3d(outptr, volptr, width, height, depth,
+                                       connectivity, method, num_threads)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return out
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hamming distances between packed binary descriptors
+"""
+import numpy as np
+from ._ffi import *
+from ._checks import *
+from .parallel import _resolve_num_threads
+
+__all__ = ["pairwise_hamming", "hamming_knn"]
+
+_ffi.cdef('''
+int pairwise_hamming(uint32_t* dst, const uint8_t* a, const uint8_t* b,
+                     size_t a_rows, size_t b_rows, size_t row_bytes, size_t num_threads);
+int hamming_knn(int64_t* indices, uint32_t* distances,
+                const uint8_t* a, const uint8_t* b, size_t a_rows, size_t b_rows, size_t row_bytes,
+                size_t k, uint32_t max_distance, size_t num_threads);
+''')
+
+_uint32_max = np.iinfo(np.uint32).max
+
+
+def _descriptor_rows(arr, name, function):
+    """
+    Internal: Check a (n, ...) array of descriptors and
+    return it as C-contiguous (n, row_bytes) uint8 array
+    """
+    if arr.ndim != 2:
+        raise ValueError("{0} must be a 2D array with one descriptor per row, not shape {1}".format(
+            name, arr.shape))
+    if arr.dtype not in (np.uint8, np.uint16, np.uint32, np.uint64):
+        raise ValueError("{0} must have dtype uint8, uint16, uint32 or uint64, not {1}".format(
+            name, arr.dtype))
+    arr = force_c_order_contiguous(arr, function)
+    return arr.view(np.uint8).reshape(arr.shape[0], arr.shape[1] * arr.itemsize)
+
+
+def _check_descriptors(a, b, function):
+    """Internal: Check a and b and return them as uint8 row arrays"""
+    a = _descriptor_rows(a, "a", function)
+    b = _descriptor_rows(b, "b", function)
+    if a.shape[1] != b.shape[1]:
+        raise ValueError("Descriptors of a and b must have the same size, not {0} and {1} bytes".format(
+            a.shape[1], b.shape[1]))
+    if a.shape[1] == 0:
+        raise ValueError("Descriptors must not be empty")
+    return a, b
+
+
+def pairwise_hamming(a, b, out=None, num_threads=None):
+    """
+    Compute the Hamming distance, i.e. the number of different bits,
+    between every descriptor in a and every descriptor in b.
+    This is equivalent to popcount(a[:, None] ^ b[None]).sum(axis=2)
+    but never builds the (N, M, bytes) XOR array.
+
+    Uses a cache-blocked, multithreaded C backend with the
+    fastest popcount instructions the CPU supports
+    (see set_cpu_feature_level()).
+
+    For nearest neighbour search, use hamming_knn() which
+    does not store the full distance matrix.
+
+    Parameters
+    ==========
+    a : (N, n) numpy array
+        N packed binary descriptors, e.g. ORB descriptors
+        as returned by OpenCV (n = 32 uint8 columns).
+        Must have dtype uint8, uint16, uint32 or uint64.
+    b : (M, n) numpy array
+        M descriptors of the same size and dtype as a
+    out : numpy array or None
+        If given, the result is stored in this (N, M) uint32
+        array instead of a new array.
+    num_threads : int or None
+        The number of threads to use.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+
+    Returns
+    =======
+    A (N, M) uint32 numpy array of distances
+    """
+    a, b = _check_descriptors(a, b, "pairwise_hamming")
+    num_threads = _resolve_num_threads(num_threads)
+    out = __check_out_array(out, (a.shape[0], b.shape[0]), np.uint32)
+
+    dstptr = _ffi.cast("uint32_t*", out.ctypes.data)
+    aptr = _ffi.cast("const uint8_t*", a.ctypes.data)
+    bptr = _ffi.cast("const uint8_t*", b.ctypes.data)
+    rc = _libcv_algorithms.pairwise_hamming(dstptr, aptr, bptr, a.shape[0], b.shape[0],
+                                            a.shape[1], num_threads)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return out
+
+
+def hamming_knn(a, b, k=1, max_distance=None, num_threads=None):
+    """
+    For every descriptor in a, find the k descriptors in b with
+    the smallest Hamming distance (k nearest neighbours)
+    without computing the full distance matrix, so the memory
+    usage is independent of the size of b.
+
+    Parameters
+    ==========
+    a : (N, n) numpy array
+        N packed binary descriptors, e.g. ORB descriptors
+        as returned by OpenCV (n = 32 uint8 columns).
+        Must have dtype uint8, uint16, uint32 or uint64.
+    b : (M, n) numpy array
+        M descriptors of the same size and dtype as a
+    k : int
+        The number of neighbours to find for every descriptor in a
+    max_distance : int or None
+        If given, ignore matches with a distance > max_distance,
+        e.g. to find duplicates or for ratio-free matching.
+    num_threads : int or None
+        The number of threads to use.
+        None means the default set by set_num_threads(),
+        0 means all CPU cores.
+
+    Returns
+    =======
+    (indices, distances) where indices is a (N, k) int64 array
+    of indices into b and distances the (N, k) uint32 array of
+    their distances, sorted by distance (and index for equal distances).
+    If fewer than k descriptors match, the remaining
+    indices are -1 and their distances 2**32 - 1.
+    """
+    a, b = _check_descriptors(a, b, "hamming_knn")
+    num_threads = _resolve_num_threads(num_threads)
+    k = int(k)
+    if k < 1:
+        raise ValueError("k must be >= 1, not {0}".format(k))
+    if max_distance is None:
+        max_distance = _uint32_max
+    elif max_distance < 0:
+        raise ValueError("max_distance must be >= 0, not {0}".format(max_distance))
+    max_distance = min(int(max_distance), _uint32_max)
+
+    indices = np.empty((a.shape[0], k), dtype=np.int64)
+    distances = np.empty((a.shape[0], k), dtype=np.uint32)
+    idxptr = _ffi.cast("int64_t*", indices.ctypes.data)
+    distptr = _ffi.cast("uint32_t*", distances.ctypes.data)
+    aptr = _ffi.cast("const uint8_t*", a.ctypes.data)
+    bptr = _ffi.cast("const uint8_t*", b.ctypes.data)
+    rc = _libcv_algorithms.hamming_knn(idxptr, distptr, aptr, bptr, a.shape[0], b.shape[0],
+                                       a.shape[1], k, max_distance, num_threads)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return indices, distances
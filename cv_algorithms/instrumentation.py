@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the native algorithm wrappers
+"""
+
+__all__ = ["input_copies", "reset_input_copies"]
+
+# function name => {"count": ..., "nbytes": ...}
+_input_copies = {}
+
+
+def _record_input_copy(function, arr):
+    """Internal: Record that arr had to be copied before calling the C code"""
+    entry = _input_copies.setdefault(function or "unknown", {"count": 0, "nbytes": 0})
+    entry["count"] += 1
+    entry["nbytes"] += arr.nbytes
+
+
+def input_copies():
+    """
+    Report which functions had to copy their input arrays
+    before calling the C code.
+
+    Most functions work directly on strided views such as
+    img[:, 100:900] or the channels returned by extract_channel().
+    Arrays whose strides are not a multiple of the element size,
+    unaligned arrays and in-place thinning of non-contiguous views
+    still require a contiguous copy.
+
+    Returns
+    =======
+    A dict mapping the function name to a dict containing
+    the number of copies ("count") and the total number
+    of bytes copied ("nbytes").
+    """
+    return {function: dict(entry) for function, entry in _input_copies.items()}
+
+
+def reset_input_copies():
+    """Reset the statistics reported by input_copies()"""
+    _input_copies.clear()
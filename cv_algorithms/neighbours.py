@@ -6,15 +6,30 @@ Thinning algorithms
 import numpy as np
 from ._ffi import *
 from ._checks import *
+from .popcount import popcount
 import enum
 
-__all__ = ["binary_neighbours", "Neighbours", "Direction"]
+__all__ = ["binary_neighbours", "binary_neighbours_histogram", "binary_neighbours_match",
+           "Neighbours", "Direction"]
 
 _ffi.cdef('''
-int binary_neighbours(uint8_t* dst, const uint8_t* src, int width, int height);
+int binary_neighbours(uint8_t* dst, const uint8_t* src,
+                      ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+                      size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height);
+int binary_neighbours_reference(uint8_t* dst, const uint8_t* src,
+                      ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+                      size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height);
+int binary_neighbours_histogram(uint64_t* hist, const uint8_t* src,
+                      ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+                      size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int foreground_only);
+int binary_neighbours_match(size_t* count, int32_t** coords, const uint8_t* src,
+                      ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+                      size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+                      const uint8_t* codes, int foreground_only);
+void binary_neighbours_match_free(int32_t* coords);
 ''')
 
-def binary_neighbours(img):
+def binary_neighbours(img, roi=None, out=None, chunk_size=None):
     """
     Takes a binary image and, for each pixel, computes
     which surrounding pixels are non-zero.
@@ -27,6 +42,20 @@ def binary_neighbours(img):
         A grayscale image that is assumed to be binary
         (every non-zero value is interpreted as 0).
         Usually this is a pre-thinned image.
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+    roi : (x, y, width, height) tuple or None
+        If given, only compute the result for the pixels inside
+        this region. Neighbours outside the region are still
+        taken into account, the output outside the region is 0.
+    out : numpy array or None
+        If given, the result is stored in this uint8 array
+        of the same shape as img instead of a new array.
+    chunk_size : int or None
+        Process bands of rows of at most this many bytes at a time.
+        After every band, an np.memmap-backed out array is flushed,
+        so huge memory-mapped images can be processed without
+        accumulating them in RAM. None means 64 MiB bands if img
+        or out is an np.memmap, 0 disables chunking.
 
     Returns
     =======
@@ -53,26 +82,214 @@ def binary_neighbours(img):
     The positions in this matrix correspond to the bit number
     shown above, e.g. bit #4 is (1 << 4) ORed to the result.
     """
+    return __run_binary_neighbours(img, roi, out, chunk_size, _libcv_algorithms.binary_neighbours)
+
+
+def _binary_neighbours_reference(img, roi=None, out=None):
+    """
+    Like binary_neighbours(), but using the simple per-pixel
+    C implementation instead of the vectorized one.
+    Only used to verify the vectorized implementation.
+    """
+    return __run_binary_neighbours(img, roi, out, 0, _libcv_algorithms.binary_neighbours_reference)
+
+
+def __neighbours_bands(img, roi, chunk_size, function):
+    """
+    Internal: Split the ROI into bands of rows of at most chunk_size bytes
+    (0: one band) for the binary_neighbours() family.
+    Yields (band, row_stride, pixel_stride, band_roi, top) where band is the
+    part of img including the neighbouring rows, prepared using __strided_2d(),
+    band_roi the ROI relative to the band and top the first row of the band.
+    The pages of np.memmap-backed bands are released after processing.
+    """
+    x, y, w, h = roi
+    height = img.shape[0]
+    step = __chunk_rows(chunk_size, h, (w + 2) * img.itemsize)
+    for y0 in range(y, y + max(h, 1), step):
+        y1 = min(y0 + step, y + h)
+        top, bottom = max(0, y0 - 1), min(height, y1 + 1)
+        band, row_stride, pixel_stride = __strided_2d(img[top:bottom], function)
+        yield band, row_stride, pixel_stride, (x, y0 - top, w, y1 - y0), top
+        if chunk_size:
+            __release_chunk(img, img[top:bottom])
+
+
+def __run_binary_neighbours(img, roi, out, chunk_size, function):
+    """Internal common binary_neighbours() function"""
     # Check if image has the correct type
     __check_image_grayscale_2d(img)
-    img = force_c_order_contiguous(img)
     __check_array_uint8(img)
+    roi = __check_roi(img, roi)
+    chunk_size = __resolve_chunk_size(chunk_size, img, out)
 
     height, width = img.shape
 
     # Allocate output array
-    # uint32 is used so there is no overflow for large inputs
-    out = np.zeros(img.shape, dtype=np.uint8, order="C")
-    assert not np.isfortran(out)
+    out_given = out is not None
+    out = __check_out_array(out, img.shape, np.uint8)
+    if out_given and roi != (0, 0, width, height):
+        # The C code only writes to the ROI
+        out.fill(0)
+
+    for band, row_stride, pixel_stride, band_roi, top in __neighbours_bands(
+            img, roi, chunk_size, "binary_neighbours"):
+        # Extract pointer to binary data
+        srcptr = _ffi.cast("uint8_t*", band.ctypes.data)
+        dstptr = _ffi.cast("uint8_t*", out[top:].ctypes.data)
+        rc = function(dstptr, srcptr, row_stride, pixel_stride, band.shape[1], band.shape[0], *band_roi)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        if chunk_size:
+            __release_chunk(out, out[top:top + band.shape[0]], written=True)
+    return out
+
+
+def binary_neighbours_histogram(img, roi=None, foreground_only=False, chunk_size=None):
+    """
+    Count how many pixels have each of the 256 binary_neighbours() codes.
+
+    This is equivalent to np.bincount(binary_neighbours(img).ravel(), minlength=256),
+    but the codes are computed and counted row by row, so no
+    full-size array is allocated.
+
+    Parameters
+    ==========
+    img : numpy array-like
+        A grayscale image that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+    roi : (x, y, width, height) tuple or None
+        If given, only count the pixels inside this region.
+        Neighbours outside the region are still taken into account.
+    foreground_only : bool
+        If True, only foreground pixels are counted.
+    chunk_size : int or None
+        Process bands of rows of at most this many bytes at a time.
+        None means 64 MiB bands if img is an np.memmap,
+        0 disables chunking.
+
+    Returns
+    =======
+    A (256,) uint64 numpy array, entry i being the number of pixels with code i
+    """
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    roi = __check_roi(img, roi)
+    chunk_size = __resolve_chunk_size(chunk_size, img)
+
+    hist = np.zeros(256, dtype=np.uint64)
+    band_hist = np.empty(256, dtype=np.uint64)
+    histptr = _ffi.cast("uint64_t*", band_hist.ctypes.data)
+    for band, row_stride, pixel_stride, band_roi, _ in __neighbours_bands(
+            img, roi, chunk_size, "binary_neighbours_histogram"):
+        srcptr = _ffi.cast("uint8_t*", band.ctypes.data)
+        rc = _libcv_algorithms.binary_neighbours_histogram(histptr, srcptr, row_stride, pixel_stride,
+                                                             band.shape[1], band.shape[0], *band_roi,
+                                                             foreground_only)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        hist += band_hist
+    return hist
+
+
+def binary_neighbours_match(img, codes, roi=None, foreground_only=True, return_coords=False,
+                            chunk_size=None):
+    """
+    Count the pixels whose binary_neighbours() code is one of the given codes,
+    e.g. to count the endpoints of a skeleton.
+
+    This is equivalent to np.isin(binary_neighbours(img), codes) & (img != 0),
+    but the codes are computed and matched row by row, so no
+    full-size array is allocated.
+
+    Parameters
+    ==========
+    img : numpy array-like
+        A grayscale image that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+    codes : iterable of int or (256,) bool array
+        The codes to match: Either a list of codes (0-255)
+        or a lookup table, entry i being True if code i matches.
+    roi : (x, y, width, height) tuple or None
+        If given, only match the pixels inside this region.
+        Neighbours outside the region are still taken into account.
+    foreground_only : bool
+        If True, only foreground pixels can match.
+    return_coords : bool
+        If True, also return the coordinates of the matching pixels.
+    chunk_size : int or None
+        Process bands of rows of at most this many bytes at a time.
+        None means 64 MiB bands if img is an np.memmap,
+        0 disables chunking.
 
-    # Extract pointer to binary data
-    srcptr = _ffi.cast("uint8_t*", img.ctypes.data)
-    dstptr = _ffi.cast("uint8_t*", out.ctypes.data)
+    Returns
+    =======
+    The number of matching pixels.
+    If return_coords is True, a (count, coords) tuple where coords
+    is a (count, 2) int32 array of (y, x) coordinates in raster order.
+    """
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    roi = __check_roi(img, roi)
+    chunk_size = __resolve_chunk_size(chunk_size, img)
 
-    rc = _libcv_algorithms.binary_neighbours(dstptr, srcptr, width, height)
+    codes = np.asarray(codes)
+    if codes.dtype == bool:
+        if codes.shape != (256,):
+            raise ValueError("A code lookup table must have 256 entries, not {0}".format(codes.shape))
+        table = codes.astype(np.uint8)
+    else:
+        codes = codes.ravel()
+        if codes.size and (codes.min() < 0 or codes.max() > 255):
+            raise ValueError("Codes must be in the range 0-255")
+        table = np.zeros(256, dtype=np.uint8)
+        table[codes.astype(np.intp)] = 1
+
+    tableptr = _ffi.cast("uint8_t*", table.ctypes.data)
+    total = 0
+    band_coords = []
+    for band, row_stride, pixel_stride, band_roi, top in __neighbours_bands(
+            img, roi, chunk_size, "binary_neighbours_match"):
+        count, coords = __match_band(band, row_stride, pixel_stride, band_roi,
+                                     tableptr, foreground_only, return_coords)
+        total += count
+        if return_coords:
+            coords[:, 0] += top
+            band_coords.append(coords)
+    if not return_coords:
+        return total
+    if len(band_coords) == 1:
+        return total, band_coords[0]
+    return total, np.concatenate(band_coords) if band_coords else np.zeros((0, 2), dtype=np.int32)
+
+
+def __match_band(band, row_stride, pixel_stride, band_roi, tableptr, foreground_only, return_coords):
+    """Internal: binary_neighbours_match() of one band. Returns (count, coords or None)"""
+    srcptr = _ffi.cast("uint8_t*", band.ctypes.data)
+    count = _ffi.new("size_t*")
+    coordsptr = _ffi.new("int32_t**") if return_coords else _ffi.NULL
+
+    rc = _libcv_algorithms.binary_neighbours_match(count, coordsptr, srcptr, row_stride, pixel_stride,
+                                                     band.shape[1], band.shape[0], *band_roi,
+                                                     tableptr, foreground_only)
     if rc != 0:
         raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
-    return out
+    count = int(count[0])
+    if not return_coords:
+        return count, None
+    # Copy the coordinates from the C-allocated memory
+    try:
+        if count == 0:
+            coords = np.zeros((0, 2), dtype=np.int32)
+        else:
+            buf = _ffi.buffer(coordsptr[0], 2 * count * _ffi.sizeof("int32_t"))
+            coords = np.frombuffer(buf, dtype=np.int32).reshape(-1, 2).copy()
+    finally:
+        _libcv_algorithms.binary_neighbours_match_free(coordsptr[0])
+    return count, coords
+
 
 class Direction(enum.IntEnum):
     """
@@ -136,6 +353,25 @@ class Direction(enum.IntEnum):
             return [Direction.from_unicode(c) for c in s]
 
 
+# Direction => binary_neighbours() bit
+_direction_bits = {direction: 1 << (direction - 1) for direction in Direction}
+
+# Direction => (dy, dx) in numpy index order
+_direction_offsets = {
+    Direction.NorthWest: (-1, -1),
+    Direction.North: (-1, 0),
+    Direction.NorthEast: (-1, 1),
+    Direction.West: (0, -1),
+    Direction.East: (0, 1),
+    Direction.SouthWest: (1, -1),
+    Direction.South: (1, 0),
+    Direction.SouthEast: (1, 1)
+}
+
+# Row (direction - 1) is the (dy, dx) offset of direction
+_direction_offset_array = np.array([_direction_offsets[direction] for direction in Direction], dtype=np.intp)
+
+
 class Neighbours():
     """
     *is_xxx():*
@@ -145,6 +381,9 @@ class Neighbours():
     *xxx_coords():*
     Get the numpy coordinate for the pixel in the given
     direction of the given coordinate
+
+    *xxx_array(), direction_masks(), count_directions():*
+    Counterparts operating on whole arrays at once
     """
     @staticmethod
     def is_northwest(pixel): return bool(pixel & (1 << 0))
@@ -165,16 +404,7 @@ class Neighbours():
 
     @staticmethod
     def is_direction(direction, pixel):
-        return {
-            Direction.NorthEast: Neighbours.is_northeast,
-            Direction.North: Neighbours.is_north,
-            Direction.East: Neighbours.is_east,
-            Direction.NorthWest: Neighbours.is_northwest,
-            Direction.SouthEast: Neighbours.is_southeast,
-            Direction.South: Neighbours.is_south,
-            Direction.West: Neighbours.is_west,
-            Direction.SouthWest: Neighbours.is_southwest
-        }[direction](pixel)
+        return bool(pixel & _direction_bits[direction])
 
     @staticmethod
     def northwest_coords(y, x): return (y-1, x-1)
@@ -195,16 +425,8 @@ class Neighbours():
 
     @staticmethod
     def coords(direction, y, x):
-        return {
-            Direction.NorthEast: Neighbours.northeast_coords,
-            Direction.North: Neighbours.north_coords,
-            Direction.East: Neighbours.east_coords,
-            Direction.NorthWest: Neighbours.northwest_coords,
-            Direction.SouthEast: Neighbours.southeast_coords,
-            Direction.South: Neighbours.south_coords,
-            Direction.West: Neighbours.west_coords,
-            Direction.SouthWest: Neighbours.southwest_coords
-        }[direction](y, x)
+        dy, dx = _direction_offsets[direction]
+        return (y + dy, x + dx)
 
     @staticmethod
     def iterate_directions(dirs):
@@ -220,3 +442,65 @@ class Neighbours():
         return (direction for direction in Direction
             if Neighbours.is_direction(direction, dirs))
     
+
+    @staticmethod
+    def is_direction_array(direction, neighbours):
+        """
+        Array counterpart of is_direction():
+        A bool array of the same shape as neighbours (the result
+        of binary_neighbours()) which is True where the pixel
+        has a marked neighbour in the given direction.
+        """
+        return (np.asarray(neighbours) & _direction_bits[Direction(direction)]) != 0
+
+    @staticmethod
+    def direction_masks(neighbours):
+        """
+        Array counterpart of iterate_directions():
+        A bool array of shape neighbours.shape + (8,).
+        [..., direction - 1] is True where the pixel has a marked
+        neighbour in the given direction, i.e. the last axis
+        is in the same order as the Direction enum.
+        """
+        neighbours = np.asarray(neighbours, dtype=np.uint8)
+        bits = np.unpackbits(neighbours[..., np.newaxis], axis=-1, bitorder="little")
+        return bits.view(bool)
+
+    @staticmethod
+    def count_directions(neighbours):
+        """
+        The number of marked neighbours of every pixel
+        of the result of binary_neighbours(), as a uint8 array.
+        """
+        return popcount(np.asarray(neighbours, dtype=np.uint8))
+
+    @staticmethod
+    def coords_array(direction, coords):
+        """
+        Array counterpart of coords():
+        Get the numpy coordinates of the pixels next to many pixels at once.
+
+        Parameters
+        ==========
+        direction : Direction or array-like of Direction
+            Either a single direction for all pixels
+            or one direction per pixel (shape (N,)).
+        coords : (N, 2) array-like
+            The (y, x) coordinates of the pixels
+
+        Returns
+        =======
+        A (N, 2) integer array of the (y, x) coordinates of the
+        pixels in the given direction(s)
+        """
+        coords = np.asarray(coords)
+        if coords.ndim != 2 or coords.shape[1] != 2:
+            raise ValueError("coords must be a (N, 2) array of (y, x) coordinates")
+        direction = np.asarray(direction)
+        if direction.ndim == 0:
+            return coords + _direction_offset_array[Direction(int(direction)) - 1]
+        if direction.shape != coords.shape[:1]:
+            raise ValueError("direction must be a single Direction or one Direction per pixel")
+        if direction.size and (direction.min() < Direction.NorthWest or direction.max() > Direction.SouthEast):
+            raise ValueError("Invalid direction in {0}".format(direction))
+        return coords + _direction_offset_array[direction.astype(np.intp) - 1]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bit-packed (1 bit per pixel) binary images
+"""
+import numpy as np
+from ._ffi import *
+from ._checks import *
+
+__all__ = ["PackedBinary"]
+
+_ffi.cdef('''
+int pack_binary(uint64_t* dst, const uint8_t* src, size_t words_per_row, size_t width, size_t height);
+int pack_binary_strided(uint64_t* dst, const uint8_t* src,
+                        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride,
+                        size_t words_per_row, size_t width, size_t height);
+int unpack_binary(uint8_t* dst, const uint64_t* src, size_t words_per_row, size_t width, size_t height, uint8_t value);
+int apply_packed_binary_mask(uint8_t* img, const uint64_t* mask, size_t words_per_row, size_t width, size_t height);
+''')
+
+
+def _pack_binary_data(img):
+    """Internal: Pack a uint8 image, returning the packed uint64 array"""
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    img, row_stride, pixel_stride = __strided_2d(img, "PackedBinary.pack")
+
+    height, width = img.shape
+    words = (width + 63) // 64
+    data = np.empty((height, words), dtype=np.uint64)
+
+    srcptr = _ffi.cast("uint8_t*", img.ctypes.data)
+    dstptr = _ffi.cast("uint64_t*", data.ctypes.data)
+    rc = _libcv_algorithms.pack_binary_strided(dstptr, srcptr, row_stride, pixel_stride,
+                                                 words, width, height)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return data
+
+
+class PackedBinary(object):
+    """
+    A binary image stored with 1 bit per pixel,
+    i.e. 8x less memory than a uint8 image.
+
+    Pixel [y, x] is stored in bit (x % 64) of data[y, x // 64].
+    Unused bits at the end of each row are always zero.
+
+    Functions such as guo_hall() and zhang_suen() directly
+    operate on PackedBinary instances.
+    """
+    def __init__(self, data, width):
+        """
+        Wrap an existing (height, ceil(width / 64)) uint64 array.
+        Usually you want to use PackedBinary.pack() instead.
+        Raises ValueError if any unused bit at the end of a row is set.
+        """
+        if data.dtype != np.uint64 or len(data.shape) != 2:
+            raise ValueError("PackedBinary data must be a 2D uint64 array")
+        if data.shape[1] != (width + 63) // 64:
+            raise ValueError("PackedBinary data has {0} words per row but width {1} requires {2}".format(
+                data.shape[1], width, (width + 63) // 64))
+        if width % 64 != 0 and data.size != 0:
+            padding = ~np.uint64((1 << (width % 64)) - 1)
+            if (data[:, -1] & padding).any():
+                raise ValueError("PackedBinary data has bits set past width {0}".format(width))
+        self.data = force_c_order_contiguous(data, "PackedBinary")
+        self.width = width
+
+    @property
+    def height(self):
+        return self.data.shape[0]
+
+    @property
+    def shape(self):
+        """The (height, width) shape of the unpacked image"""
+        return (self.height, self.width)
+
+    @property
+    def words_per_row(self):
+        return self.data.shape[1]
+
+    @staticmethod
+    def pack(img):
+        """
+        Pack a binary grayscale uint8 image.
+        Every non-zero pixel is interpreted as foreground.
+        """
+        return PackedBinary(_pack_binary_data(img), img.shape[1])
+
+    def unpack(self, value=255):
+        """
+        Unpack to a uint8 image where foreground pixels
+        are set to value and background pixels are set to 0.
+        """
+        out = np.empty(self.shape, dtype=np.uint8)
+        srcptr = _ffi.cast("uint64_t*", self.data.ctypes.data)
+        dstptr = _ffi.cast("uint8_t*", out.ctypes.data)
+        rc = _libcv_algorithms.unpack_binary(dstptr, srcptr, self.words_per_row,
+                                             self.width, self.height, value)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        return out
+
+    def copy(self):
+        return PackedBinary(self.data.copy(), self.width)
+
+    def count_nonzero(self):
+        """Number of foreground pixels"""
+        return int(np.sum(np.unpackbits(self.data.view(np.uint8))))
+
+    def __eq__(self, other):
+        return isinstance(other, PackedBinary) and self.width == other.width \
+            and np.array_equal(self.data, other.data)
+
+    def __repr__(self):
+        return "PackedBinary(height={0}, width={1})".format(self.height, self.width)
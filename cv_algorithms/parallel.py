@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread count configuration for the parallel C backends
+"""
+import os
+
+__all__ = ["get_num_threads", "set_num_threads"]
+
+_default_num_threads = 1
+
+
+def set_num_threads(num_threads):
+    """
+    Set the default number of threads used by the C backend
+    when a function is called with num_threads=None.
+
+    The C backend releases the GIL, so other Python threads
+    keep running while the computation is in progress.
+
+    Parameters
+    ==========
+    num_threads : int
+        The number of threads. 0 means: use all CPU cores.
+        The initial default is 1, i.e. no multithreading.
+    """
+    global _default_num_threads
+    if num_threads < 0:
+        raise ValueError("num_threads must be >= 0, not {0}".format(num_threads))
+    _default_num_threads = int(num_threads)
+
+
+def get_num_threads():
+    """
+    Get the default number of threads used by the C backend.
+    0 means: use all CPU cores. See set_num_threads()
+    """
+    return _default_num_threads
+
+
+def _resolve_num_threads(num_threads):
+    """
+    Resolve a user-supplied num_threads argument (None meaning the default,
+    0 meaning all CPU cores) to the actual number of threads.
+    """
+    if num_threads is None:
+        num_threads = _default_num_threads
+    if num_threads < 0:
+        raise ValueError("num_threads must be >= 0, not {0}".format(num_threads))
+    if num_threads == 0:
+        num_threads = os.cpu_count() or 1
+    return int(num_threads)
@@ -7,16 +7,69 @@ import numpy as np
 from ._ffi import *
 from ._checks import *
 
-__all__ = ["popcount"]
+__all__ = ["popcount", "popcount_sum"]
 
 _ffi.cdef('''
-int popcount8(uint8_t* dst, const uint8_t* src, int size);
-int popcount16(uint8_t* dst, const uint16_t* src, int size);
-int popcount32(uint8_t* dst, const uint32_t* src, int size);
-int popcount64(uint8_t* dst, const uint64_t* src, int size);
+int popcount8(uint8_t* dst, const uint8_t* src, size_t size);
+int popcount16(uint8_t* dst, const uint16_t* src, size_t size);
+int popcount32(uint8_t* dst, const uint32_t* src, size_t size);
+int popcount64(uint8_t* dst, const uint64_t* src, size_t size);
+int popcount8_strided(uint8_t* dst, const uint8_t* src,
+                      size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+int popcount16_strided(uint8_t* dst, const uint16_t* src,
+                       size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+int popcount32_strided(uint8_t* dst, const uint32_t* src,
+                       size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+int popcount64_strided(uint8_t* dst, const uint64_t* src,
+                       size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+int popcount8_reduce(uint64_t* dst, const uint8_t* src,
+                     size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+                     size_t block_rows, size_t block_cols);
+int popcount16_reduce(uint64_t* dst, const uint16_t* src,
+                      size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+                      size_t block_rows, size_t block_cols);
+int popcount32_reduce(uint64_t* dst, const uint32_t* src,
+                      size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+                      size_t block_rows, size_t block_cols);
+int popcount64_reduce(uint64_t* dst, const uint64_t* src,
+                      size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+                      size_t block_rows, size_t block_cols);
 ''')
 
-def popcount(arr):
+_popcount_functions = {
+    np.dtype(np.uint8): ("popcount8", "popcount8_strided", "uint8_t*"),
+    np.dtype(np.uint16): ("popcount16", "popcount16_strided", "uint16_t*"),
+    np.dtype(np.uint32): ("popcount32", "popcount32_strided", "uint32_t*"),
+    np.dtype(np.uint64): ("popcount64", "popcount64_strided", "uint64_t*"),
+}
+
+_popcount_reduce_functions = {
+    np.dtype(np.uint8): ("popcount8_reduce", "uint8_t*"),
+    np.dtype(np.uint16): ("popcount16_reduce", "uint16_t*"),
+    np.dtype(np.uint32): ("popcount32_reduce", "uint32_t*"),
+    np.dtype(np.uint64): ("popcount64_reduce", "uint64_t*"),
+}
+
+
+def _as_rows(arr):
+    """
+    Internal: View an array of any dimension as a 2D array of rows
+    without copying, i.e. merge all but the last axis.
+    Returns None if the axes can't be merged.
+    """
+    if arr.ndim == 0:
+        return arr.reshape(1, 1)
+    # Axes of length 1 don't matter for the memory layout
+    leading = [(n, stride) for n, stride in zip(arr.shape[:-1], arr.strides[:-1]) if n != 1]
+    for (n0, stride0), (n1, stride1) in zip(leading, leading[1:]):
+        if stride0 != stride1 * n1:
+            return None
+    rows = int(np.prod(arr.shape[:-1]))
+    row_stride = leading[-1][1] if leading else 0
+    return np.lib.stride_tricks.as_strided(arr, (rows, arr.shape[-1]), (row_stride, arr.strides[-1]))
+
+
+def popcount(arr, out=None, chunk_size=None):
     """
     Provides a population count implementation.
     The population count is the number of one bits.
@@ -28,7 +81,16 @@ def popcount(arr):
     ==========
     arr : numpy array
         Must have dtype of uint8, uint16, uint32
-        or uint64.
+        or uint64. Strided views are used without copying.
+    out : numpy array or None
+        If given, the result is stored in this uint8 array
+        of the same shape as arr instead of a new array.
+    chunk_size : int or None
+        Process at most this many bytes of arr at a time.
+        After every chunk, an np.memmap-backed out array is flushed,
+        so huge memory-mapped arrays can be processed without
+        accumulating them in RAM. None means 64 MiB chunks if arr
+        or out is an np.memmap, 0 disables chunking.
 
     Returns
     =======
@@ -36,34 +98,159 @@ def popcount(arr):
     containing the pop
     """
     # Check if image has the correct type
-    arr = force_c_order_contiguous(arr)
+    if arr.dtype not in _popcount_functions:
+        raise ValueError("popcount can only work on uint8, uint16, uint32 or uint64 array")
+    contiguous_fn, strided_fn, ctype = _popcount_functions[arr.dtype]
+    chunk_size = __resolve_chunk_size(chunk_size, arr, out)
 
     # Allocate output array
-    # uint32 is used so there is no overflow for large inputs
-    out = np.zeros(arr.shape, dtype=np.uint8, order="C")
-    assert not np.isfortran(out)
+    out = __check_out_array(out, arr.shape, np.uint8)
 
-    # Extract pointer to binary data
+    if arr.size == 0:
+        return out
+    if arr.flags['C_CONTIGUOUS']:
+        # Process the flat arrays in chunks of elements
+        step = __chunk_rows(chunk_size, arr.size, arr.itemsize)
+        for start in range(0, arr.size, step):
+            dst = out.reshape(-1)[start:start + step]
+            src = arr.reshape(-1)[start:start + step]
+            # Extract pointer to binary data
+            dstptr = _ffi.cast("uint8_t*", dst.ctypes.data)
+            srcptr = _ffi.cast(ctype, src.ctypes.data)
+            rc = getattr(_libcv_algorithms, contiguous_fn)(dstptr, srcptr, src.size)
+            if rc != 0:
+                raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+            if step < arr.size:
+                __release_chunk(arr, src)
+                __release_chunk(out, dst, written=True)
+        return out
+    rows = _as_rows(arr)
+    if rows is not None:
+        slices = [(out.reshape(rows.shape), rows)]
+    else: # Process 2D slices one by one
+        slices = [(out[idx], arr[idx]) for idx in np.ndindex(*arr.shape[:-2])]
+    for dst2d, src2d in slices:
+        step = __chunk_rows(chunk_size, src2d.shape[0], src2d.shape[1] * arr.itemsize)
+        for start in range(0, src2d.shape[0], step):
+            rc = _popcount_strided(strided_fn, ctype, dst2d[start:start + step], src2d[start:start + step])
+            if rc != 0:
+                raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+            if step < src2d.shape[0]:
+                __release_chunk(arr, src2d[start:start + step])
+                __release_chunk(out, dst2d[start:start + step], written=True)
+    return out
+
+
+def _popcount_strided(strided_fn, ctype, out, arr):
+    """Internal: popcount of a 2D strided array into the contiguous out array"""
+    arr, row_stride, col_stride = __strided_2d(arr, "popcount")
     dstptr = _ffi.cast("uint8_t*", out.ctypes.data)
+    srcptr = _ffi.cast(ctype, arr.ctypes.data)
+    return getattr(_libcv_algorithms, strided_fn)(dstptr, srcptr, arr.shape[0], arr.shape[1],
+                                                  row_stride, col_stride)
 
-    if arr.dtype == np.uint8:
-        fn = _libcv_algorithms.popcount8
-        srcptr = _ffi.cast("uint8_t*", arr.ctypes.data)
-    elif arr.dtype == np.uint16:
-        fn = _libcv_algorithms.popcount16
-        srcptr = _ffi.cast("uint16_t*", arr.ctypes.data)
-    elif arr.dtype == np.uint32:
-        fn = _libcv_algorithms.popcount32
-        srcptr = _ffi.cast("uint32_t*", arr.ctypes.data)
-    elif arr.dtype == np.uint64:
-        fn = _libcv_algorithms.popcount64
-        srcptr = _ffi.cast("uint64_t*", arr.ctypes.data)
-    else:
+
+def popcount_sum(arr, axis=None, block=None, chunk_size=None):
+    """
+    Sum of the population counts of arr, i.e. the number of one bits,
+    computed without allocating a full-size popcount() result.
+    The counts are accumulated in 64-bit integers.
+
+    Parameters
+    ==========
+    arr : numpy array
+        Must have dtype of uint8, uint16, uint32
+        or uint64. Strided views are used without copying.
+    axis : int or None
+        If None, compute the total over all elements.
+        Else, sum along the given axis like np.sum(popcount(arr), axis=axis).
+    block : (rows, cols) tuple or None
+        If given, compute the sum of every (rows, cols) block of the
+        last two axes. The last row & column of blocks may be smaller.
+        Can't be combined with axis.
+    chunk_size : int or None
+        Process at most this many bytes of arr at a time, so huge
+        np.memmap-backed arrays are streamed in bounded-size blocks.
+        None means 64 MiB chunks if arr is an np.memmap,
+        0 disables chunking.
+
+    Returns
+    =======
+    The total as int if neither axis nor block are given.
+    Else a uint64 numpy array: arr.shape without the given axis, or
+    arr.shape[:-2] + (ceil(height / rows), ceil(width / cols)) for blocks.
+    """
+    if arr.dtype not in _popcount_reduce_functions:
         raise ValueError("popcount can only work on uint8, uint16, uint32 or uint64 array")
+    reduce_fn, ctype = _popcount_reduce_functions[arr.dtype]
+    chunk_size = __resolve_chunk_size(chunk_size, arr)
 
-    rc = fn(dstptr, srcptr, arr.size)
-    if rc != 0:
-        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
-    return out
+    if block is not None:
+        if axis is not None:
+            raise ValueError("axis and block can't be combined")
+        if arr.ndim < 2:
+            raise ValueError("block requires an array with at least 2 dimensions")
+        block_rows, block_cols = (int(n) for n in block)
+        if block_rows < 1 or block_cols < 1:
+            raise ValueError("Block size must be >= 1 but is {0}".format(block))
+        height, width = arr.shape[-2:]
+        out = np.zeros(arr.shape[:-2] + (-(-height // block_rows), -(-width // block_cols)), dtype=np.uint64)
+        if arr.size != 0:
+            for idx in np.ndindex(*arr.shape[:-2]):
+                _popcount_reduce(reduce_fn, ctype, chunk_size, arr, out[idx], arr[idx], block_rows, block_cols)
+        return out
+
+    if axis is None:
+        out = np.zeros((1, 1), dtype=np.uint64)
+        if arr.size != 0:
+            rows = _as_rows(arr)
+            slices = [rows] if rows is not None else [arr[idx] for idx in np.ndindex(*arr.shape[:-2])]
+            for slice2d in slices:
+                _popcount_reduce(reduce_fn, ctype, chunk_size, arr, out, slice2d, *slice2d.shape)
+        return int(out[0, 0])
+
+    if not -arr.ndim <= axis < arr.ndim:
+        raise ValueError("axis {0} is out of bounds for an array with {1} dimensions".format(axis, arr.ndim))
+    axis %= arr.ndim
+    if axis == arr.ndim - 1:
+        # Sum of every row
+        out = np.zeros(arr.shape[:-1], dtype=np.uint64)
+        if arr.size != 0:
+            rows = _as_rows(arr)
+            if rows is not None:
+                _popcount_reduce(reduce_fn, ctype, chunk_size, arr, out.reshape(-1, 1), rows, 1, rows.shape[1])
+            else:
+                for idx in np.ndindex(*arr.shape[:-2]):
+                    _popcount_reduce(reduce_fn, ctype, chunk_size, arr, out[idx].reshape(-1, 1), arr[idx], 1, arr.shape[-1])
+    else:
+        # Sum of every column of the 2D slices with the axis as rows
+        moved = np.moveaxis(arr, axis, -2)
+        out = np.zeros(moved.shape[:-2] + moved.shape[-1:], dtype=np.uint64)
+        if arr.size != 0:
+            for idx in np.ndindex(*moved.shape[:-2]):
+                _popcount_reduce(reduce_fn, ctype, chunk_size, arr, out[idx].reshape(1, -1), moved[idx], moved.shape[-2], 1)
+    return out[()] if out.ndim == 0 else out
 
-    
+
+def _popcount_reduce(reduce_fn, ctype, chunk_size, source, out, arr, block_rows, block_cols):
+    """
+    Internal: Add the block popcounts of a 2D strided array (a view of source)
+    to the contiguous out array, processing chunk_size bytes at a time (0: all at once)
+    """
+    rows = arr.shape[0]
+    step = __chunk_rows(chunk_size, rows, arr.shape[1] * arr.itemsize)
+    if step < rows and block_rows < rows:
+        # Chunks must consist of whole blocks
+        step = max(block_rows, step - step % block_rows)
+    for start in range(0, rows, step):
+        chunk, row_stride, col_stride = __strided_2d(arr[start:start + step], "popcount_sum")
+        # Chunks start at a block boundary unless there is only one row of blocks
+        dst = out[start // block_rows:]
+        dstptr = _ffi.cast("uint64_t*", dst.ctypes.data)
+        srcptr = _ffi.cast(ctype, chunk.ctypes.data)
+        rc = getattr(_libcv_algorithms, reduce_fn)(dstptr, srcptr, chunk.shape[0], chunk.shape[1],
+                                                   row_stride, col_stride, block_rows, block_cols)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        if step < rows:
+            __release_chunk(source, arr[start:start + step])
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Skeleton graph extraction
+"""
+import numpy as np
+import enum
+from ._ffi import *
+from ._checks import *
+from .neighbours import Direction
+from .chaincode import chain_encode, ChainCodeFormat
+
+__all__ = ["skeleton_graph", "SkeletonGraph", "SkeletonNodeType",
+           "skeleton_points", "SkeletonPoints", "SkeletonPixelType"]
+
+_ffi.cdef('''
+typedef struct {
+    size_t num_nodes;
+    int32_t* node_coords;
+    uint8_t* node_types;
+    size_t num_edges;
+    int32_t* edge_nodes;
+    size_t* edge_offsets;
+    size_t* edge_lengths;
+    size_t num_coords;
+    int32_t* edge_coords;
+} skeleton_graph_t;
+int skeleton_graph(skeleton_graph_t* graph, const uint8_t* img,
+                   ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height);
+void skeleton_graph_free(skeleton_graph_t* graph);
+typedef struct {
+    size_t counts[4];
+    int32_t* coords[4];
+} skeleton_points_t;
+int skeleton_points(skeleton_points_t* points, const uint8_t* img,
+                    ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height,
+                    int include_lines);
+void skeleton_points_free(skeleton_points_t* points);
+''')
+
+
+class SkeletonNodeType(enum.IntEnum):
+    """
+    Node types of a SkeletonGraph
+
+    Isolated:
+        A single pixel without any neighbours
+    Endpoint:
+        The end of a line (exactly one connected run of neighbours)
+    Junction:
+        A point where three or more lines meet.
+        Adjacent junction pixels are merged into one node.
+    """
+    Isolated = 0
+    Endpoint = 1
+    Junction = 2
+
+
+class SkeletonPixelType(enum.IntEnum):
+    """
+    Pixel types computed by skeleton_points().
+    The node types have the same values as in SkeletonNodeType.
+
+    Isolated:
+        A single pixel without any neighbours
+    Endpoint:
+        The end of a line (exactly one connected run of neighbours)
+    Junction:
+        A pixel where three or more lines meet
+        (three or more separate runs of neighbours)
+    Line:
+        Any other pixel, i.e. exactly two separate runs of neighbours
+    """
+    Isolated = 0
+    Endpoint = 1
+    Junction = 2
+    Line = 3
+
+
+# (dy, dx) of the step from one pixel to the next => Direction
+_step_directions = {
+    (-1, -1): Direction.NorthWest,
+    (-1, 0): Direction.North,
+    (-1, 1): Direction.NorthEast,
+    (0, -1): Direction.West,
+    (0, 1): Direction.East,
+    (1, -1): Direction.SouthWest,
+    (1, 0): Direction.South,
+    (1, 1): Direction.SouthEast
+}
+
+
+class SkeletonGraph(object):
+    """
+    Graph of a skeleton as computed by skeleton_graph().
+    All coordinates are (y, x) i.e. numpy index order.
+
+    Attributes
+    ==========
+    nodes : (N, 2) int32 numpy array
+        The coordinates of the nodes.
+        For junctions, this is the first pixel of the junction
+        in raster order.
+    node_types : (N,) uint8 numpy array
+        The SkeletonNodeType of each node
+    edges : (E, 2) int32 numpy array
+        The start and end node index of each edge.
+        -1 if the edge has no start or end node,
+        i.e. for closed loops.
+    edge_coords : (M, 2) int32 numpy array
+        The coordinates of all edges, concatenated.
+        Every edge starts and ends with the node pixels
+        it is attached to.
+    edge_offsets : (E,) numpy array
+        Index of the first coordinate of each edge in edge_coords
+    edge_lengths : (E,) numpy array
+        Number of coordinates of each edge
+    """
+    def __init__(self, nodes, node_types, edges, edge_coords, edge_offsets, edge_lengths):
+        self.nodes = nodes
+        self.node_types = node_types
+        self.edges = edges
+        self.edge_coords = edge_coords
+        self.edge_offsets = edge_offsets
+        self.edge_lengths = edge_lengths
+
+    @property
+    def endpoints(self):
+        """(n, 2) coordinates of all endpoint nodes"""
+        return self.nodes[self.node_types == SkeletonNodeType.Endpoint]
+
+    @property
+    def junctions(self):
+        """(n, 2) coordinates of all junction nodes"""
+        return self.nodes[self.node_types == SkeletonNodeType.Junction]
+
+    @property
+    def num_edges(self):
+        return self.edges.shape[0]
+
+    def edge(self, i):
+        """(n, 2) coordinates of the i-th edge"""
+        start = self.edge_offsets[i]
+        return self.edge_coords[start:start + self.edge_lengths[i]]
+
+    def edge_directions(self, i):
+        """
+        List of the Direction of every step along the i-th edge
+        """
+        steps = np.diff(self.edge(i), axis=0)
+        return [_step_directions[(dy, dx)] for dy, dx in steps.tolist()]
+
+    def edge_chain_code(self, i, format=ChainCodeFormat.RunLength):
+        """
+        The i-th edge as compact ChainCode
+        """
+        return chain_encode(self.edge(i), format)
+
+    def __repr__(self):
+        return "SkeletonGraph(nodes={0}, edges={1})".format(self.nodes.shape[0], self.num_edges)
+
+
+def skeleton_graph(img):
+    """
+    Extract the graph of a skeleton, i.e. a thinned binary image
+    as computed by guo_hall() or zhang_suen().
+
+    Endpoints, junctions and isolated pixels become nodes,
+    the lines between them become edges. Closed loops that
+    do not touch any node become edges without start & end node.
+    If a line runs into another line where no pixel is classified as
+    junction, e.g. at diagonal junction triangles, a junction node
+    is added at that pixel.
+
+    This is much faster than walking the skeleton in Python
+    using binary_neighbours() and Neighbours.
+
+    Parameters
+    ==========
+    img : numpy array-like
+        A grayscale image that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+
+    Returns
+    =======
+    A SkeletonGraph instance
+    """
+    # Check if image has the correct type
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    img, row_stride, pixel_stride = __strided_2d(img, "skeleton_graph")
+
+    height, width = img.shape
+
+    graph = _ffi.new("skeleton_graph_t*")
+    srcptr = _ffi.cast("uint8_t*", img.ctypes.data)
+    try:
+        rc = _libcv_algorithms.skeleton_graph(graph, srcptr, row_stride, pixel_stride,
+                                                 width, height)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        # Copy the results from the C-allocated memory
+        def to_array(ptr, count, ctype, dtype):
+            buf = _ffi.buffer(ptr, count * _ffi.sizeof(ctype))
+            return np.frombuffer(buf, dtype=dtype).copy()
+        nodes = to_array(graph.node_coords, 2 * graph.num_nodes, "int32_t", np.int32).reshape(-1, 2)
+        node_types = to_array(graph.node_types, graph.num_nodes, "uint8_t", np.uint8)
+        edges = to_array(graph.edge_nodes, 2 * graph.num_edges, "int32_t", np.int32).reshape(-1, 2)
+        edge_offsets = to_array(graph.edge_offsets, graph.num_edges, "size_t", np.uintp)
+        edge_lengths = to_array(graph.edge_lengths, graph.num_edges, "size_t", np.uintp)
+        edge_coords = to_array(graph.edge_coords, 2 * graph.num_coords, "int32_t", np.int32).reshape(-1, 2)
+    finally:
+        _libcv_algorithms.skeleton_graph_free(graph)
+    return SkeletonGraph(nodes, node_types, edges, edge_coords, edge_offsets, edge_lengths)
+
+
+class SkeletonPoints(object):
+    """
+    Skeleton pixels classified by skeleton_points().
+    All coordinates are (n, 2) int32 numpy arrays of (y, x)
+    i.e. numpy index order, in raster order.
+
+    Attributes
+    ==========
+    isolated : numpy array
+        Coordinates of the isolated pixels
+    endpoints : numpy array
+        Coordinates of the endpoints
+    junctions : numpy array
+        Coordinates of the junction pixels. Unlike skeleton_graph(),
+        adjacent junction pixels are not merged.
+    lines : numpy array or None
+        Coordinates of the line pixels if computed
+        using include_lines=True, else None
+    num_lines : int
+        Number of line pixels
+    """
+    def __init__(self, isolated, endpoints, junctions, lines, num_lines):
+        self.isolated = isolated
+        self.endpoints = endpoints
+        self.junctions = junctions
+        self.lines = lines
+        self.num_lines = num_lines
+
+    def __getitem__(self, pixel_type):
+        """Coordinates of the pixels of the given SkeletonPixelType"""
+        return {
+            SkeletonPixelType.Isolated: self.isolated,
+            SkeletonPixelType.Endpoint: self.endpoints,
+            SkeletonPixelType.Junction: self.junctions,
+            SkeletonPixelType.Line: self.lines
+        }[SkeletonPixelType(pixel_type)]
+
+    def __repr__(self):
+        return "SkeletonPoints(isolated={0}, endpoints={1}, junctions={2}, lines={3})".format(
+            self.isolated.shape[0], self.endpoints.shape[0], self.junctions.shape[0], self.num_lines)
+
+
+def skeleton_points(img, include_lines=False):
+    """
+    Classify every foreground pixel of a skeleton, i.e. a thinned
+    binary image as computed by guo_hall() or zhang_suen(),
+    as isolated pixel, endpoint, junction or line pixel
+    in a single pass.
+
+    Pixels are classified by the number of separate runs
+    of neighbours around them, like in skeleton_graph().
+    Therefore, the corner of a diagonal step is not mistaken
+    for a junction and a line ending in a diagonal step
+    is still an endpoint.
+
+    This is much faster than counting neighbours using
+    binary_neighbours() & popcount() and does not
+    allocate any full-size temporary array.
+
+    Parameters
+    ==========
+    img : numpy array-like
+        A grayscale image that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Strided views (e.g. img[:, 100:900]) are used without copying.
+    include_lines : bool
+        If True, also return the coordinates of all line pixels.
+        Otherwise, they are only counted.
+
+    Returns
+    =======
+    A SkeletonPoints instance
+    """
+    # Check if image has the correct type
+    __check_image_grayscale_2d(img)
+    __check_array_uint8(img)
+    img, row_stride, pixel_stride = __strided_2d(img, "skeleton_points")
+
+    height, width = img.shape
+
+    points = _ffi.new("skeleton_points_t*")
+    srcptr = _ffi.cast("uint8_t*", img.ctypes.data)
+    try:
+        rc = _libcv_algorithms.skeleton_points(points, srcptr, row_stride, pixel_stride,
+                                               width, height, include_lines)
+        if rc != 0:
+            raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+        # Copy the results from the C-allocated memory
+        coords = []
+        for pixel_type in SkeletonPixelType:
+            count = points.counts[pixel_type]
+            if pixel_type == SkeletonPixelType.Line and not include_lines:
+                coords.append(None)
+                continue
+            buf = _ffi.buffer(points.coords[pixel_type], 2 * count * _ffi.sizeof("int32_t"))
+            coords.append(np.frombuffer(buf, dtype=np.int32).reshape(-1, 2).copy())
+        num_lines = int(points.counts[SkeletonPixelType.Line])
+    finally:
+        _libcv_algorithms.skeleton_points_free(points)
+    return SkeletonPoints(*coords, num_lines)
@@ -4,59 +4,527 @@
 Thinning algorithms
 """
 import numpy as np
+import enum
 from ._ffi import *
 from ._checks import *
+from .parallel import _resolve_num_threads
+from .packed import PackedBinary
+from .workspace import Workspace
 
-__all__ = ["guo_hall", "zhang_suen"]
+__all__ = ["guo_hall", "zhang_suen", "guo_hall_batch", "zhang_suen_batch", "thinning3d",
+           "ThinningAlgorithm", "ThinningMethod", "ThinningStats", "thinning_table"]
 
 _ffi.cdef('''
+typedef struct {
+    size_t iterations;
+    int converged;
+    size_t* deletions;
+    size_t num_subiterations;
+    size_t deletions_capacity;
+    size_t bytes_touched;
+    double setup_seconds;
+    double evaluate_seconds;
+    double apply_seconds;
+    double finish_seconds;
+} thinning_stats;
 int guo_hall_thinning(uint8_t* binary_image, size_t width, size_t height);
 int zhang_suen_thinning(uint8_t* binary_image, size_t width, size_t height);
+int thinning(uint8_t* binary_image, size_t width, size_t height, int algorithm, int method, int num_threads,
+             size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+             size_t max_iterations, thinning_stats* stats, thinning_workspace* workspace);
+int thinning_table(uint8_t* dst, int algorithm);
+int thinning_packed(uint64_t* binary_image, size_t words_per_row, size_t width, size_t height, int algorithm,
+                    size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+                    size_t max_iterations, thinning_stats* stats);
+void thinning_stats_free(thinning_stats* stats);
+int thinning_batch(uint8_t* images, size_t count, size_t width, size_t height, int algorithm, int method, int num_threads);
+int thinning3d(uint8_t* volume, size_t width, size_t height, size_t depth, int num_threads);
 ''')
 
 
-def __run_thinning(img, inplace, cfun):
-    """Internal common thinning function"""
-    # Copy image (it'll be changed by the C code) if not allowed to modify
-    if not inplace:
+class ThinningAlgorithm(enum.IntEnum):
+    """
+    Thinning algorithms implemented in the C backend
+    """
+    GuoHall = 0
+    ZhangSuen = 1
+
+
+class ThinningMethod(enum.IntEnum):
+    """
+    How the C backend finds the pixels to delete.
+    All methods produce identical results.
+
+    Raster:
+        Scan every pixel of the image in every sub-iteration.
+    Frontier:
+        Scan every pixel once, then only re-examine the neighbours
+        of pixels deleted in the previous sub-iterations.
+        Much faster for large images with comparatively few
+        foreground pixels (e.g. document scans).
+    Packed:
+        Pack the image to 1 bit per pixel (see PackedBinary) and
+        evaluate 64 pixels at once. Reduces memory bandwidth
+        for very large images.
+        This is always used for PackedBinary inputs.
+    """
+    Raster = 0
+    Frontier = 1
+    Packed = 2
+
+
+class ThinningStats(object):
+    """
+    Statistics of a single thinning run,
+    see the return_stats argument of guo_hall() and zhang_suen().
+
+    Attributes
+    ==========
+    iterations : int
+        Number of iterations (pairs of sub-iterations) performed
+    converged : bool
+        True if the last iteration did not delete any pixel.
+        False if the run was stopped by max_iterations.
+    deletions : numpy array
+        Number of pixels deleted in each sub-iteration
+    bytes_touched : int
+        Estimated number of bytes of the image and
+        the scratch buffers read or written
+    setup_seconds : float
+        Wall time for initializing the scratch buffers
+        (and packing the image for the Packed method)
+    evaluate_seconds : float
+        Wall time for finding the deletable pixels
+    apply_seconds : float
+        Wall time for deleting the pixels.
+        For the Packed method, this is included in evaluate_seconds.
+    finish_seconds : float
+        Wall time for unpacking the image (Packed method)
+    """
+    def __init__(self, iterations, converged, deletions, bytes_touched,
+                 setup_seconds, evaluate_seconds, apply_seconds, finish_seconds):
+        self.iterations = iterations
+        self.converged = converged
+        self.deletions = deletions
+        self.bytes_touched = bytes_touched
+        self.setup_seconds = setup_seconds
+        self.evaluate_seconds = evaluate_seconds
+        self.apply_seconds = apply_seconds
+        self.finish_seconds = finish_seconds
+
+    @property
+    def pixels_removed(self):
+        """Total number of pixels deleted"""
+        return int(np.sum(self.deletions))
+
+    @property
+    def total_seconds(self):
+        return self.setup_seconds + self.evaluate_seconds + self.apply_seconds + self.finish_seconds
+
+    def as_dict(self):
+        """
+        Get the scalar statistics as a flat dict,
+        e.g. for exporting them to a metrics system
+        """
+        return {
+            "iterations": self.iterations,
+            "converged": self.converged,
+            "subiterations": len(self.deletions),
+            "pixels_removed": self.pixels_removed,
+            "bytes_touched": self.bytes_touched,
+            "setup_seconds": self.setup_seconds,
+            "evaluate_seconds": self.evaluate_seconds,
+            "apply_seconds": self.apply_seconds,
+            "finish_seconds": self.finish_seconds,
+            "total_seconds": self.total_seconds
+        }
+
+    def __repr__(self):
+        return "ThinningStats(iterations={0}, converged={1}, pixels_removed={2}, total_seconds={3:.6f})".format(
+            self.iterations, self.converged, self.pixels_removed, self.total_seconds)
+
+
+def _thinning_stats_from_c(cstats):
+    """Internal: Convert a thinning_stats struct to a ThinningStats instance"""
+    deletions = np.array([cstats.deletions[i] for i in range(cstats.num_subiterations)], dtype=np.uint64)
+    return ThinningStats(cstats.iterations, bool(cstats.converged), deletions, cstats.bytes_touched,
+                         cstats.setup_seconds, cstats.evaluate_seconds,
+                         cstats.apply_seconds, cstats.finish_seconds)
+
+
+def __check_max_iterations(max_iterations):
+    """Convert max_iterations to the C convention (0 = unlimited)"""
+    if max_iterations is None:
+        return 0
+    if max_iterations < 1:
+        raise ValueError("max_iterations must be at least 1 but is {0}".format(max_iterations))
+    return max_iterations
+
+
+def thinning_table(algorithm):
+    """
+    Get the precomputed deletion tables the C backend uses
+    for the given thinning algorithm.
+
+    The tables are indexed by the neighbourhood code
+    computed by binary_neighbours(), so they can be reused
+    for other 3x3 binary operators, e.g.
+
+        table = thinning_table(ThinningAlgorithm.GuoHall)
+        deletable = table[0][binary_neighbours(img)] & (img != 0)
+
+    Parameters
+    ==========
+    algorithm : ThinningAlgorithm
+        The algorithm to get the tables for
+
+    Returns
+    =======
+    A (2, 256) bool numpy array. table[parity, code] is True if
+    a foreground pixel with the given neighbourhood code is deleted
+    in an even (parity 0) or odd (parity 1) sub-iteration.
+    """
+    out = np.zeros((2, 256), dtype=np.uint8)
+    dstptr = _ffi.cast("uint8_t*", out.ctypes.data)
+    rc = _libcv_algorithms.thinning_table(dstptr, ThinningAlgorithm(algorithm))
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return out.astype(bool)
+
+
+def __run_thinning_packed(img, inplace, out, algorithm, roi, max_iterations, cstats):
+    """Internal thinning function for PackedBinary images"""
+    if out is not None:
+        if not isinstance(out, PackedBinary) or out.shape != img.shape:
+            raise ValueError("out must be a PackedBinary of shape {0}".format(img.shape))
+        np.copyto(out.data, img.data)
+        img = out
+    elif not inplace:
         img = img.copy()
+    __check_image_min_wh(img, 3, 3)
+    roi = __check_roi(img, roi)
+
+    dptr = _ffi.cast("uint64_t*", img.data.ctypes.data)
+
+    rc = _libcv_algorithms.thinning_packed(dptr, img.words_per_row, img.width,
+        img.height, ThinningAlgorithm(algorithm), *roi, max_iterations, cstats)
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    return img
+
+
+def __run_thinning(img, inplace, out, workspace, algorithm, method, num_threads, roi,
+                   max_iterations, return_stats):
+    """Internal common thinning function"""
+    if inplace and out is not None:
+        raise ValueError("inplace=True and out can't be used at the same time")
+    max_iterations = __check_max_iterations(max_iterations)
+    cstats = _ffi.new("thinning_stats*") if return_stats else _ffi.NULL
+    try:
+        img = __run_thinning_image(img, inplace, out, workspace, algorithm, method,
+                                   num_threads, roi, max_iterations, cstats)
+        if return_stats:
+            return img, _thinning_stats_from_c(cstats)
+        return img
+    finally:
+        if return_stats:
+            _libcv_algorithms.thinning_stats_free(cstats)
+
+
+def __run_thinning_image(img, inplace, out, workspace, algorithm, method, num_threads,
+                         roi, max_iterations, cstats):
+    """Internal thinning function for numpy images & PackedBinary images"""
+    if isinstance(img, PackedBinary):
+        return __run_thinning_packed(img, inplace, out, algorithm, roi, max_iterations, cstats)
     # Check if image seems correct
     __check_image_grayscale_2d(img)
-    img = force_c_order_contiguous(img)
     __check_image_min_wh(img, 3, 3)
     __check_array_uint8(img)
+    roi = __check_roi(img, roi)
+    # Copy image (it'll be changed by the C code) if not allowed to modify
+    target = None
+    if out is not None:
+        out = __check_out_array(out, img.shape, np.uint8)
+        np.copyto(out, img)
+        img = out
+    elif not inplace:
+        img = img.copy()
+    elif not img.flags['C_CONTIGUOUS']:
+        # The C code needs a contiguous image: Thin a copy and write it back
+        target = img
+        img = force_c_order_contiguous(img, "thinning")
 
     height, width = img.shape
 
     # Extract pointer to binary data
     dptr = _ffi.cast("uint8_t*", img.ctypes.data)
 
-    rc = cfun(dptr, width, height)
+    rc = _libcv_algorithms.thinning(dptr, width, height,
+        ThinningAlgorithm(algorithm), ThinningMethod(method),
+        _resolve_num_threads(num_threads), *roi, max_iterations, cstats,
+        workspace._thinning if workspace is not None else _ffi.NULL)
     if rc != 0:
         raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    if target is not None:
+        np.copyto(target, img)
+        return target
     return img
 
 
-def guo_hall(img, inplace=False):
+def guo_hall(img, inplace=False, method=ThinningMethod.Raster, num_threads=None, roi=None,
+             max_iterations=None, return_stats=False, out=None, workspace=None):
     """
     Perform in-place optimized Guo-Hall thinning.
     Returns img.
 
-    Requires a binary grayscale numpy array as input.
+    Requires a binary grayscale numpy array or a PackedBinary as input.
 
     This calls the optimized C backend from cv_algorithms.
+
+    Parameters
+    ==========
+    img : numpy array-like or PackedBinary
+        A binary uint8 grayscale image.
+        For PackedBinary images, the result is a PackedBinary
+        and the Packed method is always used.
+    inplace : bool
+        If True, img is modified directly.
+    method : ThinningMethod
+        Selects the C implementation.
+        See ThinningMethod for details.
+    num_threads : int or None
+        Number of threads for the raster method. The image is split
+        into bands of rows, the result is identical to the
+        single-threaded version. None means use the default set by
+        set_num_threads(), 0 means use all CPU cores.
+    roi : (x, y, width, height) tuple or None
+        If given, only pixels inside this region are thinned.
+        Pixels outside of it are left unchanged but are still taken
+        into account as neighbours. The time taken is proportional
+        to the size of the region, not the size of the image.
+        Independently of the ROI, the C code only processes the
+        bounding box of the remaining foreground pixels.
+    max_iterations : int or None
+        If given, stop after this many iterations (pairs of
+        sub-iterations) even if the result has not converged yet.
+        Use return_stats to find out whether it has converged.
+    return_stats : bool
+        If True, return a (img, ThinningStats) tuple
+        containing the iteration count, the number of pixels
+        deleted per sub-iteration and timing information.
+    out : numpy array, PackedBinary or None
+        If given, the result is stored in this array
+        (same shape, uint8, C-contiguous) instead of a new copy of img.
+        img is not modified. Can't be combined with inplace=True.
+    workspace : Workspace or None
+        If given, the scratch buffers of this Workspace are used
+        instead of allocating new ones.
     """
-    return __run_thinning(img, inplace, _libcv_algorithms.guo_hall_thinning)
-    
+    return __run_thinning(img, inplace, out, workspace, ThinningAlgorithm.GuoHall, method,
+                          num_threads, roi, max_iterations, return_stats)
+
 
-def zhang_suen(img, inplace=False):
+def zhang_suen(img, inplace=False, method=ThinningMethod.Raster, num_threads=None, roi=None,
+               max_iterations=None, return_stats=False, out=None, workspace=None):
     """
     Perform in-place optimized Zhang-Suen thinning.
     Returns img.
 
-    Requires a binary grayscale numpy array as input.
+    Requires a binary grayscale numpy array or a PackedBinary as input.
 
     This calls the optimized C backend from cv_algorithms.
+
+    Parameters
+    ==========
+    img : numpy array-like or PackedBinary
+        A binary uint8 grayscale image.
+        For PackedBinary images, the result is a PackedBinary
+        and the Packed method is always used.
+    inplace : bool
+        If True, img is modified directly.
+    method : ThinningMethod
+        Selects the C implementation.
+        See ThinningMethod for details.
+    num_threads : int or None
+        Number of threads for the raster method. The image is split
+        into bands of rows, the result is identical to the
+        single-threaded version. None means use the default set by
+        set_num_threads(), 0 means use all CPU cores.
+    roi : (x, y, width, height) tuple or None
+        If given, only pixels inside this region are thinned.
+        Pixels outside of it are left unchanged but are still taken
+        into account as neighbours. The time taken is proportional
+        to the size of the region, not the size of the image.
+        Independently of the ROI, the C code only processes the
+        bounding box of the remaining foreground pixels.
+    max_iterations : int or None
+        If given, stop after this many iterations (pairs of
+        sub-iterations) even if the result has not converged yet.
+        Use return_stats to find out whether it has converged.
+    return_stats : bool
+        If True, return a (img, ThinningStats) tuple
+        containing the iteration count, the number of pixels
+        deleted per sub-iteration and timing information.
+    out : numpy array, PackedBinary or None
+        If given, the result is stored in this array
+        (same shape, uint8, C-contiguous) instead of a new copy of img.
+        img is not modified. Can't be combined with inplace=True.
+    workspace : Workspace or None
+        If given, the scratch buffers of this Workspace are used
+        instead of allocating new ones.
+    """
+
+    return __run_thinning(img, inplace, out, workspace, ThinningAlgorithm.ZhangSuen, method,
+                          num_threads, roi, max_iterations, return_stats)
+
+
+def __run_thinning_batch(imgs, inplace, algorithm, method, num_threads):
+    """Internal common batch thinning function"""
+    if isinstance(imgs, np.ndarray):
+        # Copy images (they'll be changed by the C code) if not allowed to modify
+        if not inplace:
+            imgs = imgs.copy()
+    else: # List of 2D images
+        if len(imgs) == 0:
+            raise ValueError("empty batch")
+        for img in imgs:
+            __check_image_grayscale_2d(img)
+        imgs = np.stack(imgs)
+    if len(imgs.shape) != 3:
+        raise ValueError("Image stack has wrong number of dimensions ({0} instead of 3)".format(len(imgs.shape)))
+    __check_image_min_wh(imgs, 3, 3)
+    __check_array_uint8(imgs)
+    if imgs.shape[0] == 0:
+        return imgs
+    target = None
+    if not imgs.flags['C_CONTIGUOUS']:
+        # The C code needs a contiguous stack: Thin a copy and write it back
+        target = imgs
+        imgs = force_c_order_contiguous(imgs, "thinning_batch")
+
+    count, height, width = imgs.shape
+
+    # Extract pointer to binary data
+    dptr = _ffi.cast("uint8_t*", imgs.ctypes.data)
+
+    rc = _libcv_algorithms.thinning_batch(dptr, count, width, height,
+        ThinningAlgorithm(algorithm), ThinningMethod(method),
+        _resolve_num_threads(num_threads))
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    if target is not None:
+        np.copyto(target, imgs)
+        return target
+    return imgs
+
+
+def guo_hall_batch(imgs, inplace=False, method=ThinningMethod.Raster, num_threads=None):
     """
-    
-    return __run_thinning(img, inplace, _libcv_algorithms.zhang_suen_thinning)
+    Perform optimized Guo-Hall thinning on a stack of images
+    in a single call. This avoids the per-call overhead of guo_hall()
+    when thinning many small images.
+
+    Every image is thinned independently, the results are identical
+    to calling guo_hall() on every image.
+
+    Parameters
+    ==========
+    imgs : numpy array or list of numpy arrays
+        Either a (N, H, W) uint8 array or a list of
+        equally-shaped binary uint8 grayscale images.
+    inplace : bool
+        If True and imgs is a numpy array, imgs is modified directly.
+    method : ThinningMethod
+        Selects the C implementation.
+        See ThinningMethod for details.
+    num_threads : int or None
+        Number of images to thin in parallel. None means use the default
+        set by set_num_threads(), 0 means use all CPU cores.
+
+    Returns
+    =======
+    A (N, H, W) uint8 numpy array containing the thinned images.
+    """
+    return __run_thinning_batch(imgs, inplace, ThinningAlgorithm.GuoHall, method, num_threads)
+
+
+def zhang_suen_batch(imgs, inplace=False, method=ThinningMethod.Raster, num_threads=None):
+    """
+    Perform optimized Zhang-Suen thinning on a stack of images
+    in a single call. See guo_hall_batch() for details.
+
+    Parameters
+    ==========
+    imgs : numpy array or list of numpy arrays
+        Either a (N, H, W) uint8 array or a list of
+        equally-shaped binary uint8 grayscale images.
+    inplace : bool
+        If True and imgs is a numpy array, imgs is modified directly.
+    method : ThinningMethod
+        Selects the C implementation.
+        See ThinningMethod for details.
+    num_threads : int or None
+        Number of images to thin in parallel. None means use the default
+        set by set_num_threads(), 0 means use all CPU cores.
+
+    Returns
+    =======
+    A (N, H, W) uint8 numpy array containing the thinned images.
+    """
+    return __run_thinning_batch(imgs, inplace, ThinningAlgorithm.ZhangSuen, method, num_threads)
+
+
+def thinning3d(volume, inplace=False, num_threads=None):
+    """
+    Perform topology-preserving 3D thinning on a binary volume,
+    e.g. a stack of images, reducing every object to a
+    one voxel thick curve skeleton.
+
+    Voxels are deleted from the six face directions in turn.
+    Only simple voxels are deleted (26-connected foreground,
+    6-connected background), so the number of objects, tunnels
+    and cavities is preserved. Ends of lines are never deleted.
+    Voxels outside the volume count as background.
+
+    Parameters
+    ==========
+    volume : numpy array-like
+        A (depth, height, width) uint8 volume that is assumed to be binary
+        (every non-zero value is interpreted as foreground).
+        Deleted voxels are set to 0, the remaining voxels keep their value.
+    inplace : bool
+        If True, volume is modified directly.
+    num_threads : int or None
+        Number of threads searching for deletable voxels.
+        The planes are distributed over the threads, the result is
+        identical to the single-threaded version. None means use the
+        default set by set_num_threads(), 0 means use all CPU cores.
+
+    Returns
+    =======
+    The thinned (depth, height, width) uint8 volume
+    """
+    __check_volume_3d(volume)
+    __check_array_uint8(volume)
+    # Copy volume (it'll be changed by the C code) if not allowed to modify
+    if not inplace:
+        volume = volume.copy()
+    target = None
+    if not volume.flags['C_CONTIGUOUS']:
+        # The C code needs a contiguous volume: Thin a copy and write it back
+        target = volume
+        volume = force_c_order_contiguous(volume, "thinning3d")
+
+    depth, height, width = volume.shape
+
+    # Extract pointer to binary data
+    dptr = _ffi.cast("uint8_t*", volume.ctypes.data)
+
+    rc = _libcv_algorithms.thinning3d(dptr, width, height, depth,
+                                      _resolve_num_threads(num_threads))
+    if rc != 0:
+        raise ValueError("Internal error (return code {0}) in algorithm C code".format(rc))
+    if target is not None:
+        np.copyto(target, volume)
+        return target
+    return volume
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reusable scratch buffers for the C backend
+"""
+from ._ffi import *
+
+__all__ = ["Workspace"]
+
+_ffi.cdef('''
+typedef struct thinning_workspace thinning_workspace;
+thinning_workspace* thinning_workspace_new();
+void thinning_workspace_free(thinning_workspace* workspace);
+size_t thinning_workspace_size(const thinning_workspace* workspace);
+''')
+
+
+class Workspace(object):
+    """
+    Scratch buffers of the thinning functions that are kept across calls.
+
+    By default, every call to guo_hall() or zhang_suen() allocates
+    (and frees) a mask the size of the image and other scratch buffers.
+    When processing many images (e.g. video frames), pass the same
+    Workspace to every call instead. Its buffers grow to the size
+    required by the largest image and are then reused, so together
+    with the out= argument, steady-state thinning
+    does not allocate any memory.
+
+    Only guo_hall() and zhang_suen() use a Workspace. Other functions
+    such as grassfire() or popcount() still allocate their temporary
+    buffers on every call, even if an out= array is passed.
+
+        ws = Workspace()
+        out = np.empty_like(frame)
+        for frame in frames:
+            guo_hall(frame, out=out, workspace=ws)
+
+    A Workspace must not be used by multiple threads at the same time.
+    """
+    def __init__(self):
+        handle = _libcv_algorithms.thinning_workspace_new()
+        if handle == _ffi.NULL:
+            raise MemoryError("Could not allocate workspace")
+        self._thinning = _ffi.gc(handle, _libcv_algorithms.thinning_workspace_free)
+
+    @property
+    def nbytes(self):
+        """Number of bytes currently allocated for the scratch buffers"""
+        return _libcv_algorithms.thinning_workspace_size(self._thinning)
+
+    def __repr__(self):
+        return "Workspace(nbytes={0})".format(self.nbytes)
@@ -0,0 +1,189 @@
+#include "common.hpp"
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <stddef.h>
+
+//Forward declaration required due to CFFI's requirement to have unmangled symbols
+extern "C" {
+    CFFI_DLLEXPORT int chain_encode(uint8_t* dst, size_t* dst_size, const int32_t* path,
+        size_t num_points, int format);
+    CFFI_DLLEXPORT int chain_decode(int32_t* path, const uint8_t* data, size_t data_size,
+        size_t num_steps, int format, int32_t start_y, int32_t start_x);
+}
+
+/**
+ * Chain code formats. Keep in sync with ChainCodeFormat in chaincode.py
+ */
+enum ChainCodeFormat {
+    // One byte per step
+    CHAIN_PLAIN = 0,
+    // 3 bits per step: Step i is stored in bits 3*i ... 3*i+2 of the
+    // little-endian bit stream
+    CHAIN_PACKED = 1,
+    // One byte per run of equal steps: Code in bits 0-2, run length - 1 in bits 3-7
+    CHAIN_RUN_LENGTH = 2
+};
+
+#define CHAIN_MAX_RUN 32
+
+// Return code of chain_decode() for Plain step codes > 7
+#define CHAIN_INVALID_CODE -4
+
+/**
+ * Step offsets for every code, i.e. the bit order used by
+ * binary_neighbours() and Direction - 1:
+ *
+ *     0 1 2
+ *     3   4
+ *     5 6 7
+ */
+static const int chainDX[8] = {-1, 0, 1, -1, 1, -1, 0, 1};
+static const int chainDY[8] = {-1, -1, -1, 0, 0, 1, 1, 1};
+
+/**
+ * Code for a step (dy + 1) * 3 + (dx + 1), -1 for invalid steps
+ */
+static const int8_t chainCodes[9] = {0, 1, 2, 3, -1, 4, 5, 6, 7};
+
+/**
+ * Encode a path of num_points (y, x) points where consecutive points
+ * are 8-neighbours as chain code of num_points - 1 steps.
+ * dst must have space for num_points - 1 bytes (enough for every format).
+ * The number of bytes used is stored in dst_size.
+ *
+ * Returns -2 if consecutive points are not 8-neighbours
+ * and -3 for an invalid format.
+ */
+CFFI_DLLEXPORT int chain_encode(uint8_t* dst, size_t* dst_size, const int32_t* path,
+        size_t num_points, int format) {
+    if (format != CHAIN_PLAIN && format != CHAIN_PACKED && format != CHAIN_RUN_LENGTH) {
+        return -3;
+    }
+    size_t size = 0;
+    uint32_t bits = 0; // Bit buffer for CHAIN_PACKED
+    int num_bits = 0;
+    int run_code = -1, run_length = 0; // Current run for CHAIN_RUN_LENGTH
+    for (size_t i = 1; i < num_points; i++) {
+        int64_t dy = (int64_t)path[2 * i] - path[2 * i - 2];
+        int64_t dx = (int64_t)path[2 * i + 1] - path[2 * i - 1];
+        if (dy < -1 || dy > 1 || dx < -1 || dx > 1 || chainCodes[(dy + 1) * 3 + (dx + 1)] < 0) {
+            return -2;
+        }
+        int code = chainCodes[(dy + 1) * 3 + (dx + 1)];
+        switch (format) {
+            case CHAIN_PLAIN:
+                dst[size++] = (uint8_t)code;
+                break;
+            case CHAIN_PACKED:
+                bits |= (uint32_t)code << num_bits;
+                num_bits += 3;
+                if (num_bits >= 8) {
+                    dst[size++] = (uint8_t)bits;
+                    bits >>= 8;
+                    num_bits -= 8;
+                }
+                break;
+            case CHAIN_RUN_LENGTH:
+                if (code == run_code && run_length < CHAIN_MAX_RUN) {
+                    run_length++;
+                } else {
+                    if (run_length > 0) {
+                        dst[size++] = (uint8_t)(run_code | ((run_length - 1) << 3));
+                    }
+                    run_code = code;
+                    run_length = 1;
+                }
+                break;
+        }
+    }
+    if (format == CHAIN_PACKED && num_bits > 0) {
+        dst[size++] = (uint8_t)bits;
+    }
+    if (format == CHAIN_RUN_LENGTH && run_length > 0) {
+        dst[size++] = (uint8_t)(run_code | ((run_length - 1) << 3));
+    }
+    *dst_size = size;
+    return 0;
+}
+
+/**
+ * Decode a chain code of num_steps steps stored in data_size bytes
+ * to a path of num_steps + 1 (y, x) points, starting at (start_y, start_x).
+ *
+ * Returns -2 if the data does not contain exactly num_steps steps,
+ * i.e. for the Plain and Packed formats if data_size is not the
+ * size required for num_steps steps, -3 for an invalid format
+ * and CHAIN_INVALID_CODE if a Plain step code is > 7.
+ */
+CFFI_DLLEXPORT int chain_decode(int32_t* path, const uint8_t* data, size_t data_size,
+        size_t num_steps, int format, int32_t start_y, int32_t start_x) {
+    int32_t y = start_y, x = start_x;
+    path[0] = y;
+    path[1] = x;
+    int32_t* out = path + 2;
+    switch (format) {
+        case CHAIN_PLAIN:
+            if (data_size != num_steps) {
+                return -2;
+            }
+            for (size_t i = 0; i < num_steps; i++) {
+                int code = data[i];
+                if (code > 7) {
+                    return CHAIN_INVALID_CODE;
+                }
+                y += chainDY[code];
+                x += chainDX[code];
+                *out++ = y;
+                *out++ = x;
+            }
+            break;
+        case CHAIN_PACKED: {
+            if (data_size != (3 * num_steps + 7) / 8) {
+                return -2;
+            }
+            uint32_t bits = 0;
+            int num_bits = 0;
+            size_t byte = 0;
+            for (size_t i = 0; i < num_steps; i++) {
+                if (num_bits < 3) {
+                    bits |= (uint32_t)data[byte++] << num_bits;
+                    num_bits += 8;
+                }
+                int code = bits & 7;
+                bits >>= 3;
+                num_bits -= 3;
+                y += chainDY[code];
+                x += chainDX[code];
+                *out++ = y;
+                *out++ = x;
+            }
+            break;
+        }
+        case CHAIN_RUN_LENGTH: {
+            size_t steps = 0;
+            for (size_t i = 0; i < data_size; i++) {
+                int code = data[i] & 7;
+                size_t run = (data[i] >> 3) + 1;
+                if (steps + run > num_steps) {
+                    return -2;
+                }
+                steps += run;
+                int dy = chainDY[code], dx = chainDX[code];
+                for (size_t j = 0; j < run; j++) {
+                    y += dy;
+                    x += dx;
+                    *out++ = y;
+                    *out++ = x;
+                }
+            }
+            if (steps != num_steps) {
+                return -2;
+            }
+            break;
+        }
+        default:
+            return -3;
+    }
+    return 0;
+}
@@ -1,10 +1,20 @@
 #pragma once
+#include <stddef.h>
 
 /** 
  * Dirty macro to directly access an image at X/Y coordinates.
- * Assumes that the width variable is defined to the width of the image
+ * Assumes that the width variable is defined to the width of the image.
+ * The offset is computed in ptrdiff_t, so images with more than
+ * 2^31 pixels work even if x, y or width are int.
  */
-#define IMG_XY(img, x, y) img[(x) + (width)*(y)]
+#define IMG_XY(img, x, y) img[(ptrdiff_t)(x) + (ptrdiff_t)(width) * (ptrdiff_t)(y)]
+
+/**
+ * Access a strided image (e.g. a numpy view) at X/Y coordinates.
+ * Strides are given in elements, not bytes, and may be negative.
+ */
+#define IMG_STRIDED_XY(img, x, y, row_stride, pixel_stride) \
+    img[(ptrdiff_t)(x) * (pixel_stride) + (ptrdiff_t)(y) * (row_stride)]
 
 // Windows compatibility
 #ifndef CFFI_DLLEXPORT
@@ -14,3 +24,16 @@
 #define CFFI_DLLEXPORT
 #endif // defined(_MSC_VER)
 #endif // ifndef CFFI_DLLEXPORT
+
+// MSVC compatibility for the GCC popcount builtins
+#ifdef _MSC_VER
+#include <intrin.h>
+#define __builtin_popcount __popcnt
+#define __builtin_popcountll __popcnt64
+#endif
+
+// SSE2 is available on every x86-64 CPU
+#if defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+#define CV_ALGORITHMS_SSE2
+#include <emmintrin.h>
+#endif
@@ -0,0 +1,67 @@
+#include "cpu.hpp"
+#include <atomic>
+
+//Forward declaration required due to CFFI's requirement to have unmangled symbols
+extern "C" {
+    CFFI_DLLEXPORT int cpu_supported_feature_level();
+    CFFI_DLLEXPORT int cpu_get_feature_level();
+    CFFI_DLLEXPORT int cpu_set_feature_level(int level);
+}
+
+/**
+ * Highest feature level supported by the CPU (and the OS)
+ */
+static int cpu_detect_feature_level() {
+#ifdef CV_ALGORITHMS_DISPATCH
+    __builtin_cpu_init();
+    bool popcnt = __builtin_cpu_supports("popcnt") && __builtin_cpu_supports("sse4.2");
+    bool avx2 = popcnt && __builtin_cpu_supports("avx2");
+    bool avx512 = avx2 && __builtin_cpu_supports("avx512f") && __builtin_cpu_supports("avx512bw")
+        && __builtin_cpu_supports("avx512vpopcntdq");
+    if (avx512) {
+        return CPU_AVX512;
+    } else if (avx2) {
+        return CPU_AVX2;
+    } else if (popcnt) {
+        return CPU_POPCNT;
+    }
+#endif
+    return CPU_BASELINE;
+}
+
+/**
+ * The forced feature level or -1 for the highest supported level
+ */
+static std::atomic<int> forcedFeatureLevel(-1);
+
+CFFI_DLLEXPORT int cpu_supported_feature_level() {
+    static const int level = cpu_detect_feature_level();
+    return level;
+}
+
+int cpu_feature_level() {
+    int forced = forcedFeatureLevel.load(std::memory_order_relaxed);
+    return (forced < 0) ? cpu_supported_feature_level() : forced;
+}
+
+CFFI_DLLEXPORT int cpu_get_feature_level() {
+    return cpu_feature_level();
+}
+
+/**
+ * Force the kernels to use the given feature level,
+ * or the highest supported level if level is -1.
+ *
+ * Returns -2 if the level is not supported by the CPU
+ * and -3 for an invalid level.
+ */
+CFFI_DLLEXPORT int cpu_set_feature_level(int level) {
+    if (level < -1 || level > CPU_AVX512) {
+        return -3;
+    }
+    if (level > cpu_supported_feature_level()) {
+        return -2;
+    }
+    forcedFeatureLevel.store(level);
+    return 0;
+}
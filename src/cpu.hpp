@@ -0,0 +1,44 @@
+#pragma once
+#include "common.hpp"
+
+/**
+ * Runtime CPU feature dispatch.
+ *
+ * Hot kernels are compiled in several variants using function target
+ * attributes, so a single binary built for the x86-64 baseline uses the
+ * fastest instructions supported by the CPU it runs on.
+ * The variant is selected using cpu_feature_level() on every call.
+ */
+
+/**
+ * CPU feature levels. Every level includes the lower levels.
+ * Keep in sync with CpuFeatureLevel in cpu.py
+ */
+enum CpuFeatureLevel {
+    CPU_BASELINE = 0, // No extensions (SSE2 on x86-64)
+    CPU_POPCNT = 1, // POPCNT & SSE4.2
+    CPU_AVX2 = 2, // AVX2
+    CPU_AVX512 = 3 // AVX-512 F, BW & VPOPCNTDQ
+};
+
+// Function multiversioning is only used with GCC & clang on x86
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+#define CV_ALGORITHMS_DISPATCH
+#include <immintrin.h>
+#define CV_TARGET_POPCNT __attribute__((target("popcnt,sse4.2")))
+#define CV_TARGET_AVX2 __attribute__((target("popcnt,sse4.2,avx2")))
+#define CV_TARGET_AVX512 __attribute__((target("popcnt,sse4.2,avx2,avx512f,avx512bw,avx512vpopcntdq")))
+#endif
+
+#if defined(_MSC_VER)
+#define CV_ALWAYS_INLINE __forceinline
+#else
+#define CV_ALWAYS_INLINE __attribute__((always_inline)) inline
+#endif
+
+/**
+ * The feature level the kernels use: The highest level supported
+ * by the CPU unless a lower level has been forced
+ * using cpu_set_feature_level()
+ */
+int cpu_feature_level();
@@ -1,24 +1,230 @@
 #include "common.hpp"
+#include "parallel.hpp"
 #include <stdlib.h>
-#include <assert.h>
-#include <stdbool.h>
-#include <limits.h>
-#include <string.h>
 #include <stdint.h>
+#include <stddef.h>
 #include <cmath>
+#include <limits>
+#include <vector>
+#include <algorithm>
+#include <new>
+
+/**
+ * Pairwise absolute differences |a[i] - b[j]| of two 1D float arrays.
+ *
+ * The full (a_size, b_size) matrix is computed cache-blocked: A tile of
+ * B_TILE_BYTES of b is kept in L1 cache while a block of A_BLOCK_ROWS
+ * elements of a is compared to it. The nearest neighbour search never
+ * stores the matrix but searches a sorted copy of b instead.
+ * In both cases the elements of a are distributed over the threads,
+ * so the result does not depend on the number of threads.
+ */
 
 //Forward declaration required due to CFFI's requirement to have unmangled symbols
 extern "C" {
-	CFFI_DLLEXPORT int pairwise_diff(const double* a, const double* b, double* result, size_t awidth, size_t bwidth);
+	CFFI_DLLEXPORT int pairwise_diff_float(float* dst, const float* a, const float* b,
+		size_t a_size, size_t b_size, size_t num_threads);
+	CFFI_DLLEXPORT int pairwise_diff_double(double* dst, const double* a, const double* b,
+		size_t a_size, size_t b_size, size_t num_threads);
+	CFFI_DLLEXPORT int pairwise_diff_knn_float(int64_t* indices, float* distances,
+		const float* a, const float* b, size_t a_size, size_t b_size,
+		size_t k, float max_distance, size_t num_threads);
+	CFFI_DLLEXPORT int pairwise_diff_knn_double(int64_t* indices, double* distances,
+		const double* a, const double* b, size_t a_size, size_t b_size,
+		size_t k, double max_distance, size_t num_threads);
+}
+
+#define B_TILE_BYTES 16384
+#define A_BLOCK_ROWS 64
+
+/**
+ * Distance matrix rows [a0, a1)
+ */
+template<typename T>
+static void pairwise_diff_rows(T* __restrict dst, const T* __restrict a, const T* __restrict b,
+		size_t a0, size_t a1, size_t b_size) {
+	const size_t tile = B_TILE_BYTES / sizeof(T);
+	for (size_t ablock = a0; ablock < a1; ablock += A_BLOCK_ROWS) {
+		size_t aend = (a1 - ablock > A_BLOCK_ROWS) ? ablock + A_BLOCK_ROWS : a1;
+		for (size_t b0 = 0; b0 < b_size; b0 += tile) {
+			size_t b1 = (b_size - b0 > tile) ? b0 + tile : b_size;
+			for (size_t i = ablock; i < aend; ++i) {
+				const T value = a[i];
+				T* __restrict dstrow = dst + i * b_size;
+				for (size_t j = b0; j < b1; ++j) {
+					dstrow[j] = std::abs(value - b[j]);
+				}
+			}
+		}
+	}
+}
+
+template<typename T>
+static int pairwise_diff_impl(T* dst, const T* a, const T* b,
+		size_t a_size, size_t b_size, size_t num_threads) {
+	if (a_size == 0 || b_size == 0) {
+		return 0;
+	}
+	size_t threads = (num_threads < 1) ? 1 : num_threads;
+	threads = (threads < a_size) ? threads : a_size;
+	try {
+		run_threads(threads, [&](size_t index, size_t count) {
+			size_t a0 = a_size * index / count, a1 = a_size * (index + 1) / count;
+			pairwise_diff_rows(dst, a, b, a0, a1, b_size);
+		});
+	} catch (const std::bad_alloc&) {
+		return -1;
+	}
+	return 0;
+}
+
+/**
+ * Compute the (a_size, b_size) matrix of absolute differences
+ * between every element of a and every element of b,
+ * using num_threads threads.
+ */
+CFFI_DLLEXPORT int pairwise_diff_float(float* dst, const float* a, const float* b,
+		size_t a_size, size_t b_size, size_t num_threads) {
+	return pairwise_diff_impl(dst, a, b, a_size, b_size, num_threads);
+}
+
+CFFI_DLLEXPORT int pairwise_diff_double(double* dst, const double* a, const double* b,
+		size_t a_size, size_t b_size, size_t num_threads) {
+	return pairwise_diff_impl(dst, a, b, a_size, b_size, num_threads);
 }
 
-CFFI_DLLEXPORT int pairwise_diff(const double* a, const double* b, double* result, size_t awidth, size_t bwidth) {
+/**
+ * A candidate match: Distance and index into b
+ */
+template<typename T>
+struct DiffMatch {
+	T distance;
+	int64_t index;
+
+	bool operator<(const DiffMatch& other) const {
+		return distance < other.distance || (distance == other.distance && index < other.index);
+	}
+};
 
-	//Iterate over all (a,b) element pairs
-	for (size_t ax = 0; ax < awidth; ++ax) {
-		for (size_t bx = 0; bx < bwidth; ++bx) {
-			result[ax*awidth + bx] = std::abs((int64_t)(a[ax] - b[bx]));
-		}	
+/**
+ * Nearest neighbours of a[a0, a1) in the sorted values of b.
+ * order[i] is the index into b of sorted[i].
+ *
+ * Starting at the insertion point of a value, the closer of the left
+ * and right neighbour is taken until k matches are found, so matches
+ * are visited by increasing distance. All further matches with the same
+ * distance as the k-th are collected as well, so equal distances can be
+ * sorted by b index.
+ */
+template<typename T>
+static void pairwise_diff_knn_rows(int64_t* indices, T* distances, const T* a,
+		const T* sorted, const int64_t* order, size_t a0, size_t a1, size_t b_size,
+		size_t k, T max_distance) {
+	std::vector<DiffMatch<T> > matches;
+	for (size_t i = a0; i < a1; ++i) {
+		const T value = a[i];
+		size_t right = std::lower_bound(sorted, sorted + b_size, value) - sorted;
+		size_t left = right; // Next candidate on the left is left - 1
+		matches.clear();
+		while (matches.size() < k && (left > 0 || right < b_size)) {
+			DiffMatch<T> match;
+			if (right == b_size || (left > 0 && value - sorted[left - 1] <= sorted[right] - value)) {
+				--left;
+				match.distance = value - sorted[left];
+				match.index = order[left];
+			} else {
+				match.distance = sorted[right] - value;
+				match.index = order[right];
+				++right;
+			}
+			if (!(match.distance <= max_distance)) {
+				break;
+			}
+			matches.push_back(match);
+		}
+		if (matches.size() == k) {
+			// Further matches with the same distance as the k-th
+			const T worst = matches.back().distance;
+			for (; left > 0 && value - sorted[left - 1] == worst; --left) {
+				DiffMatch<T> match = {worst, order[left - 1]};
+				matches.push_back(match);
+			}
+			for (; right < b_size && sorted[right] - value == worst; ++right) {
+				DiffMatch<T> match = {worst, order[right]};
+				matches.push_back(match);
+			}
+		}
+		size_t count = (matches.size() < k) ? matches.size() : k;
+		std::partial_sort(matches.begin(), matches.begin() + count, matches.end());
+		for (size_t j = 0; j < k; ++j) {
+			indices[i * k + j] = (j < count) ? matches[j].index : -1;
+			distances[i * k + j] = (j < count) ? matches[j].distance : std::numeric_limits<T>::infinity();
+		}
+	}
+}
+
+template<typename T>
+static int pairwise_diff_knn_impl(int64_t* indices, T* distances, const T* a, const T* b,
+		size_t a_size, size_t b_size, size_t k, T max_distance, size_t num_threads) {
+	if (k == 0) {
+		return -2;
+	}
+	for (size_t i = 0; i < a_size; ++i) {
+		if (!std::isfinite(a[i])) {
+			return -2;
+		}
+	}
+	if (a_size == 0) {
+		return 0;
+	}
+	size_t threads = (num_threads < 1) ? 1 : num_threads;
+	threads = (threads < a_size) ? threads : a_size;
+	try {
+		// Sort b by value (and index for equal values)
+		std::vector<int64_t> order(b_size);
+		for (size_t j = 0; j < b_size; ++j) {
+			if (!std::isfinite(b[j])) {
+				return -2;
+			}
+			order[j] = (int64_t)j;
+		}
+		std::sort(order.begin(), order.end(), [b](int64_t p, int64_t q) {
+			return b[p] < b[q] || (b[p] == b[q] && p < q);
+		});
+		std::vector<T> sorted(b_size);
+		for (size_t j = 0; j < b_size; ++j) {
+			sorted[j] = b[order[j]];
+		}
+		run_threads(threads, [&](size_t index, size_t count) {
+			size_t a0 = a_size * index / count, a1 = a_size * (index + 1) / count;
+			pairwise_diff_knn_rows(indices, distances, a, sorted.data(), order.data(),
+				a0, a1, b_size, k, max_distance);
+		});
+	} catch (const std::bad_alloc&) {
+		return -1;
 	}
 	return 0;
 }
+
+/**
+ * Find the k elements of b with the smallest absolute difference to every
+ * element of a, ignoring differences > max_distance, using num_threads threads.
+ * Only O(b_size) temporary memory is used.
+ *
+ * The b indices and distances are stored in the (a_size, k) arrays
+ * indices & distances, sorted by distance and index. If fewer than k
+ * elements match, the remaining entries are -1 and infinity.
+ *
+ * Returns -2 if k is 0 or a or b contain NaN or infinite values.
+ */
+CFFI_DLLEXPORT int pairwise_diff_knn_float(int64_t* indices, float* distances,
+		const float* a, const float* b, size_t a_size, size_t b_size,
+		size_t k, float max_distance, size_t num_threads) {
+	return pairwise_diff_knn_impl(indices, distances, a, b, a_size, b_size, k, max_distance, num_threads);
+}
+
+CFFI_DLLEXPORT int pairwise_diff_knn_double(int64_t* indices, double* distances,
+		const double* a, const double* b, size_t a_size, size_t b_size,
+		size_t k, double max_distance, size_t num_threads) {
+	return pairwise_diff_knn_impl(indices, distances, a, b, a_size, b_size, k, max_distance, num_threads);
+}
@@ -1,11 +1,18 @@
 #include "common.hpp"
+#include "parallel.hpp"
 #include <stdlib.h>
 #include <assert.h>
 #include <stdbool.h>
 #include <limits.h>
 #include <string.h>
 #include <stdint.h>
+#include <stddef.h>
 #include <algorithm>
+#include <vector>
+#include <new>
+#include <math.h>
+#include <limits>
+#include <atomic>
 
 
 using std::min;
@@ -13,41 +20,895 @@ using std::max;
 
 //Forward declaration required due to CFFI's requirement to have unmangled symbols
 extern "C" {
-    CFFI_DLLEXPORT int grassfire(uint32_t* dst, const uint8_t* mask, int width, int height);
+    CFFI_DLLEXPORT int grassfire(void* dst, int dtype, const uint8_t* mask,
+        ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+        int metric, int method, uint32_t max_distance, int check_overflow, size_t num_threads);
+    CFFI_DLLEXPORT int grassfire_update(uint32_t* dist, const uint8_t* mask,
+        ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+        const int32_t* pixels, size_t num_pixels,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int metric, size_t* updates);
+    CFFI_DLLEXPORT int grassfire3d(uint32_t* dst, const uint8_t* volume,
+        size_t width, size_t height, size_t depth, int connectivity, int method, size_t num_threads);
+}
+
+/**
+ * Distance metrics. Keep in sync with GrassfireMetric in grassfire.py
+ */
+enum GrassfireMetric {
+    GRASSFIRE_CITYBLOCK = 0,
+    GRASSFIRE_CHESSBOARD = 1,
+    GRASSFIRE_EUCLIDEAN = 2
+};
+
+/**
+ * Methods. Keep in sync with GrassfireMethod in grassfire.py
+ */
+enum GrassfireMethod {
+    GRASSFIRE_TWO_PASS = 0,
+    GRASSFIRE_SEPARABLE = 1
+};
+
+/**
+ * Output dtypes. Keep in sync with _grassfire_dtypes in grassfire.py
+ */
+enum GrassfireDtype {
+    GRASSFIRE_UINT8 = 0,
+    GRASSFIRE_UINT16 = 1,
+    GRASSFIRE_UINT32 = 2,
+    GRASSFIRE_FLOAT32 = 3
+};
+
+/**
+ * Return code if a distance does not fit into the output dtype
+ */
+#define GRASSFIRE_OVERFLOW -4
+
+/**
+ * Common parameters of the grassfire implementations
+ */
+struct GrassfireParams {
+    const uint8_t* mask;
+    ptrdiff_t mask_row_stride, mask_pixel_stride;
+    size_t width; // of dst
+    size_t roi_x, roi_y, w, h;
+    uint32_t cap; // Maximum output value
+    bool check; // Report distances > cap as overflow instead of saturating
+    size_t num_threads;
+
+    const uint8_t* mask_row(size_t y) const {
+        return mask + (ptrdiff_t)(y + roi_y) * mask_row_stride + (ptrdiff_t)roi_x * mask_pixel_stride;
+    }
+
+    template<typename T>
+    T* dst_row(T* dst, size_t y) const {
+        return dst + width * (y + roi_y) + roi_x;
+    }
+};
+
+/**
+ * Two-pass grassfire transform for the city-block (4-connected)
+ * or chessboard (8-connected) metric.
+ * Both passes traverse the image row by row so all memory accesses
+ * are sequential. Neighbours outside the ROI count as background.
+ * Values are capped at p.cap while propagating, which yields exactly
+ * min(distance, cap), so narrow output dtypes can be used directly.
+ *
+ * Returns true if p.check is set and a distance exceeds p.cap.
+ */
+template<bool chessboard, typename T>
+static bool grassfire_two_pass(T* dst, const GrassfireParams& p) {
+    const T cap = (T)p.cap;
+    const T one = min((T)1, cap);
+    // 1st pass: top to bottom, left to right
+    for (size_t y = 0; y < p.h; ++y) {
+        const uint8_t* maskrow = p.mask_row(y);
+        T* row = p.dst_row(dst, y);
+        const T* above = row - p.width; // Only valid if y > 0
+        for (size_t x = 0; x < p.w; ++x) {
+            if (maskrow[(ptrdiff_t)x * p.mask_pixel_stride] == 0) {
+                row[x] = 0;
+                continue;
+            }
+            if (y == 0) { // North is outside of the ROI
+                row[x] = one;
+                continue;
+            }
+            T west = (x == 0) ? 0 : row[x - 1];
+            T best = min(west, above[x]);
+            if (chessboard) {
+                T northwest = (x == 0) ? 0 : above[x - 1];
+                T northeast = (x == p.w - 1) ? 0 : above[x + 1];
+                best = min(best, min(northwest, northeast));
+            }
+            row[x] = (best < cap) ? (T)(best + 1) : cap;
+        }
+    }
+    // 2nd pass: bottom to top, right to left
+    for (size_t y = p.h; y-- > 0;) {
+        T* row = p.dst_row(dst, y);
+        const T* below = row + p.width; // Only valid if y < h - 1
+        for (size_t x = p.w; x-- > 0;) {
+            if (row[x] <= 1) { // Background or next to the border
+                continue;
+            }
+            if (y == p.h - 1) { // South is outside of the ROI
+                row[x] = 1;
+                continue;
+            }
+            T east = (x == p.w - 1) ? 0 : row[x + 1];
+            T best = min(east, below[x]);
+            if (chessboard) {
+                T southwest = (x == 0) ? 0 : below[x - 1];
+                T southeast = (x == p.w - 1) ? 0 : below[x + 1];
+                best = min(best, min(southwest, southeast));
+            }
+            if (best + 1 < row[x]) {
+                row[x] = (T)(best + 1);
+            }
+        }
+    }
+    if (!p.check) {
+        return false;
+    }
+    /**
+     * Every foreground pixel has a neighbour whose distance is one less.
+     * Hence the true distance of a pixel at the cap exceeds the cap
+     * if and only if none of its neighbours is below the cap.
+     */
+    for (size_t y = 1; y + 1 < p.h; ++y) {
+        const T* row = p.dst_row(dst, y);
+        const T* above = row - p.width;
+        const T* below = row + p.width;
+        for (size_t x = 1; x + 1 < p.w; ++x) {
+            if (row[x] != cap || row[x - 1] < cap || row[x + 1] < cap
+                    || above[x] < cap || below[x] < cap) {
+                continue;
+            }
+            if (!chessboard || (above[x - 1] == cap && above[x + 1] == cap
+                    && below[x - 1] == cap && below[x + 1] == cap)) {
+                return true;
+            }
+        }
+    }
+    return false;
+}
+
+/**
+ * 1D distance transforms along a row for the separable grassfire transform.
+ * g[0 .. n - 1] are the vertical distances of the row to the nearest
+ * background pixel. g[0] and g[n - 1] are the background pixels
+ * outside of the ROI.
+ *
+ * Chessboard & Euclidean compute the lower envelope of
+ * f(x, i) = dist(x, i) (+) g(i) using the algorithm by
+ * Meijster, Roerdink & Hesselink (2000) with exact integer arithmetic.
+ * squared is true if the result is the squared distance.
+ */
+struct CityblockRow {
+    static const bool squared = false;
+
+    static void transform(const int64_t* g, int64_t* out, size_t* /*s*/, size_t* /*t*/, size_t n) {
+        out[0] = 0;
+        for (size_t x = 1; x < n; ++x) {
+            out[x] = min(g[x], out[x - 1] + 1);
+        }
+        for (size_t x = n - 1; x-- > 0;) {
+            out[x] = min(out[x], out[x + 1] + 1);
+        }
+    }
+};
+
+template<typename Metric>
+struct EnvelopeRow {
+    static const bool squared = Metric::squared;
+
+    static void transform(const int64_t* g, int64_t* out, size_t* s, size_t* t, size_t n) {
+        ptrdiff_t q = 0;
+        s[0] = 0;
+        t[0] = 0;
+        for (size_t u = 1; u < n; ++u) {
+            while (q >= 0 && Metric::f(t[q], s[q], g) > Metric::f(t[q], u, g)) {
+                q--;
+            }
+            if (q < 0) {
+                q = 0;
+                s[0] = u;
+            } else {
+                int64_t sep = 1 + Metric::sep(s[q], u, g);
+                if (sep < (int64_t)n) {
+                    q++;
+                    s[q] = u;
+                    t[q] = (size_t)sep;
+                }
+            }
+        }
+        for (size_t u = n; u-- > 0;) {
+            out[u] = Metric::f(u, s[q], g);
+            if (u == t[q]) {
+                q--;
+            }
+        }
+    }
+};
+
+struct ChessboardMetric {
+    static const bool squared = false;
+
+    static int64_t f(int64_t x, int64_t i, const int64_t* g) {
+        return max(x > i ? x - i : i - x, g[i]);
+    }
+    static int64_t sep(int64_t i, int64_t u, const int64_t* g) {
+        if (g[i] <= g[u]) {
+            return max(i + g[u], (i + u) / 2);
+        }
+        return min(u - g[i], (i + u) / 2);
+    }
+};
+
+struct EuclideanMetric {
+    static const bool squared = true;
+
+    static int64_t f(int64_t x, int64_t i, const int64_t* g) {
+        return (x - i) * (x - i) + g[i] * g[i];
+    }
+    static int64_t sep(int64_t i, int64_t u, const int64_t* g) {
+        return (u * u - i * i + g[u] * g[u] - g[i] * g[i]) / (2 * (u - i));
+    }
+};
+
+/**
+ * Store a distance computed by a Row transform, limited to p.cap.
+ * Euclidean distances are rounded for integer dtypes.
+ * Returns false if p.check is set and the distance exceeds p.cap.
+ */
+template<typename T>
+static inline bool store_distance(T* dst, int64_t value, bool squared, const GrassfireParams& p) {
+    if (squared) {
+        value = (int64_t)floor(sqrt((double)value) + 0.5);
+    }
+    if (value > (int64_t)p.cap) {
+        if (p.check) {
+            return false;
+        }
+        value = p.cap;
+    }
+    *dst = (T)value;
+    return true;
+}
+
+static inline bool store_distance(float* dst, int64_t value, bool squared, const GrassfireParams& p) {
+    double distance = squared ? sqrt((double)value) : (double)value;
+    *dst = (float)min(distance, (double)p.cap);
+    return true;
+}
+
+/**
+ * Unsigned integer type with the same size as T,
+ * used to store the vertical distances in the output array
+ */
+template<typename T> struct SameSizeUnsigned { typedef T type; };
+template<> struct SameSizeUnsigned<float> { typedef uint32_t type; };
+
+/**
+ * Separable grassfire transform, built from independent 1D passes:
+ *
+ * 1. For every pixel, compute the vertical distance g to the nearest
+ *    background pixel in its column. The columns are split between
+ *    the threads, every thread sweeps down & up over the rows of its
+ *    columns, so memory is still accessed row by row.
+ * 2. For every row, compute the 1D distance transform of g.
+ *    The rows are split between the threads.
+ *
+ * g is capped at gcap, which yields exactly min(distance, gcap).
+ * It is stored in gbase (row stride gstride) and read back into
+ * per-thread scratch buffers in phase 2, before the row is overwritten.
+ * Pixels outside the ROI count as background.
+ * Returns true if p.check is set and a distance exceeds p.cap.
+ * Throws std::bad_alloc if memory allocation failed.
+ */
+template<typename Row, typename T, typename G>
+static bool grassfire_separable_rows(T* dst, G* gbase, size_t gstride, G gcap, const GrassfireParams& p) {
+    const size_t w = p.w, h = p.h;
+    // Per-thread scratch: Row with the background columns, output, envelope
+    const size_t n = w + 2;
+    size_t num_threads = max((size_t)1, min(p.num_threads, max(w, h)));
+    std::vector<int64_t> scratch(num_threads * 2 * n);
+    std::vector<size_t> envelope(num_threads * 2 * n);
+    std::atomic<bool> overflow(false);
+    Barrier barrier;
+    run_threads(num_threads, [&](size_t index, size_t count) {
+        // Phase 1: Vertical distances of this thread's columns
+        size_t x0 = w * index / count, x1 = w * (index + 1) / count;
+        for (size_t y = 0; y < h; ++y) {
+            const uint8_t* maskrow = p.mask_row(y);
+            G* grow = gbase + gstride * y;
+            const G* above = grow - gstride; // Only valid if y > 0
+            for (size_t x = x0; x < x1; ++x) {
+                bool foreground = maskrow[(ptrdiff_t)x * p.mask_pixel_stride] != 0;
+                if (!foreground) {
+                    grow[x] = 0;
+                } else if (y == 0) { // North is outside of the ROI
+                    grow[x] = min((G)1, gcap);
+                } else {
+                    grow[x] = (above[x] < gcap) ? (G)(above[x] + 1) : gcap;
+                }
+            }
+        }
+        for (size_t y = h; y-- > 0;) {
+            G* grow = gbase + gstride * y;
+            const G* below = grow + gstride; // Only valid if y < h - 1
+            for (size_t x = x0; x < x1; ++x) {
+                // The last row is next to the background below the ROI
+                G next = (y == h - 1) ? 0 : below[x];
+                if (next + 1 < grow[x]) {
+                    grow[x] = (G)(next + 1);
+                }
+            }
+        }
+        // All columns must be done before any row is transformed
+        barrier.wait();
+        // Phase 2: 1D transform of this thread's rows
+        int64_t* g = &scratch[index * 2 * n];
+        int64_t* out = g + n;
+        size_t* s = &envelope[index * 2 * n];
+        size_t* t = s + n;
+        size_t y0 = h * index / count, y1 = h * (index + 1) / count;
+        for (size_t y = y0; y < y1 && !overflow; ++y) {
+            const G* grow = gbase + gstride * y;
+            G value;
+            g[0] = g[n - 1] = 0;
+            for (size_t x = 0; x < w; ++x) {
+                // memcpy since grow may alias the output row of a different type
+                memcpy(&value, grow + x, sizeof(G));
+                g[x + 1] = value;
+            }
+            Row::transform(g, out, s, t, n);
+            T* row = p.dst_row(dst, y);
+            for (size_t x = 0; x < w; ++x) {
+                if (!store_distance(row + x, out[x + 1], Row::squared, p)) {
+                    overflow = true;
+                    break;
+                }
+            }
+        }
+    }, &barrier);
+    return overflow;
+}
+
+template<typename Row, typename T>
+static bool grassfire_separable(T* dst, const GrassfireParams& p) {
+    if (p.w == 0 || p.h == 0) {
+        return false;
+    }
+    typedef typename SameSizeUnsigned<T>::type G;
+    // One more than the cap to detect overflows
+    uint64_t gcap = min((uint64_t)p.cap + (p.check ? 1 : 0), (uint64_t)INT32_MAX);
+    if (gcap <= std::numeric_limits<G>::max()) {
+        // Store g in the output array
+        G* gbase = (G*)p.dst_row(dst, 0);
+        return grassfire_separable_rows<Row>(dst, gbase, p.width, (G)gcap, p);
+    }
+    std::vector<uint32_t> g(p.w * p.h);
+    return grassfire_separable_rows<Row>(dst, g.data(), p.w, (uint32_t)gcap, p);
+}
+
+/**
+ * Grassfire transform with output type T
+ */
+template<typename T>
+static int grassfire_typed(T* dst, int metric, int method, GrassfireParams p) {
+    // Distances which don't fit into T saturate or overflow
+    uint32_t dtype_max = std::numeric_limits<T>::is_integer ?
+        (uint32_t)std::numeric_limits<T>::max() : UINT32_MAX;
+    p.check = p.check && p.cap > dtype_max;
+    p.cap = min(p.cap, dtype_max);
+    if (method != GRASSFIRE_TWO_PASS && method != GRASSFIRE_SEPARABLE) {
+        return -3;
+    }
+    bool separable = (method == GRASSFIRE_SEPARABLE);
+    bool overflow;
+    switch (metric) {
+        case GRASSFIRE_CITYBLOCK:
+            overflow = separable ? grassfire_separable<CityblockRow>(dst, p)
+                : grassfire_two_pass<false>(dst, p);
+            break;
+        case GRASSFIRE_CHESSBOARD:
+            overflow = separable ? grassfire_separable<EnvelopeRow<ChessboardMetric> >(dst, p)
+                : grassfire_two_pass<true>(dst, p);
+            break;
+        case GRASSFIRE_EUCLIDEAN: // Can only be computed using the separable method
+            overflow = grassfire_separable<EnvelopeRow<EuclideanMetric> >(dst, p);
+            break;
+        default:
+            return -3;
+    }
+    return overflow ? GRASSFIRE_OVERFLOW : 0;
 }
 
 /**
  * Fast C implementation of the grassfire algorithm.
- * Takes a destination counter array (must be zero-initialized)
+ * Takes a destination distance array (need not be initialized)
+ * of the given dtype (see GrassfireDtype)
  * and a binary mask array (checked for != 0).
+ * The mask is accessed using the given strides (in elements),
+ * so views of larger arrays can be used without copying.
+ *
+ * metric selects the city-block (4-connected), chessboard (8-connected)
+ * or exact Euclidean distance, method the two-pass or the
+ * (parallel, using num_threads threads) separable algorithm.
+ * The Euclidean distance always uses the separable algorithm.
+ *
+ * Distances are limited to max_distance and to the maximum value of
+ * the dtype. If check_overflow is set, GRASSFIRE_OVERFLOW is returned
+ * if a distance below max_distance doesn't fit into the dtype.
+ *
+ * Only the region of interest (roi_x, roi_y, roi_width, roi_height)
+ * is processed, pixels outside of it are treated as background
+ * and dst is not modified outside of it.
+ * Returns -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int grassfire(void* dst, int dtype, const uint8_t* mask,
+        ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+        int metric, int method, uint32_t max_distance, int check_overflow, size_t num_threads) {
+    if (roi_x > width || roi_width > width - roi_x || roi_y > height || roi_height > height - roi_y) {
+        return -2;
+    }
+    GrassfireParams p;
+    p.mask = mask;
+    p.mask_row_stride = mask_row_stride;
+    p.mask_pixel_stride = mask_pixel_stride;
+    p.width = width;
+    p.roi_x = roi_x;
+    p.roi_y = roi_y;
+    p.w = roi_width;
+    p.h = roi_height;
+    p.cap = max_distance;
+    p.check = check_overflow != 0;
+    p.num_threads = num_threads;
+    try {
+        switch (dtype) {
+            case GRASSFIRE_UINT8:
+                return grassfire_typed((uint8_t*)dst, metric, method, p);
+            case GRASSFIRE_UINT16:
+                return grassfire_typed((uint16_t*)dst, metric, method, p);
+            case GRASSFIRE_UINT32:
+                return grassfire_typed((uint32_t*)dst, metric, method, p);
+            case GRASSFIRE_FLOAT32:
+                return grassfire_typed((float*)dst, metric, method, p);
+            default:
+                return -3;
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+}
+
+/**
+ * Incremental update of a city-block or chessboard grassfire map
+ * after some mask pixels changed.
+ *
+ * The previous mask is known from the distance map (background <=> 0),
+ * so only the changed pixels are required:
+ *
+ * 1. Raise: Pixels that became foreground are no longer sources.
+ *    Every pixel whose distance was derived from them (i.e. which has
+ *    no neighbour with a distance one less anymore) is invalidated,
+ *    recursively.
+ * 2. Lower: Starting from the pixels that became background and the
+ *    border of the invalidated region, propagate the distances using
+ *    a bucket queue (all steps have unit cost).
+ *
+ * Only the affected wavefront is visited, so the cost is proportional
+ * to the number of pixels whose distance changes.
+ */
+template<bool chessboard>
+class GrassfireUpdater {
+public:
+    GrassfireUpdater(uint32_t* dist, const uint8_t* mask,
+            ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height)
+        : dist(dist), mask(mask), mask_row_stride(mask_row_stride),
+          mask_pixel_stride(mask_pixel_stride), width(width), height(height), updates(0) {}
+
+    /**
+     * Register a possibly changed pixel. Unchanged pixels are ignored.
+     */
+    void add(size_t x, size_t y) {
+        size_t idx = x + width * y;
+        bool foreground = IMG_STRIDED_XY(mask, x, y, mask_row_stride, mask_pixel_stride) != 0;
+        if (foreground && dist[idx] == 0) {
+            // Not a source anymore
+            raise.push_back(RaisedPixel(idx, 0));
+            invalidate(idx);
+        } else if (!foreground && dist[idx] != 0) {
+            // New source
+            newSources.push_back(idx);
+        }
+    }
+
+    void run() {
+        // 1. Raise
+        while (!raise.empty()) {
+            RaisedPixel p = raise.back();
+            raise.pop_back();
+            size_t neighbours[8];
+            size_t count = get_neighbours(p.idx, neighbours);
+            for (size_t i = 0; i < count; i++) {
+                size_t q = neighbours[i];
+                // Was q (possibly) supported by p?
+                if (dist[q] == p.dist + 1 && !has_support(q)) {
+                    raise.push_back(RaisedPixel(q, dist[q]));
+                    invalidate(q);
+                }
+            }
+        }
+        // 2. Lower
+        for (size_t i = 0; i < newSources.size(); i++) {
+            dist[newSources[i]] = 0;
+            updates++;
+            push(0, newSources[i]);
+        }
+        for (size_t i = 0; i < invalidated.size(); i++) {
+            size_t idx = invalidated[i];
+            if (dist[idx] == 0 || !is_foreground(idx)) {
+                continue;
+            }
+            uint32_t best = lowest_neighbour(idx);
+            if (best != UINT32_MAX) {
+                dist[idx] = best + 1;
+                push(best + 1, idx);
+            }
+        }
+        for (size_t d = 0; d < buckets.size(); d++) {
+            // Buckets may be appended while iterating
+            for (size_t i = 0; i < buckets[d].size(); i++) {
+                size_t p = buckets[d][i];
+                if (dist[p] != d) { // Already lowered further
+                    continue;
+                }
+                size_t neighbours[8];
+                size_t count = get_neighbours(p, neighbours);
+                for (size_t j = 0; j < count; j++) {
+                    size_t q = neighbours[j];
+                    if (dist[q] > d + 1 && is_foreground(q)) {
+                        dist[q] = (uint32_t)(d + 1);
+                        updates++;
+                        push(d + 1, q);
+                    }
+                }
+            }
+            std::vector<size_t>().swap(buckets[d]);
+        }
+    }
+
+    uint32_t* dist;
+    const uint8_t* mask;
+    ptrdiff_t mask_row_stride, mask_pixel_stride;
+    size_t width, height;
+    size_t updates;
+
+private:
+    struct RaisedPixel {
+        RaisedPixel(size_t idx, uint32_t dist) : idx(idx), dist(dist) {}
+        size_t idx;
+        uint32_t dist; // Before it was invalidated
+    };
+    std::vector<RaisedPixel> raise;
+    std::vector<size_t> invalidated;
+    std::vector<size_t> newSources;
+    std::vector<std::vector<size_t> > buckets;
+
+    bool is_foreground(size_t idx) const {
+        return IMG_STRIDED_XY(mask, idx % width, idx / width, mask_row_stride, mask_pixel_stride) != 0;
+    }
+
+    bool on_border(size_t idx) const {
+        size_t x = idx % width, y = idx / width;
+        return x == 0 || y == 0 || x == width - 1 || y == height - 1;
+    }
+
+    void invalidate(size_t idx) {
+        dist[idx] = UINT32_MAX;
+        invalidated.push_back(idx);
+        updates++;
+    }
+
+    void push(size_t d, size_t idx) {
+        if (buckets.size() <= d) {
+            buckets.resize(d + 1);
+        }
+        buckets[d].push_back(idx);
+    }
+
+    /**
+     * Store the indices of the (4 or 8) neighbours inside the image
+     * in neighbours and return their count
+     */
+    size_t get_neighbours(size_t idx, size_t* neighbours) const {
+        size_t x = idx % width, y = idx / width;
+        size_t count = 0;
+        for (int dy = -1; dy <= 1; dy++) {
+            for (int dx = -1; dx <= 1; dx++) {
+                if ((dx == 0 && dy == 0) || (!chessboard && dx != 0 && dy != 0)) {
+                    continue;
+                }
+                // Unsigned wrap-around makes x - 1 at x = 0 huge
+                size_t nx = x + dx, ny = y + dy;
+                if (nx < width && ny < height) {
+                    neighbours[count++] = nx + width * ny;
+                }
+            }
+        }
+        return count;
+    }
+
+    /**
+     * Lowest distance of any valid neighbour.
+     * Pixels outside the image are background.
+     */
+    uint32_t lowest_neighbour(size_t idx) const {
+        if (on_border(idx)) {
+            return 0;
+        }
+        size_t neighbours[8];
+        size_t count = get_neighbours(idx, neighbours);
+        uint32_t best = UINT32_MAX;
+        for (size_t i = 0; i < count; i++) {
+            best = min(best, dist[neighbours[i]]);
+        }
+        return best;
+    }
+
+    /**
+     * Does the pixel still have a neighbour with a distance one less?
+     */
+    bool has_support(size_t idx) const {
+        uint32_t d = dist[idx];
+        return d == 0 || lowest_neighbour(idx) == d - 1;
+    }
+};
+
+template<bool chessboard>
+static size_t grassfire_update_pixels(uint32_t* dist, const uint8_t* mask,
+        ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+        const int32_t* pixels, size_t num_pixels,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height) {
+    GrassfireUpdater<chessboard> updater(dist, mask, mask_row_stride, mask_pixel_stride, width, height);
+    if (pixels != NULL) {
+        for (size_t i = 0; i < num_pixels; i++) {
+            updater.add(pixels[2 * i + 1], pixels[2 * i]);
+        }
+    } else {
+        for (size_t y = roi_y; y < roi_y + roi_height; y++) {
+            for (size_t x = roi_x; x < roi_x + roi_width; x++) {
+                updater.add(x, y);
+            }
+        }
+    }
+    updater.run();
+    return updater.updates;
+}
+
+/**
+ * Incrementally update a city-block or chessboard distance map dist
+ * (as computed by grassfire() without ROI & max_distance) for the
+ * modified mask. The result is identical to recomputing it.
+ *
+ * The changed pixels are either given as num_pixels (y, x) pairs
+ * or, if pixels is NULL, all pixels in the region
+ * (roi_x, roi_y, roi_width, roi_height) are checked.
+ * The number of distance values that were updated is stored in
+ * updates (if not NULL).
+ * Returns -1 if memory allocation failed.
  */
-CFFI_DLLEXPORT int grassfire(uint32_t* dst, const uint8_t* mask, int width, int height) {
-    // 1st pass
-    for (int x = 0; x < width; ++x) {
-        for (int y = 0; y < height; ++y) {
-            if (IMG_XY(mask, x, y) != 0) { // Pixel in contour
-                // Get neighbors
-                int north = (y == 0) ? 0 : IMG_XY(dst, x, y - 1);
-                int west = (x == 0) ? 0 : IMG_XY(dst, x - 1, y);
-                // Set value
-                IMG_XY(dst, x, y) = 1 + min(north, west);
-            }
-        }
-    }
-    // 2nd pass
-    for (int x = width - 1; x >= 0; x--) {
-        for (int y = height - 1; y >= 0; y--) {
-            if (IMG_XY(mask, x, y) != 0) { // Pixel in contour
-                // Get neighbors
-                uint32_t south = (y == (height - 1)) ?
-                    0 : IMG_XY(dst, x, y + 1);
-                uint32_t east = (x == (width - 1)) ?
-                    0 : IMG_XY(dst, x + 1, y);
-                // Set value
-                IMG_XY(dst, x, y) = min(IMG_XY(dst, x, y),
-                    1 + min(south, east));
+CFFI_DLLEXPORT int grassfire_update(uint32_t* dist, const uint8_t* mask,
+        ptrdiff_t mask_row_stride, ptrdiff_t mask_pixel_stride, size_t width, size_t height,
+        const int32_t* pixels, size_t num_pixels,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int metric, size_t* updates) {
+    if (roi_x > width || roi_width > width - roi_x || roi_y > height || roi_height > height - roi_y) {
+        return -2;
+    }
+    for (size_t i = 0; pixels != NULL && i < num_pixels; i++) {
+        int32_t y = pixels[2 * i], x = pixels[2 * i + 1];
+        if (x < 0 || y < 0 || (size_t)x >= width || (size_t)y >= height) {
+            return -2;
+        }
+    }
+    try {
+        size_t count;
+        if (metric == GRASSFIRE_CITYBLOCK) {
+            count = grassfire_update_pixels<false>(dist, mask, mask_row_stride, mask_pixel_stride,
+                width, height, pixels, num_pixels, roi_x, roi_y, roi_width, roi_height);
+        } else if (metric == GRASSFIRE_CHESSBOARD) {
+            count = grassfire_update_pixels<true>(dist, mask, mask_row_stride, mask_pixel_stride,
+                width, height, pixels, num_pixels, roi_x, roi_y, roi_width, roi_height);
+        } else {
+            return -3;
+        }
+        if (updates != NULL) {
+            *updates = count;
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+/**
+ * Two-pass 3D grassfire transform for 6-, 18- or 26-connectivity.
+ * The first pass visits the voxels in memory order and uses the
+ * neighbours that have already been visited, the second pass
+ * uses the other half of the neighbourhood in reverse order.
+ * Voxels outside the volume are background.
+ */
+static void grassfire3d_two_pass(uint32_t* dst, const uint8_t* volume,
+        size_t width, size_t height, size_t depth, int connectivity) {
+    // Offsets of the neighbours visited before the current voxel
+    ptrdiff_t offsets[13];
+    int dxs[13], dys[13], dzs[13];
+    size_t count = 0;
+    for (int dz = -1; dz <= 0; dz++) {
+        for (int dy = -1; dy <= 1; dy++) {
+            for (int dx = -1; dx <= 1; dx++) {
+                if (dz == 0 && (dy > 0 || (dy == 0 && dx >= 0))) {
+                    continue; // Not visited before
+                }
+                int nonzero = (dx != 0) + (dy != 0) + (dz != 0);
+                if ((connectivity == 6 && nonzero > 1) || (connectivity == 18 && nonzero > 2)) {
+                    continue;
+                }
+                dxs[count] = dx;
+                dys[count] = dy;
+                dzs[count] = dz;
+                offsets[count] = dx + (ptrdiff_t)width * (dy + (ptrdiff_t)height * dz);
+                count++;
             }
         }
     }
+    // 1st pass: Forward, 2nd pass: Backward with mirrored offsets
+    for (int pass = 0; pass < 2; pass++) {
+        int sign = (pass == 0) ? 1 : -1;
+        for (size_t i = 0; i < depth; i++) {
+            size_t z = (pass == 0) ? i : depth - 1 - i;
+            bool z_inside = z > 0 && z + 1 < depth;
+            for (size_t j = 0; j < height; j++) {
+                size_t y = (pass == 0) ? j : height - 1 - j;
+                bool zy_inside = z_inside && y > 0 && y + 1 < height;
+                size_t offset = (z * height + y) * width;
+                for (size_t k = 0; k < width; k++) {
+                    size_t x = (pass == 0) ? k : width - 1 - k;
+                    size_t idx = offset + x;
+                    if (volume[idx] == 0) {
+                        dst[idx] = 0;
+                        continue;
+                    }
+                    uint32_t best = UINT32_MAX;
+                    if (zy_inside && x > 0 && x + 1 < width) {
+                        for (size_t n = 0; n < count; n++) {
+                            best = min(best, dst[idx + sign * offsets[n]]);
+                        }
+                    } else {
+                        for (size_t n = 0; n < count; n++) {
+                            // Unsigned wrap-around makes x - 1 at x = 0 huge
+                            size_t nx = x + sign * dxs[n], ny = y + sign * dys[n], nz = z + sign * dzs[n];
+                            if (nx >= width || ny >= height || nz >= depth) {
+                                best = 0; // Outside of the volume
+                                break;
+                            }
+                            best = min(best, dst[idx + sign * offsets[n]]);
+                        }
+                    }
+                    dst[idx] = (pass == 0) ? best + 1 : min(dst[idx], best + 1);
+                }
+            }
+        }
+    }
+}
+
+/**
+ * Separable 3D grassfire transform for 6-connectivity (city-block) or
+ * 26-connectivity (chessboard): 1D transforms along z, then along y
+ * and x. The z pass is split between the threads by rows, the y and x
+ * passes by planes.
+ * Throws std::bad_alloc if memory allocation failed.
+ */
+template<typename Row>
+static void grassfire3d_separable(uint32_t* dst, const uint8_t* volume,
+        size_t width, size_t height, size_t depth, size_t num_threads) {
+    const size_t plane = width * height;
+    const size_t n = max(width, max(height, depth)) + 2;
+    num_threads = max((size_t)1, min(num_threads, max(height, depth)));
+    std::vector<int64_t> scratch(num_threads * 2 * n);
+    std::vector<size_t> envelope(num_threads * 2 * n);
+    Barrier barrier;
+    run_threads(num_threads, [&](size_t index, size_t count) {
+        // Pass 1: Distance along z for this thread's rows
+        size_t y0 = height * index / count, y1 = height * (index + 1) / count;
+        for (size_t z = 0; z < depth; z++) {
+            for (size_t y = y0; y < y1; y++) {
+                size_t offset = z * plane + y * width;
+                for (size_t x = 0; x < width; x++) {
+                    dst[offset + x] = (volume[offset + x] == 0) ? 0
+                        : (z == 0) ? 1 : dst[offset + x - plane] + 1;
+                }
+            }
+        }
+        for (size_t z = depth; z-- > 0;) {
+            for (size_t y = y0; y < y1; y++) {
+                size_t offset = z * plane + y * width;
+                for (size_t x = 0; x < width; x++) {
+                    uint32_t next = (z == depth - 1) ? 0 : dst[offset + x + plane];
+                    dst[offset + x] = min(dst[offset + x], next + 1);
+                }
+            }
+        }
+        // All columns along z must be done before the planes are transformed
+        barrier.wait();
+        int64_t* g = &scratch[index * 2 * n];
+        int64_t* out = g + n;
+        size_t* s = &envelope[index * 2 * n];
+        size_t* t = s + n;
+        size_t z0 = depth * index / count, z1 = depth * (index + 1) / count;
+        for (size_t z = z0; z < z1; z++) {
+            uint32_t* p = dst + z * plane;
+            // Pass 2: Along y
+            for (size_t x = 0; x < width; x++) {
+                g[0] = g[height + 1] = 0;
+                for (size_t y = 0; y < height; y++) {
+                    g[y + 1] = p[x + y * width];
+                }
+                Row::transform(g, out, s, t, height + 2);
+                for (size_t y = 0; y < height; y++) {
+                    p[x + y * width] = (uint32_t)out[y + 1];
+                }
+            }
+            // Pass 3: Along x
+            for (size_t y = 0; y < height; y++) {
+                uint32_t* row = p + y * width;
+                g[0] = g[width + 1] = 0;
+                for (size_t x = 0; x < width; x++) {
+                    g[x + 1] = row[x];
+                }
+                Row::transform(g, out, s, t, width + 2);
+                for (size_t x = 0; x < width; x++) {
+                    row[x] = (uint32_t)out[x + 1];
+                }
+            }
+        }
+    }, &barrier);
+}
+
+/**
+ * 3D grassfire transform of a C-contiguous (depth, height, width)
+ * binary volume (checked for != 0) with 6-, 18- or 26-connectivity.
+ *
+ * method is GRASSFIRE_TWO_PASS or GRASSFIRE_SEPARABLE (using num_threads
+ * threads). 18-connectivity always uses the two-pass method since it
+ * is not separable.
+ * Returns -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int grassfire3d(uint32_t* dst, const uint8_t* volume,
+        size_t width, size_t height, size_t depth, int connectivity, int method, size_t num_threads) {
+    if (connectivity != 6 && connectivity != 18 && connectivity != 26) {
+        return -3;
+    }
+    if (method != GRASSFIRE_TWO_PASS && method != GRASSFIRE_SEPARABLE) {
+        return -3;
+    }
+    if (width == 0 || height == 0 || depth == 0) {
+        return 0;
+    }
+    try {
+        if (method == GRASSFIRE_TWO_PASS || connectivity == 18) {
+            grassfire3d_two_pass(dst, volume, width, height, depth, connectivity);
+        } else if (connectivity == 6) {
+            grassfire3d_separable<CityblockRow>(dst, volume, width, height, depth, num_threads);
+        } else {
+            grassfire3d_separable<EnvelopeRow<ChessboardMetric> >(dst, volume, width, height, depth, num_threads);
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
     return 0;
 }
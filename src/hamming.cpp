@@ -0,0 +1,203 @@
+#include "common.hpp"
+#include "popcount.hpp"
+#include "parallel.hpp"
+#include <stdint.h>
+#include <stddef.h>
+#include <new>
+
+/**
+ * Hamming distances between binary descriptors, e.g. ORB or BRIEF,
+ * stored as rows of row_bytes bytes.
+ *
+ * The work is cache-blocked: A tile of B_TILE_BYTES of b rows is kept
+ * in L1 cache while a block of A_BLOCK_ROWS a rows is compared to it.
+ * The a rows are distributed over the threads, so every thread writes
+ * a separate range of output rows and the result does not depend on
+ * the number of threads.
+ */
+
+//Forward declaration required due to CFFI's requirement to have unmangled symbols
+extern "C" {
+    CFFI_DLLEXPORT int pairwise_hamming(uint32_t* dst, const uint8_t* a, const uint8_t* b,
+        size_t a_rows, size_t b_rows, size_t row_bytes, size_t num_threads);
+    CFFI_DLLEXPORT int hamming_knn(int64_t* indices, uint32_t* distances,
+        const uint8_t* a, const uint8_t* b, size_t a_rows, size_t b_rows, size_t row_bytes,
+        size_t k, uint32_t max_distance, size_t num_threads);
+}
+
+#define B_TILE_BYTES 16384
+#define A_BLOCK_ROWS 64
+
+/**
+ * Hamming distance of two rows. Common descriptor sizes are
+ * given as template parameter N so the loop is fully unrolled.
+ */
+template<typename Policy, size_t N>
+static CV_ALWAYS_INLINE uint32_t row_distance(const uint8_t* p, const uint8_t* q, size_t row_bytes) {
+    return (uint32_t)Policy::hamming(p, q, (N != 0) ? N : row_bytes);
+}
+
+/**
+ * Number of b rows per tile
+ */
+static inline size_t b_tile_rows(size_t row_bytes) {
+    size_t rows = B_TILE_BYTES / row_bytes;
+    return (rows > 0) ? rows : 1;
+}
+
+/**
+ * Distance matrix rows [a0, a1)
+ */
+template<typename Policy, size_t N>
+static CV_ALWAYS_INLINE int pairwise_hamming_sized(uint32_t* dst, const uint8_t* a, const uint8_t* b,
+        size_t a0, size_t a1, size_t b_rows, size_t row_bytes) {
+    size_t tile = b_tile_rows(row_bytes);
+    for (size_t ablock = a0; ablock < a1; ablock += A_BLOCK_ROWS) {
+        size_t aend = (a1 - ablock > A_BLOCK_ROWS) ? ablock + A_BLOCK_ROWS : a1;
+        for (size_t b0 = 0; b0 < b_rows; b0 += tile) {
+            size_t b1 = (b_rows - b0 > tile) ? b0 + tile : b_rows;
+            for (size_t i = ablock; i < aend; ++i) {
+                const uint8_t* arow = a + i * row_bytes;
+                uint32_t* dstrow = dst + i * b_rows;
+                for (size_t j = b0; j < b1; ++j) {
+                    dstrow[j] = row_distance<Policy, N>(arow, b + j * row_bytes, row_bytes);
+                }
+            }
+        }
+    }
+    return 0;
+}
+
+template<typename Policy>
+static CV_ALWAYS_INLINE int pairwise_hamming_kernel(uint32_t* dst, const uint8_t* a, const uint8_t* b,
+        size_t a0, size_t a1, size_t b_rows, size_t row_bytes) {
+    switch (row_bytes) {
+        case 32: return pairwise_hamming_sized<Policy, 32>(dst, a, b, a0, a1, b_rows, row_bytes);
+        case 64: return pairwise_hamming_sized<Policy, 64>(dst, a, b, a0, a1, b_rows, row_bytes);
+        default: return pairwise_hamming_sized<Policy, 0>(dst, a, b, a0, a1, b_rows, row_bytes);
+    }
+}
+
+POPCOUNT_DISPATCH(pairwise_hamming_rows, (pairwise_hamming_kernel<Policy>(args...)))
+
+/**
+ * Compute the (a_rows, b_rows) matrix of Hamming distances between every
+ * row of a and every row of b, using num_threads threads.
+ * a and b are C-contiguous arrays of rows of row_bytes bytes.
+ */
+CFFI_DLLEXPORT int pairwise_hamming(uint32_t* dst, const uint8_t* a, const uint8_t* b,
+        size_t a_rows, size_t b_rows, size_t row_bytes, size_t num_threads) {
+    if (a_rows == 0 || b_rows == 0) {
+        return 0;
+    }
+    if (row_bytes == 0) {
+        return -2;
+    }
+    size_t threads = (num_threads < 1) ? 1 : num_threads;
+    threads = (threads < a_rows) ? threads : a_rows;
+    try {
+        run_threads(threads, [&](size_t index, size_t count) {
+            size_t a0 = a_rows * index / count, a1 = a_rows * (index + 1) / count;
+            pairwise_hamming_rows(dst, a, b, a0, a1, b_rows, row_bytes);
+        });
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+/**
+ * Nearest neighbour rows [a0, a1). Every a row keeps its k best matches
+ * sorted by distance, so the (a_rows, b_rows) matrix is never stored.
+ * Matches with equal distance are sorted by b index.
+ */
+template<typename Policy, size_t N>
+static CV_ALWAYS_INLINE int hamming_knn_sized(int64_t* indices, uint32_t* distances,
+        const uint8_t* a, const uint8_t* b, size_t a0, size_t a1, size_t b_rows, size_t row_bytes,
+        size_t k, uint32_t max_distance) {
+    for (size_t i = a0 * k; i < a1 * k; ++i) {
+        indices[i] = -1;
+        distances[i] = UINT32_MAX;
+    }
+    // Only distances < limit are inserted
+    const uint64_t limit = (uint64_t)max_distance + 1;
+    size_t tile = b_tile_rows(row_bytes);
+    for (size_t ablock = a0; ablock < a1; ablock += A_BLOCK_ROWS) {
+        size_t aend = (a1 - ablock > A_BLOCK_ROWS) ? ablock + A_BLOCK_ROWS : a1;
+        for (size_t b0 = 0; b0 < b_rows; b0 += tile) {
+            size_t b1 = (b_rows - b0 > tile) ? b0 + tile : b_rows;
+            for (size_t i = ablock; i < aend; ++i) {
+                const uint8_t* arow = a + i * row_bytes;
+                int64_t* best_indices = indices + i * k;
+                uint32_t* best = distances + i * k;
+                // Distance of the worst match to beat
+                uint64_t worst = (best[k - 1] < limit) ? best[k - 1] : limit;
+                for (size_t j = b0; j < b1; ++j) {
+                    uint32_t dist = row_distance<Policy, N>(arow, b + j * row_bytes, row_bytes);
+                    if (dist >= worst) {
+                        continue;
+                    }
+                    // Insertion into the sorted list, dropping the worst match
+                    size_t pos = k - 1;
+                    for (; pos > 0 && best[pos - 1] > dist; --pos) {
+                        best[pos] = best[pos - 1];
+                        best_indices[pos] = best_indices[pos - 1];
+                    }
+                    best[pos] = dist;
+                    best_indices[pos] = (int64_t)j;
+                    worst = (best[k - 1] < limit) ? best[k - 1] : limit;
+                }
+            }
+        }
+    }
+    return 0;
+}
+
+template<typename Policy>
+static CV_ALWAYS_INLINE int hamming_knn_kernel(int64_t* indices, uint32_t* distances,
+        const uint8_t* a, const uint8_t* b, size_t a0, size_t a1, size_t b_rows, size_t row_bytes,
+        size_t k, uint32_t max_distance) {
+    switch (row_bytes) {
+        case 32: return hamming_knn_sized<Policy, 32>(indices, distances, a, b, a0, a1, b_rows,
+            row_bytes, k, max_distance);
+        case 64: return hamming_knn_sized<Policy, 64>(indices, distances, a, b, a0, a1, b_rows,
+            row_bytes, k, max_distance);
+        default: return hamming_knn_sized<Policy, 0>(indices, distances, a, b, a0, a1, b_rows,
+            row_bytes, k, max_distance);
+    }
+}
+
+POPCOUNT_DISPATCH(hamming_knn_rows, (hamming_knn_kernel<Policy>(args...)))
+
+/**
+ * Find the k rows of b with the smallest Hamming distance to every row
+ * of a, ignoring distances > max_distance, using num_threads threads.
+ * a and b are C-contiguous arrays of rows of row_bytes bytes.
+ *
+ * The b indices and distances are stored in the (a_rows, k) arrays
+ * indices & distances, sorted by distance. If fewer than k rows match,
+ * the remaining entries are -1 and UINT32_MAX.
+ *
+ * Returns -2 if k or row_bytes is 0.
+ */
+CFFI_DLLEXPORT int hamming_knn(int64_t* indices, uint32_t* distances,
+        const uint8_t* a, const uint8_t* b, size_t a_rows, size_t b_rows, size_t row_bytes,
+        size_t k, uint32_t max_distance, size_t num_threads) {
+    if (k == 0 || row_bytes == 0) {
+        return -2;
+    }
+    if (a_rows == 0) {
+        return 0;
+    }
+    size_t threads = (num_threads < 1) ? 1 : num_threads;
+    threads = (threads < a_rows) ? threads : a_rows;
+    try {
+        run_threads(threads, [&](size_t index, size_t count) {
+            size_t a0 = a_rows * index / count, a1 = a_rows * (index + 1) / count;
+            hamming_knn_rows(indices, distances, a, b, a0, a1, b_rows, row_bytes, k, max_distance);
+        });
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
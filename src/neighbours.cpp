@@ -1,26 +1,68 @@
 #include "common.hpp"
+#include "neighbours.hpp"
 #include <stdlib.h>
 #include <assert.h>
 #include <stdbool.h>
 #include <limits.h>
 #include <string.h>
 #include <stdint.h>
+#include <stddef.h>
+#include <vector>
+#include <new>
 
 
 //Forward declaration required due to CFFI's requirement to have unmangled symbols
 extern "C" {
-    CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src, int width, int height);
+    CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height);
+    CFFI_DLLEXPORT int binary_neighbours_reference(uint8_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height);
+    CFFI_DLLEXPORT int binary_neighbours_histogram(uint64_t* hist, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int foreground_only);
+    CFFI_DLLEXPORT int binary_neighbours_match(size_t* count, int32_t** coords, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+        const uint8_t* codes, int foreground_only);
+    CFFI_DLLEXPORT void binary_neighbours_match_free(int32_t* coords);
+}
+
+/**
+ * Check the ROI, returns true if it is valid
+ */
+static bool check_neighbours_roi(size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height) {
+    return roi_x <= width && roi_width <= width - roi_x
+        && roi_y <= height && roi_height <= height - roi_y;
 }
 
 /**
  * Vincinity direction algorithm
  * Sets bits in the output array based on if the surrounding pixels
  * are zero or non-zero. See the python docs for more info.
+ *
+ * Only pixels in the region of interest (roi_x, roi_y, roi_width, roi_height)
+ * are computed, dst is not modified outside of it.
+ * Neighbours outside the region are taken into account.
+ *
+ * src is accessed using the given strides (in elements),
+ * dst is contiguous.
+ *
+ * This is the straightforward per-pixel reference implementation
+ * of binary_neighbours().
  */
-CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src, int width, int height) {
+CFFI_DLLEXPORT int binary_neighbours_reference(uint8_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height) {
+    if (!check_neighbours_roi(width, height, roi_x, roi_y, roi_width, roi_height)) {
+        return -2;
+    }
+#define SRC_XY(x, y) IMG_STRIDED_XY(src, x, y, src_row_stride, src_pixel_stride)
     // 1st pass
-    for (int x = 0; x < width; ++x) {
-        for (int y = 0; y < height; ++y) {
+    for (size_t x = roi_x; x < roi_x + roi_width; ++x) {
+        for (size_t y = roi_y; y < roi_y + roi_height; ++y) {
             // Are we at the borders?
             bool x0 = (x == 0);
             bool y0 = (y == 0);
@@ -31,14 +73,14 @@ CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src, int width
              * This has been corrected for the coordinate system
              * empirically (also see the unit test)
              */
-            uint8_t north = y0 ? 0 : IMG_XY(src, x, y - 1);
-            uint8_t west = x0 ? 0 : IMG_XY(src, x - 1, y);
-            uint8_t northwest = (x0 || y0) ? 0 : IMG_XY(src, x - 1, y - 1);
-            uint8_t northeast = (xe || y0) ? 0 : IMG_XY(src, x + 1, y - 1);
-            uint8_t east = xe ? 0 : IMG_XY(src, x + 1, y);
-            uint8_t south = ye ? 0 : IMG_XY(src, x, y + 1);
-            uint8_t southwest = (x0 || ye) ? 0 : IMG_XY(src, x - 1, y + 1);
-            uint8_t southeast = (xe || ye) ? 0 : IMG_XY(src, x + 1, y + 1);
+            uint8_t north = y0 ? 0 : SRC_XY(x, y - 1);
+            uint8_t west = x0 ? 0 : SRC_XY(x - 1, y);
+            uint8_t northwest = (x0 || y0) ? 0 : SRC_XY(x - 1, y - 1);
+            uint8_t northeast = (xe || y0) ? 0 : SRC_XY(x + 1, y - 1);
+            uint8_t east = xe ? 0 : SRC_XY(x + 1, y);
+            uint8_t south = ye ? 0 : SRC_XY(x, y + 1);
+            uint8_t southwest = (x0 || ye) ? 0 : SRC_XY(x - 1, y + 1);
+            uint8_t southeast = (xe || ye) ? 0 : SRC_XY(x + 1, y + 1);
             /**
              * Compute value
              * See the chart in the python docs.
@@ -54,5 +96,147 @@ CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src, int width
                 | ((southeast == 0) ? 0 : (1 << 7));
         }
     }
+#undef SRC_XY
+    return 0;
+}
+
+/**
+ * Row-major implementation of binary_neighbours_reference(),
+ * computing 16 pixels at a time where SSE2 is available.
+ *
+ * Returns -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int binary_neighbours(uint8_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height) {
+    if (!check_neighbours_roi(width, height, roi_x, roi_y, roi_width, roi_height)) {
+        return -2;
+    }
+    if (roi_width == 0 || roi_height == 0) {
+        return 0;
+    }
+    try {
+        for_each_neighbours_row(src, src_row_stride, src_pixel_stride, width, height,
+                roi_x, roi_y, roi_width, roi_height,
+                [&](size_t y, const uint8_t* above, const uint8_t* row, const uint8_t* below) {
+            combine_neighbours_rows(&IMG_XY(dst, roi_x, y), above, row, below, roi_width);
+        });
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+/**
+ * Histogram of the binary_neighbours() codes inside the ROI,
+ * without computing the full output array.
+ * hist (256 entries) is overwritten.
+ * If foreground_only is set, only foreground pixels are counted.
+ *
+ * Returns -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int binary_neighbours_histogram(uint64_t* hist, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, int foreground_only) {
+    if (!check_neighbours_roi(width, height, roi_x, roi_y, roi_width, roi_height)) {
+        return -2;
+    }
+    memset(hist, 0, 256 * sizeof(uint64_t));
+    if (roi_width == 0 || roi_height == 0) {
+        return 0;
+    }
+    try {
+        std::vector<uint8_t> codes(roi_width);
+        for_each_neighbours_row(src, src_row_stride, src_pixel_stride, width, height,
+                roi_x, roi_y, roi_width, roi_height,
+                [&](size_t, const uint8_t* above, const uint8_t* row, const uint8_t* below) {
+            combine_neighbours_rows(&codes[0], above, row, below, roi_width);
+            if (foreground_only) {
+                for (size_t i = 0; i < roi_width; i++) {
+                    // row[i + 1] is 0 or 0xFF
+                    hist[codes[i]] += row[i + 1] & 1;
+                }
+            } else {
+                for (size_t i = 0; i < roi_width; i++) {
+                    hist[codes[i]]++;
+                }
+            }
+        });
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+/**
+ * Count the pixels inside the ROI whose binary_neighbours() code c
+ * is selected by codes[c] != 0 (256 entries), without computing the full
+ * output array. If foreground_only is set, only foreground pixels match.
+ *
+ * If coords is not NULL, *coords is set to a malloc()ed array of
+ * the (y, x) coordinates of the matching pixels in raster order, which must
+ * be freed using binary_neighbours_match_free(). *coords is NULL if
+ * there are no matching pixels.
+ *
+ * Returns -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int binary_neighbours_match(size_t* count, int32_t** coords, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height,
+        const uint8_t* codes, int foreground_only) {
+    if (!check_neighbours_roi(width, height, roi_x, roi_y, roi_width, roi_height)) {
+        return -2;
+    }
+    *count = 0;
+    if (coords != NULL) {
+        *coords = NULL;
+    }
+    if (roi_width == 0 || roi_height == 0) {
+        return 0;
+    }
+    // 1 for matching codes. Foreground pixels are 0xFF in the row buffers,
+    // background pixels match if background is 0xFF
+    uint8_t table[256];
+    for (int i = 0; i < 256; i++) {
+        table[i] = (codes[i] != 0);
+    }
+    const uint8_t background = foreground_only ? 0 : 0xFF;
+    try {
+        std::vector<uint8_t> row_codes(roi_width);
+        std::vector<int32_t> found;
+        size_t matches = 0;
+        for_each_neighbours_row(src, src_row_stride, src_pixel_stride, width, height,
+                roi_x, roi_y, roi_width, roi_height,
+                [&](size_t y, const uint8_t* above, const uint8_t* row, const uint8_t* below) {
+            combine_neighbours_rows(&row_codes[0], above, row, below, roi_width);
+            if (coords == NULL) { // Branch-free counting
+                for (size_t i = 0; i < roi_width; i++) {
+                    matches += table[row_codes[i]] & (row[i + 1] | background);
+                }
+                return;
+            }
+            for (size_t i = 0; i < roi_width; i++) {
+                if ((table[row_codes[i]] & (row[i + 1] | background)) != 0) {
+                    matches++;
+                    found.push_back((int32_t)y);
+                    found.push_back((int32_t)(roi_x + i));
+                }
+            }
+        });
+        *count = matches;
+        if (coords != NULL && !found.empty()) {
+            *coords = (int32_t*)malloc(found.size() * sizeof(int32_t));
+            if (*coords == NULL) {
+                return -1;
+            }
+            memcpy(*coords, &found[0], found.size() * sizeof(int32_t));
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
     return 0;
 }
+
+CFFI_DLLEXPORT void binary_neighbours_match_free(int32_t* coords) {
+    free(coords);
+}
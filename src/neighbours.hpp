@@ -0,0 +1,191 @@
+#pragma once
+#include "common.hpp"
+#include "cpu.hpp"
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+#include <vector>
+
+/**
+ * Row-major computation of binary_neighbours() codes,
+ * shared by binary_neighbours(), its reductions and skeleton_points().
+ */
+
+#ifdef CV_ALGORITHMS_DISPATCH
+/**
+ * AVX2 & AVX-512 variants of the vectorized parts of load_neighbours_row()
+ * and combine_neighbours_rows(). They return the number of pixels processed,
+ * the remaining pixels are processed by the SSE2 & scalar code.
+ */
+CV_TARGET_AVX2 static size_t load_neighbours_row_avx2(uint8_t* out, const uint8_t* row, size_t count) {
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i ones = _mm256_set1_epi8((char)0xFF);
+    size_t i = 0;
+    for (; i + 32 <= count; i += 32) {
+        __m256i v = _mm256_loadu_si256((const __m256i*)(row + i));
+        _mm256_storeu_si256((__m256i*)(out + i), _mm256_xor_si256(_mm256_cmpeq_epi8(v, zero), ones));
+    }
+    return i;
+}
+
+CV_TARGET_AVX512 static size_t load_neighbours_row_avx512(uint8_t* out, const uint8_t* row, size_t count) {
+    size_t i = 0;
+    for (; i + 64 <= count; i += 64) {
+        __m512i v = _mm512_loadu_si512(row + i);
+        _mm512_storeu_si512(out + i, _mm512_movm_epi8(_mm512_test_epi8_mask(v, v)));
+    }
+    return i;
+}
+
+CV_TARGET_AVX2 static size_t combine_neighbours_rows_avx2(uint8_t* dst, const uint8_t* above,
+        const uint8_t* row, const uint8_t* below, size_t count) {
+#define LOAD_BIT(ptr, bit) _mm256_and_si256(_mm256_loadu_si256((const __m256i*)(ptr)), _mm256_set1_epi8((char)(1 << (bit))))
+    size_t i = 0;
+    for (; i + 32 <= count; i += 32) {
+        __m256i code = _mm256_or_si256(
+            _mm256_or_si256(
+                _mm256_or_si256(LOAD_BIT(above + i, 0), LOAD_BIT(above + i + 1, 1)),
+                _mm256_or_si256(LOAD_BIT(above + i + 2, 2), LOAD_BIT(row + i, 3))),
+            _mm256_or_si256(
+                _mm256_or_si256(LOAD_BIT(row + i + 2, 4), LOAD_BIT(below + i, 5)),
+                _mm256_or_si256(LOAD_BIT(below + i + 1, 6), LOAD_BIT(below + i + 2, 7))));
+        _mm256_storeu_si256((__m256i*)(dst + i), code);
+    }
+#undef LOAD_BIT
+    return i;
+}
+
+CV_TARGET_AVX512 static size_t combine_neighbours_rows_avx512(uint8_t* dst, const uint8_t* above,
+        const uint8_t* row, const uint8_t* below, size_t count) {
+#define LOAD_BIT(ptr, bit) _mm512_and_si512(_mm512_loadu_si512(ptr), _mm512_set1_epi8((char)(1 << (bit))))
+    size_t i = 0;
+    for (; i + 64 <= count; i += 64) {
+        __m512i code = _mm512_or_si512(
+            _mm512_or_si512(
+                _mm512_or_si512(LOAD_BIT(above + i, 0), LOAD_BIT(above + i + 1, 1)),
+                _mm512_or_si512(LOAD_BIT(above + i + 2, 2), LOAD_BIT(row + i, 3))),
+            _mm512_or_si512(
+                _mm512_or_si512(LOAD_BIT(row + i + 2, 4), LOAD_BIT(below + i, 5)),
+                _mm512_or_si512(LOAD_BIT(below + i + 1, 6), LOAD_BIT(below + i + 2, 7))));
+        _mm512_storeu_si512(dst + i, code);
+    }
+#undef LOAD_BIT
+    return i;
+}
+#endif // CV_ALGORITHMS_DISPATCH
+
+/**
+ * Copy the pixels [x0 - 1, x1 + 1) of row y to buf, setting foreground
+ * pixels to 0xFF and background pixels to 0.
+ * Pixels outside the image are background.
+ */
+static inline void load_neighbours_row(uint8_t* buf, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        ptrdiff_t y, size_t x0, size_t x1) {
+    size_t count = x1 - x0;
+    if (y < 0 || (size_t)y >= height) {
+        memset(buf, 0, count + 2);
+        return;
+    }
+    const uint8_t* row = &IMG_STRIDED_XY(src, x0, y, src_row_stride, src_pixel_stride);
+    buf[0] = (x0 > 0 && row[-src_pixel_stride] != 0) ? 0xFF : 0;
+    buf[count + 1] = (x1 < width && row[(ptrdiff_t)count * src_pixel_stride] != 0) ? 0xFF : 0;
+    uint8_t* out = buf + 1;
+    size_t i = 0;
+    if (src_pixel_stride == 1) {
+#ifdef CV_ALGORITHMS_DISPATCH
+        int level = cpu_feature_level();
+        if (level >= CPU_AVX512) {
+            i = load_neighbours_row_avx512(out, row, count);
+        } else if (level >= CPU_AVX2) {
+            i = load_neighbours_row_avx2(out, row, count);
+        }
+#endif
+#ifdef CV_ALGORITHMS_SSE2
+        const __m128i zero = _mm_setzero_si128();
+        const __m128i ones = _mm_set1_epi8((char)0xFF);
+        for (; i + 16 <= count; i += 16) {
+            __m128i v = _mm_loadu_si128((const __m128i*)(row + i));
+            _mm_storeu_si128((__m128i*)(out + i), _mm_xor_si128(_mm_cmpeq_epi8(v, zero), ones));
+        }
+#endif
+        for (; i < count; i++) {
+            out[i] = (row[i] != 0) ? 0xFF : 0;
+        }
+    } else {
+        for (; i < count; i++) {
+            out[i] = (row[(ptrdiff_t)i * src_pixel_stride] != 0) ? 0xFF : 0;
+        }
+    }
+}
+
+/**
+ * Compute count output pixels from three rows loaded by load_neighbours_row().
+ * Output pixel i depends on pixels i, i + 1 and i + 2 of every row.
+ */
+static inline void combine_neighbours_rows(uint8_t* dst, const uint8_t* above,
+        const uint8_t* row, const uint8_t* below, size_t count) {
+    size_t i = 0;
+#ifdef CV_ALGORITHMS_DISPATCH
+    int level = cpu_feature_level();
+    if (level >= CPU_AVX512) {
+        i = combine_neighbours_rows_avx512(dst, above, row, below, count);
+    } else if (level >= CPU_AVX2) {
+        i = combine_neighbours_rows_avx2(dst, above, row, below, count);
+    }
+#endif
+#ifdef CV_ALGORITHMS_SSE2
+#define LOAD_BIT(ptr, bit) _mm_and_si128(_mm_loadu_si128((const __m128i*)(ptr)), _mm_set1_epi8((char)(1 << (bit))))
+    for (; i + 16 <= count; i += 16) {
+        __m128i code = _mm_or_si128(
+            _mm_or_si128(
+                _mm_or_si128(LOAD_BIT(above + i, 0), LOAD_BIT(above + i + 1, 1)),
+                _mm_or_si128(LOAD_BIT(above + i + 2, 2), LOAD_BIT(row + i, 3))),
+            _mm_or_si128(
+                _mm_or_si128(LOAD_BIT(row + i + 2, 4), LOAD_BIT(below + i, 5)),
+                _mm_or_si128(LOAD_BIT(below + i + 1, 6), LOAD_BIT(below + i + 2, 7))));
+        _mm_storeu_si128((__m128i*)(dst + i), code);
+    }
+#undef LOAD_BIT
+#endif
+    for (; i < count; i++) {
+        dst[i] = (above[i] & (1 << 0)) | (above[i + 1] & (1 << 1)) | (above[i + 2] & (1 << 2))
+            | (row[i] & (1 << 3)) | (row[i + 2] & (1 << 4))
+            | (below[i] & (1 << 5)) | (below[i + 1] & (1 << 6)) | (below[i + 2] & (1 << 7));
+    }
+}
+
+/**
+ * Row-major traversal of the ROI shared by binary_neighbours() and the
+ * reductions based on it.
+ * Every source row of the ROI (plus one row & column of border)
+ * is converted to a 0x00 / 0xFF row buffer with zero padding
+ * outside the image exactly once, so the codes can be computed
+ * from three rows without any bounds checks.
+ *
+ * Calls fn(y, above, row, below) for every row of the ROI,
+ * element i + 1 of the buffers being pixel roi_x + i.
+ * Throws std::bad_alloc if memory allocation failed.
+ */
+template<typename RowFunction>
+static void for_each_neighbours_row(const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t width, size_t height,
+        size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, RowFunction fn) {
+    size_t stride = roi_width + 2;
+    std::vector<uint8_t> buffers(3 * stride);
+    // Rotating row buffers
+    uint8_t* above = &buffers[0];
+    uint8_t* row = above + stride;
+    uint8_t* below = row + stride;
+    size_t x0 = roi_x, x1 = roi_x + roi_width;
+    load_neighbours_row(above, src, src_row_stride, src_pixel_stride, width, height, (ptrdiff_t)roi_y - 1, x0, x1);
+    load_neighbours_row(row, src, src_row_stride, src_pixel_stride, width, height, (ptrdiff_t)roi_y, x0, x1);
+    for (size_t y = roi_y; y < roi_y + roi_height; ++y) {
+        load_neighbours_row(below, src, src_row_stride, src_pixel_stride, width, height, (ptrdiff_t)y + 1, x0, x1);
+        fn(y, above, row, below);
+        uint8_t* tmp = above;
+        above = row;
+        row = below;
+        below = tmp;
+    }
+}
@@ -0,0 +1,81 @@
+#include "packed.hpp"
+#include <stdlib.h>
+#include <assert.h>
+#include <stdbool.h>
+#include <limits.h>
+#include <string.h>
+#include <stdint.h>
+
+// Forward declarations (required due to CFFI's requirement to have unmangled symbols) are in packed.hpp
+
+/**
+ * Pack a binary uint8 image (every non-zero value is foreground)
+ * into 1 bit per pixel. See packed.hpp for the memory layout.
+ */
+CFFI_DLLEXPORT int pack_binary(uint64_t* dst, const uint8_t* src, size_t words_per_row, size_t width, size_t height) {
+    return pack_binary_strided(dst, src, (ptrdiff_t)width, 1, words_per_row, width, height);
+}
+
+/**
+ * Like pack_binary(), but src is accessed using the given strides
+ * (in bytes, may be negative) so views of larger arrays can be packed
+ * without copying them first.
+ */
+CFFI_DLLEXPORT int pack_binary_strided(uint64_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t words_per_row, size_t width, size_t height) {
+    if (words_per_row * 64 < width) {
+        return -2;
+    }
+    for (size_t y = 0; y < height; ++y) {
+        const uint8_t* srcrow = src + (ptrdiff_t)y * src_row_stride;
+        uint64_t* dstrow = dst + words_per_row * y;
+        for (size_t w = 0; w < words_per_row; ++w) {
+            size_t xstart = w * 64;
+            size_t xend = (xstart + 64 < width) ? xstart + 64 : width;
+            uint64_t word = 0;
+            for (size_t x = xstart; x < xend; ++x) {
+                word |= (uint64_t)(srcrow[(ptrdiff_t)x * src_pixel_stride] != 0) << (x - xstart);
+            }
+            dstrow[w] = word;
+        }
+    }
+    return 0;
+}
+
+/**
+ * Unpack a packed binary image (see pack_binary()) to uint8,
+ * setting foreground pixels to value and background pixels to 0.
+ */
+CFFI_DLLEXPORT int unpack_binary(uint8_t* dst, const uint64_t* src, size_t words_per_row, size_t width, size_t height, uint8_t value) {
+    if (words_per_row * 64 < width) {
+        return -2;
+    }
+    for (size_t y = 0; y < height; ++y) {
+        const uint64_t* srcrow = src + words_per_row * y;
+        uint8_t* dstrow = dst + width * y;
+        for (size_t x = 0; x < width; ++x) {
+            dstrow[x] = ((srcrow[x / 64] >> (x % 64)) & 1) ? value : 0;
+        }
+    }
+    return 0;
+}
+
+/**
+ * Set all pixels of the uint8 image that are background in the
+ * packed binary mask to 0. Foreground pixels keep their value.
+ */
+CFFI_DLLEXPORT int apply_packed_binary_mask(uint8_t* img, const uint64_t* mask, size_t words_per_row, size_t width, size_t height) {
+    if (words_per_row * 64 < width) {
+        return -2;
+    }
+    for (size_t y = 0; y < height; ++y) {
+        const uint64_t* maskrow = mask + words_per_row * y;
+        uint8_t* imgrow = img + width * y;
+        for (size_t x = 0; x < width; ++x) {
+            if (!((maskrow[x / 64] >> (x % 64)) & 1)) {
+                imgrow[x] = 0;
+            }
+        }
+    }
+    return 0;
+}
@@ -0,0 +1,24 @@
+#pragma once
+#include "common.hpp"
+#include <stddef.h>
+#include <stdint.h>
+
+/**
+ * Packed binary images store 1 bit per pixel.
+ * Pixel x of row y is stored in bit (x % 64) of word y * words_per_row + x / 64.
+ * Unused bits at the end of each row are always zero.
+ */
+extern "C" {
+    CFFI_DLLEXPORT int pack_binary(uint64_t* dst, const uint8_t* src, size_t words_per_row, size_t width, size_t height);
+    CFFI_DLLEXPORT int pack_binary_strided(uint64_t* dst, const uint8_t* src,
+        ptrdiff_t src_row_stride, ptrdiff_t src_pixel_stride, size_t words_per_row, size_t width, size_t height);
+    CFFI_DLLEXPORT int unpack_binary(uint8_t* dst, const uint64_t* src, size_t words_per_row, size_t width, size_t height, uint8_t value);
+    CFFI_DLLEXPORT int apply_packed_binary_mask(uint8_t* img, const uint64_t* mask, size_t words_per_row, size_t width, size_t height);
+}
+
+/**
+ * Number of 64-bit words required to store a packed row of the given width
+ */
+static inline size_t packed_words_per_row(size_t width) {
+    return (width + 63) / 64;
+}
@@ -0,0 +1,96 @@
+#pragma once
+#include <stddef.h>
+#include <vector>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <system_error>
+#include <new>
+
+/**
+ * Reusable thread barrier (std::barrier is C++20 only).
+ * The last thread to arrive runs the given completion function
+ * before any thread is released.
+ */
+class Barrier {
+public:
+	Barrier() : count(1), waiting(0), generation(0) {}
+
+	void reset(size_t count) {
+		this->count = count;
+		this->waiting = 0;
+	}
+
+	template<typename Completion>
+	void wait(Completion completion) {
+		std::unique_lock<std::mutex> lock(mutex);
+		size_t gen = generation;
+		if (++waiting == count) {
+			completion();
+			waiting = 0;
+			generation++;
+			cond.notify_all();
+		} else {
+			cond.wait(lock, [this, gen] { return gen != generation; });
+		}
+	}
+
+	void wait() {
+		wait([] {});
+	}
+
+private:
+	size_t count;
+	size_t waiting;
+	size_t generation;
+	std::mutex mutex;
+	std::condition_variable cond;
+};
+
+/**
+ * Run fn(index, count) on up to num_threads threads, the calling thread
+ * being index 0, and wait for all of them to finish.
+ *
+ * If fewer threads than requested can be started, count is the number
+ * of threads actually running. No thread calls fn before all threads
+ * have been started, so fn may safely divide the work by count.
+ * If barrier is not NULL, it is reset to count before fn is called.
+ */
+template<typename Function>
+void run_threads(size_t num_threads, Function fn, Barrier* barrier = NULL) {
+	std::mutex mutex;
+	std::condition_variable cond;
+	bool started = false;
+	size_t count = 1;
+	std::vector<std::thread> threads;
+	auto worker = [&](size_t index) {
+		{
+			std::unique_lock<std::mutex> lock(mutex);
+			cond.wait(lock, [&] { return started; });
+		}
+		fn(index, count);
+	};
+	try {
+		threads.reserve(num_threads);
+		for (size_t i = 1; i < num_threads; i++) {
+			threads.emplace_back(worker, i);
+		}
+	} catch (const std::system_error&) {
+		// Continue with the threads we have
+	} catch (const std::bad_alloc&) {
+		// Continue with the threads we have
+	}
+	{
+		std::unique_lock<std::mutex> lock(mutex);
+		count = threads.size() + 1;
+		if (barrier != NULL) {
+			barrier->reset(count);
+		}
+		started = true;
+	}
+	cond.notify_all();
+	fn(0, count);
+	for (size_t i = 0; i < threads.size(); i++) {
+		threads[i].join();
+	}
+}
@@ -1,50 +1,180 @@
 #include "common.hpp"
+#include "popcount.hpp"
 #include <stdlib.h>
 #include <assert.h>
 #include <stdbool.h>
 #include <limits.h>
 #include <string.h>
 #include <stdint.h>
-
-#ifdef _MSC_VER
-#include <intrin.h>
-#define __builtin_popcount __popcnt
-#define __builtin_popcountll __popcnt64
-#endif
+#include <stddef.h>
 
 
 //Forward declaration required due to CFFI's requirement to have unmangled symbols
 extern "C" {
-    CFFI_DLLEXPORT int popcount8(uint8_t* dst, const uint8_t* src, int size);
-    CFFI_DLLEXPORT int popcount16(uint8_t* dst, const uint16_t* src, int size);
-    CFFI_DLLEXPORT int popcount32(uint8_t* dst, const uint32_t* src, int size);
-    CFFI_DLLEXPORT int popcount64(uint8_t* dst, const uint64_t* src, int size);
+    CFFI_DLLEXPORT int popcount8(uint8_t* dst, const uint8_t* src, size_t size);
+    CFFI_DLLEXPORT int popcount16(uint8_t* dst, const uint16_t* src, size_t size);
+    CFFI_DLLEXPORT int popcount32(uint8_t* dst, const uint32_t* src, size_t size);
+    CFFI_DLLEXPORT int popcount64(uint8_t* dst, const uint64_t* src, size_t size);
+    CFFI_DLLEXPORT int popcount8_strided(uint8_t* dst, const uint8_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+    CFFI_DLLEXPORT int popcount16_strided(uint8_t* dst, const uint16_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+    CFFI_DLLEXPORT int popcount32_strided(uint8_t* dst, const uint32_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+    CFFI_DLLEXPORT int popcount64_strided(uint8_t* dst, const uint64_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride);
+    CFFI_DLLEXPORT int popcount8_reduce(uint64_t* dst, const uint8_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols);
+    CFFI_DLLEXPORT int popcount16_reduce(uint64_t* dst, const uint16_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols);
+    CFFI_DLLEXPORT int popcount32_reduce(uint64_t* dst, const uint32_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols);
+    CFFI_DLLEXPORT int popcount64_reduce(uint64_t* dst, const uint64_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols);
 }
 
-CFFI_DLLEXPORT int popcount8(uint8_t* dst, const uint8_t* src, int size) {
-    for (int i = 0; i < size; ++i) {
-        dst[i] = __builtin_popcount(src[i]);
+/**
+ * Popcount of size contiguous elements
+ */
+template<typename Policy, typename T>
+static CV_ALWAYS_INLINE int popcount_kernel(uint8_t* dst, const T* src, size_t size) {
+    if (sizeof(T) == 1) {
+        Policy::byte_counts(dst, (const uint8_t*)src, size);
+    } else {
+        for (size_t i = 0; i < size; ++i) {
+            dst[i] = (uint8_t)Policy::word(src[i]);
+        }
     }
     return 0;
 }
 
-CFFI_DLLEXPORT int popcount16(uint8_t* dst, const uint16_t* src, int size) {
-    for (int i = 0; i < size; ++i) {
-        dst[i] = __builtin_popcount(src[i]);
-    }
-    return 0;
+POPCOUNT_DISPATCH(popcount_dispatch, (popcount_kernel<Policy>(args...)))
+
+CFFI_DLLEXPORT int popcount8(uint8_t* dst, const uint8_t* src, size_t size) {
+    return popcount_dispatch(dst, src, size);
+}
+
+CFFI_DLLEXPORT int popcount16(uint8_t* dst, const uint16_t* src, size_t size) {
+    return popcount_dispatch(dst, src, size);
+}
+
+CFFI_DLLEXPORT int popcount32(uint8_t* dst, const uint32_t* src, size_t size) {
+    return popcount_dispatch(dst, src, size);
 }
 
-CFFI_DLLEXPORT int popcount32(uint8_t* dst, const uint32_t* src, int size) {
-    for (int i = 0; i < size; ++i) {
-        dst[i] = __builtin_popcount(src[i]);
+CFFI_DLLEXPORT int popcount64(uint8_t* dst, const uint64_t* src, size_t size) {
+    return popcount_dispatch(dst, src, size);
+}
+
+/**
+ * Popcount of a (rows, cols) strided source array (e.g. a numpy view)
+ * into a contiguous destination array. Strides are given in elements.
+ */
+template<typename Policy, typename T>
+static CV_ALWAYS_INLINE int popcount_strided_kernel(uint8_t* dst, const T* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride) {
+    for (size_t y = 0; y < rows; ++y) {
+        const T* srcrow = src + (ptrdiff_t)y * row_stride;
+        uint8_t* dstrow = dst + y * cols;
+        if (col_stride == 1) {
+            popcount_kernel<Policy>(dstrow, srcrow, cols);
+            continue;
+        }
+        for (size_t x = 0; x < cols; ++x) {
+            dstrow[x] = (uint8_t)Policy::word(srcrow[(ptrdiff_t)x * col_stride]);
+        }
     }
     return 0;
 }
 
-CFFI_DLLEXPORT int popcount64(uint8_t* dst, const uint64_t* src, int size) {
-    for (int i = 0; i < size; ++i) {
-        dst[i] = __builtin_popcountll(src[i]);
+POPCOUNT_DISPATCH(popcount_strided, (popcount_strided_kernel<Policy>(args...)))
+
+CFFI_DLLEXPORT int popcount8_strided(uint8_t* dst, const uint8_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride) {
+    return popcount_strided(dst, src, rows, cols, row_stride, col_stride);
+}
+
+CFFI_DLLEXPORT int popcount16_strided(uint8_t* dst, const uint16_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride) {
+    return popcount_strided(dst, src, rows, cols, row_stride, col_stride);
+}
+
+CFFI_DLLEXPORT int popcount32_strided(uint8_t* dst, const uint32_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride) {
+    return popcount_strided(dst, src, rows, cols, row_stride, col_stride);
+}
+
+CFFI_DLLEXPORT int popcount64_strided(uint8_t* dst, const uint64_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride) {
+    return popcount_strided(dst, src, rows, cols, row_stride, col_stride);
+}
+
+/**
+ * Sum of the popcounts of every (block_rows, block_cols) block of a
+ * (rows, cols) strided source array. Strides are given in elements.
+ * The sums are added to the contiguous
+ * (ceil(rows / block_rows), ceil(cols / block_cols)) destination array,
+ * so the caller has to initialize it.
+ *
+ * Blocks of (rows, cols) compute the total, (1, cols) the sum of every row
+ * and (rows, 1) the sum of every column.
+ *
+ * Returns -2 if a block size is 0.
+ */
+template<typename Policy, typename T>
+static CV_ALWAYS_INLINE int popcount_reduce_kernel(uint64_t* dst, const T* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols) {
+    if (block_rows == 0 || block_cols == 0) {
+        return -2;
+    }
+    size_t dst_cols = (cols + block_cols - 1) / block_cols;
+    for (size_t y = 0; y < rows; ++y) {
+        const T* srcrow = src + (ptrdiff_t)y * row_stride;
+        uint64_t* dstrow = dst + (y / block_rows) * dst_cols;
+        for (size_t x = 0, block = 0; x < cols; ++block) {
+            size_t end = (cols - x > block_cols) ? x + block_cols : cols;
+            uint64_t count = 0;
+            if (col_stride == 1) {
+                count = Policy::bytes((const uint8_t*)(srcrow + x), (end - x) * sizeof(T));
+                x = end;
+            } else {
+                for (; x < end; ++x) {
+                    count += Policy::word(srcrow[(ptrdiff_t)x * col_stride]);
+                }
+            }
+            dstrow[block] += count;
+        }
     }
     return 0;
 }
+
+POPCOUNT_DISPATCH(popcount_reduce, (popcount_reduce_kernel<Policy>(args...)))
+
+CFFI_DLLEXPORT int popcount8_reduce(uint64_t* dst, const uint8_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols) {
+    return popcount_reduce(dst, src, rows, cols, row_stride, col_stride, block_rows, block_cols);
+}
+
+CFFI_DLLEXPORT int popcount16_reduce(uint64_t* dst, const uint16_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols) {
+    return popcount_reduce(dst, src, rows, cols, row_stride, col_stride, block_rows, block_cols);
+}
+
+CFFI_DLLEXPORT int popcount32_reduce(uint64_t* dst, const uint32_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols) {
+    return popcount_reduce(dst, src, rows, cols, row_stride, col_stride, block_rows, block_cols);
+}
+
+CFFI_DLLEXPORT int popcount64_reduce(uint64_t* dst, const uint64_t* src,
+        size_t rows, size_t cols, ptrdiff_t row_stride, ptrdiff_t col_stride,
+        size_t block_rows, size_t block_cols) {
+    return popcount_reduce(dst, src, rows, cols, row_stride, col_stride, block_rows, block_cols);
+}
@@ -0,0 +1,251 @@
+#pragma once
+#include "cpu.hpp"
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+/**
+ * Popcount primitives for every CpuFeatureLevel.
+ *
+ * Every policy provides
+ *   word(v): Popcount of a 64 bit word
+ *   bytes(p, n): Total popcount of n bytes
+ *   byte_counts(dst, src, n): Popcount of every byte
+ *   hamming(p, q, n): Hamming distance of two n byte vectors
+ *
+ * The functions are always inlined, so kernels templated on the policy
+ * must be instantiated in a function compiled for the policy's target
+ * (see popcount.cpp).
+ */
+
+/**
+ * Branch-free popcount which, unlike __builtin_popcountll() without
+ * -mpopcnt, is inlined instead of calling a libgcc function.
+ */
+static inline uint64_t popcount_swar(uint64_t v) {
+    v = v - ((v >> 1) & 0x5555555555555555ULL);
+    v = (v & 0x3333333333333333ULL) + ((v >> 2) & 0x3333333333333333ULL);
+    v = (v + (v >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    return (v * 0x0101010101010101ULL) >> 56;
+}
+
+/**
+ * Generic bytes() implementation: 64 bits at a time, then the remaining bytes
+ */
+template<typename Policy>
+static CV_ALWAYS_INLINE uint64_t popcount_words(const uint8_t* p, size_t n) {
+    uint64_t count = 0;
+    size_t i = 0;
+    for (; i + 8 <= n; i += 8) {
+        uint64_t v;
+        memcpy(&v, p + i, 8);
+        count += Policy::word(v);
+    }
+    for (; i < n; i++) {
+        count += Policy::word(p[i]);
+    }
+    return count;
+}
+
+/**
+ * Generic hamming() implementation: 64 bits at a time, then the remaining bytes
+ */
+template<typename Policy>
+static CV_ALWAYS_INLINE uint64_t hamming_words(const uint8_t* p, const uint8_t* q, size_t n) {
+    uint64_t count = 0;
+    size_t i = 0;
+    for (; i + 8 <= n; i += 8) {
+        uint64_t v, w;
+        memcpy(&v, p + i, 8);
+        memcpy(&w, q + i, 8);
+        count += Policy::word(v ^ w);
+    }
+    for (; i < n; i++) {
+        count += Policy::word(p[i] ^ q[i]);
+    }
+    return count;
+}
+
+struct PopcountBaseline {
+    static CV_ALWAYS_INLINE uint64_t word(uint64_t v) {
+        return popcount_swar(v);
+    }
+
+    static CV_ALWAYS_INLINE uint64_t bytes(const uint8_t* p, size_t n) {
+        return popcount_words<PopcountBaseline>(p, n);
+    }
+
+    static CV_ALWAYS_INLINE void byte_counts(uint8_t* dst, const uint8_t* src, size_t n) {
+        for (size_t i = 0; i < n; i++) {
+            dst[i] = (uint8_t)popcount_swar(src[i]);
+        }
+    }
+
+    static CV_ALWAYS_INLINE uint64_t hamming(const uint8_t* p, const uint8_t* q, size_t n) {
+        return hamming_words<PopcountBaseline>(p, q, n);
+    }
+};
+
+#ifdef CV_ALGORITHMS_DISPATCH
+
+struct PopcountPopcnt {
+    CV_TARGET_POPCNT static inline uint64_t word(uint64_t v) {
+        return __builtin_popcountll(v);
+    }
+
+    CV_TARGET_POPCNT static inline uint64_t bytes(const uint8_t* p, size_t n) {
+        return popcount_words<PopcountPopcnt>(p, n);
+    }
+
+    CV_TARGET_POPCNT static inline void byte_counts(uint8_t* dst, const uint8_t* src, size_t n) {
+        for (size_t i = 0; i < n; i++) {
+            dst[i] = (uint8_t)__builtin_popcount(src[i]);
+        }
+    }
+
+    CV_TARGET_POPCNT static inline uint64_t hamming(const uint8_t* p, const uint8_t* q, size_t n) {
+        return hamming_words<PopcountPopcnt>(p, q, n);
+    }
+};
+
+/**
+ * Per-byte popcount of 32 bytes using a 4 bit lookup table (vpshufb)
+ */
+CV_TARGET_AVX2 static inline __m256i popcount_bytes_avx2(__m256i v) {
+    const __m256i lookup = _mm256_setr_epi8(
+        0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
+        0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4);
+    const __m256i low_mask = _mm256_set1_epi8(0x0F);
+    __m256i lo = _mm256_and_si256(v, low_mask);
+    __m256i hi = _mm256_and_si256(_mm256_srli_epi16(v, 4), low_mask);
+    return _mm256_add_epi8(_mm256_shuffle_epi8(lookup, lo), _mm256_shuffle_epi8(lookup, hi));
+}
+
+struct PopcountAVX2 {
+    CV_TARGET_AVX2 static inline uint64_t word(uint64_t v) {
+        return __builtin_popcountll(v);
+    }
+
+    CV_TARGET_AVX2 static inline uint64_t bytes(const uint8_t* p, size_t n) {
+        __m256i total = _mm256_setzero_si256();
+        size_t i = 0;
+        while (i + 32 <= n) {
+            // Per-byte counts can take up to 31 additions of 8 before overflowing
+            __m256i acc = _mm256_setzero_si256();
+            size_t end = (n - i >= 31 * 32) ? i + 31 * 32 : i + (n - i) / 32 * 32;
+            for (; i < end; i += 32) {
+                acc = _mm256_add_epi8(acc, popcount_bytes_avx2(_mm256_loadu_si256((const __m256i*)(p + i))));
+            }
+            total = _mm256_add_epi64(total, _mm256_sad_epu8(acc, _mm256_setzero_si256()));
+        }
+        uint64_t lanes[4];
+        _mm256_storeu_si256((__m256i*)lanes, total);
+        return lanes[0] + lanes[1] + lanes[2] + lanes[3] + popcount_words<PopcountAVX2>(p + i, n - i);
+    }
+
+    CV_TARGET_AVX2 static inline void byte_counts(uint8_t* dst, const uint8_t* src, size_t n) {
+        size_t i = 0;
+        for (; i + 32 <= n; i += 32) {
+            __m256i v = _mm256_loadu_si256((const __m256i*)(src + i));
+            _mm256_storeu_si256((__m256i*)(dst + i), popcount_bytes_avx2(v));
+        }
+        for (; i < n; i++) {
+            dst[i] = (uint8_t)__builtin_popcount(src[i]);
+        }
+    }
+
+    /**
+     * For descriptor-sized vectors, POPCNT is faster than
+     * the lookup table including its horizontal sum
+     */
+    CV_TARGET_AVX2 static inline uint64_t hamming(const uint8_t* p, const uint8_t* q, size_t n) {
+        return hamming_words<PopcountAVX2>(p, q, n);
+    }
+};
+
+struct PopcountAVX512 {
+    CV_TARGET_AVX512 static inline uint64_t word(uint64_t v) {
+        return __builtin_popcountll(v);
+    }
+
+    CV_TARGET_AVX512 static inline uint64_t bytes(const uint8_t* p, size_t n) {
+        __m512i total = _mm512_setzero_si512();
+        size_t i = 0;
+        for (; i + 64 <= n; i += 64) {
+            total = _mm512_add_epi64(total, _mm512_popcnt_epi64(_mm512_loadu_si512(p + i)));
+        }
+        if (i < n) {
+            // Masked load of the remaining bytes, the other bytes are zero
+            __mmask64 mask = ~0ULL >> (64 - (n - i));
+            total = _mm512_add_epi64(total, _mm512_popcnt_epi64(_mm512_maskz_loadu_epi8(mask, p + i)));
+        }
+        uint64_t lanes[8];
+        _mm512_storeu_si512(lanes, total);
+        return lanes[0] + lanes[1] + lanes[2] + lanes[3] + lanes[4] + lanes[5] + lanes[6] + lanes[7];
+    }
+
+    CV_TARGET_AVX512 static inline void byte_counts(uint8_t* dst, const uint8_t* src, size_t n) {
+        // Popcount of 0-15 in every 128 bit lane
+        const long long lookup_lo = 0x0302020102010100LL, lookup_hi = 0x0403030203020201LL;
+        const __m512i lookup = _mm512_set_epi64(lookup_hi, lookup_lo, lookup_hi, lookup_lo,
+            lookup_hi, lookup_lo, lookup_hi, lookup_lo);
+        const __m512i low_mask = _mm512_set1_epi8(0x0F);
+        for (size_t i = 0; i < n; i += 64) {
+            __mmask64 mask = (n - i >= 64) ? ~0ULL : ~0ULL >> (64 - (n - i));
+            __m512i v = _mm512_maskz_loadu_epi8(mask, src + i);
+            __m512i lo = _mm512_and_si512(v, low_mask);
+            __m512i hi = _mm512_and_si512(_mm512_srli_epi16(v, 4), low_mask);
+            __m512i counts = _mm512_add_epi8(_mm512_shuffle_epi8(lookup, lo), _mm512_shuffle_epi8(lookup, hi));
+            _mm512_mask_storeu_epi8(dst + i, mask, counts);
+        }
+    }
+
+    CV_TARGET_AVX512 static inline uint64_t hamming(const uint8_t* p, const uint8_t* q, size_t n) {
+        // Short vectors: Avoid the horizontal sum and keep this small enough to be inlined
+        return (n <= 32) ? hamming_words<PopcountAVX512>(p, q, n) : hamming_vector(p, q, n);
+    }
+
+    CV_TARGET_AVX512 static uint64_t hamming_vector(const uint8_t* p, const uint8_t* q, size_t n) {
+        __m512i total = _mm512_setzero_si512();
+        for (size_t i = 0; i < n; i += 64) {
+            __mmask64 mask = (n - i >= 64) ? ~0ULL : ~0ULL >> (64 - (n - i));
+            __m512i x = _mm512_xor_si512(_mm512_maskz_loadu_epi8(mask, p + i), _mm512_maskz_loadu_epi8(mask, q + i));
+            total = _mm512_add_epi64(total, _mm512_popcnt_epi64(x));
+        }
+        uint64_t lanes[8];
+        _mm512_storeu_si512(lanes, total);
+        return lanes[0] + lanes[1] + lanes[2] + lanes[3] + lanes[4] + lanes[5] + lanes[6] + lanes[7];
+    }
+};
+
+#endif // CV_ALGORITHMS_DISPATCH
+
+/**
+ * Instantiate a kernel template for every CpuFeatureLevel:
+ * Defines name_baseline(), name_popcnt(), name_avx2() and name_avx512()
+ * calling kernel<Policy>(args...), each compiled for its target.
+ * Use popcount_dispatch() to call the variant for the current level.
+ */
+#ifdef CV_ALGORITHMS_DISPATCH
+#define POPCOUNT_DISPATCH(name, policy_call) \
+    template<typename... Args> static int name##_baseline(Args... args) { \
+        typedef PopcountBaseline Policy; return policy_call; } \
+    template<typename... Args> CV_TARGET_POPCNT static int name##_popcnt(Args... args) { \
+        typedef PopcountPopcnt Policy; return policy_call; } \
+    template<typename... Args> CV_TARGET_AVX2 static int name##_avx2(Args... args) { \
+        typedef PopcountAVX2 Policy; return policy_call; } \
+    template<typename... Args> CV_TARGET_AVX512 static int name##_avx512(Args... args) { \
+        typedef PopcountAVX512 Policy; return policy_call; } \
+    template<typename... Args> static int name(Args... args) { \
+        switch (cpu_feature_level()) { \
+            case CPU_AVX512: return name##_avx512(args...); \
+            case CPU_AVX2: return name##_avx2(args...); \
+            case CPU_POPCNT: return name##_popcnt(args...); \
+            default: return name##_baseline(args...); \
+        } \
+    }
+#else
+#define POPCOUNT_DISPATCH(name, policy_call) \
+    template<typename... Args> static int name(Args... args) { \
+        typedef PopcountBaseline Policy; return policy_call; }
+#endif
@@ -0,0 +1,888 @@
+#include "common.hpp"
+#include "neighbours.hpp"
+#include <stdlib.h>
+#include <assert.h>
+#include <stdbool.h>
+#include <limits.h>
+#include <string.h>
+#include <stdint.h>
+#include <stddef.h>
+#include <vector>
+#include <algorithm>
+#include <new>
+
+/**
+ * Graph extracted from a skeleton image by skeleton_graph().
+ * All arrays are allocated by the C code, free using skeleton_graph_free().
+ * Keep in sync with the cdef in skeleton.py
+ */
+typedef struct {
+    size_t num_nodes;
+    int32_t* node_coords; /* (num_nodes, 2): y, x */
+    uint8_t* node_types; /* (num_nodes): SKELETON_NODE_* */
+    size_t num_edges;
+    int32_t* edge_nodes; /* (num_edges, 2): start & end node index or -1 for closed loops */
+    size_t* edge_offsets; /* (num_edges): Index of the first coordinate of each edge */
+    size_t* edge_lengths; /* (num_edges): Number of coordinates of each edge */
+    size_t num_coords;
+    int32_t* edge_coords; /* (num_coords, 2): y, x */
+} skeleton_graph_t;
+
+/**
+ * Skeleton pixels classified by skeleton_points().
+ * coords[type] is a (counts[type], 2) array of y, x coordinates for every
+ * SKELETON_NODE_* / SKELETON_PIXEL_LINE type, allocated by the C code.
+ * Free using skeleton_points_free().
+ * Keep in sync with the cdef in skeleton.py
+ */
+typedef struct {
+    size_t counts[4];
+    int32_t* coords[4];
+} skeleton_points_t;
+
+//Forward declaration required due to CFFI's requirement to have unmangled symbols
+extern "C" {
+    CFFI_DLLEXPORT int skeleton_graph(skeleton_graph_t* graph, const uint8_t* img,
+        ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height);
+    CFFI_DLLEXPORT void skeleton_graph_free(skeleton_graph_t* graph);
+    CFFI_DLLEXPORT int skeleton_points(skeleton_points_t* points, const uint8_t* img,
+        ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height, int include_lines);
+    CFFI_DLLEXPORT void skeleton_points_free(skeleton_points_t* points);
+}
+
+/**
+ * Node types. Keep in sync with SkeletonNodeType & SkeletonPixelType in skeleton.py
+ */
+enum {
+    SKELETON_NODE_ISOLATED = 0,
+    SKELETON_NODE_ENDPOINT = 1,
+    SKELETON_NODE_JUNCTION = 2,
+    SKELETON_PIXEL_LINE = 3 // Only used by skeleton_points()
+};
+
+/**
+ * Neighbour offsets in the bit order used by binary_neighbours():
+ *
+ *     0 1 2
+ *     3   4
+ *     5 6 7
+ */
+static const int neighbourDX[8] = {-1, 0, 1, -1, 1, -1, 0, 1};
+static const int neighbourDY[8] = {-1, -1, -1, 0, 0, 1, 1, 1};
+/**
+ * Order in which the neighbours are followed when tracing an edge:
+ * Orthogonal neighbours (N, W, E, S) first, so staircase-shaped
+ * lines are followed pixel by pixel instead of cutting corners.
+ */
+static const int traceOrder[8] = {1, 3, 4, 6, 0, 2, 5, 7};
+
+/**
+ * Pixel classes used while tracing
+ */
+enum {
+    PIXEL_BACKGROUND = 0,
+    PIXEL_LINE = 1,
+    PIXEL_NODE = 2
+};
+
+/**
+ * binary_neighbours()-style neighbour code of the pixel at (x, y).
+ * Pixels outside the image are background.
+ */
+static uint8_t skeleton_neighbour_code(const uint8_t* img, ptrdiff_t row_stride, ptrdiff_t pixel_stride,
+        size_t width, size_t height, size_t x, size_t y) {
+    uint8_t code = 0;
+    for (int i = 0; i < 8; i++) {
+        size_t nx = x + neighbourDX[i];
+        size_t ny = y + neighbourDY[i];
+        // Unsigned wrap-around makes x - 1 at x = 0 huge
+        if (nx < width && ny < height && IMG_STRIDED_XY(img, nx, ny, row_stride, pixel_stride) != 0) {
+            code |= (1 << i);
+        }
+    }
+    return code;
+}
+
+/**
+ * Number of 0 -> 1 transitions when going around the neighbourhood
+ * in circular order (N, NE, E, SE, S, SW, W, NW).
+ * 1 for endpoints, 2 for line pixels, 3 or more for junctions.
+ */
+static int crossing_number(uint8_t code) {
+    static const int circular[8] = {1, 2, 4, 7, 6, 5, 3, 0};
+    int transitions = 0;
+    for (int i = 0; i < 8; i++) {
+        bool current = (code >> circular[i]) & 1;
+        bool next = (code >> circular[(i + 1) % 8]) & 1;
+        transitions += (!current && next);
+    }
+    return transitions;
+}
+
+/**
+ * Internal state of skeleton_graph()
+ */
+class SkeletonTracer {
+public:
+    SkeletonTracer(const uint8_t* img, ptrdiff_t rowStride, ptrdiff_t pixelStride, size_t width, size_t height)
+        : img(img), rowStride(rowStride), pixelStride(pixelStride), width(width), height(height),
+          pixelClass(width * height, PIXEL_BACKGROUND),
+          nodeIndex(width * height, -1),
+          edgeIndex(width * height, -1) {}
+
+    void run() {
+        classify();
+        // Junctions created while tracing are appended to nodePixels
+        for (size_t i = 0; i < nodePixels.size(); i++) {
+            trace_from_node_pixel(nodePixels[i]);
+        }
+        trace_loops();
+        // Concatenate the edges
+        for (size_t e = 0; e < edgePaths.size(); e++) {
+            const std::vector<size_t>& edge = edgePaths[e];
+            edgeOffsets.push_back(edgeCoords.size() / 2);
+            edgeLengths.push_back(edge.size());
+            for (size_t i = 0; i < edge.size(); i++) {
+                edgeCoords.push_back((int32_t)(edge[i] / width));
+                edgeCoords.push_back((int32_t)(edge[i] % width));
+            }
+        }
+    }
+
+    // Output
+    std::vector<int32_t> nodeCoords;
+    std::vector<uint8_t> nodeTypes;
+    std::vector<int32_t> edgeNodes;
+    std::vector<size_t> edgeOffsets;
+    std::vector<size_t> edgeLengths;
+    std::vector<int32_t> edgeCoords;
+
+private:
+    const uint8_t* img;
+    ptrdiff_t rowStride, pixelStride;
+    size_t width, height;
+    std::vector<uint8_t> pixelClass;
+    std::vector<int32_t> nodeIndex;
+    // Edge containing each traced line pixel, -1 if not traced yet
+    std::vector<int32_t> edgeIndex;
+    std::vector<size_t> nodePixels;
+    std::vector<std::vector<size_t> > edgePaths;
+    std::vector<size_t> path;
+
+    /**
+     * Get the index of the neighbour in direction i of idx
+     * or SIZE_MAX if it is outside the image.
+     */
+    size_t neighbour(size_t idx, int i) const {
+        size_t x = idx % width + neighbourDX[i];
+        size_t y = idx / width + neighbourDY[i];
+        return (x < width && y < height) ? x + width * y : SIZE_MAX;
+    }
+
+    bool adjacent(size_t a, size_t b) const {
+        size_t dx = (a % width > b % width) ? a % width - b % width : b % width - a % width;
+        size_t dy = (a / width > b / width) ? a / width - b / width : b / width - a / width;
+        return dx <= 1 && dy <= 1;
+    }
+
+    /**
+     * Check if idx is 8-adjacent to any pixel of the given node
+     */
+    bool touches_node(size_t idx, int32_t node) const {
+        for (int i = 0; i < 8; i++) {
+            size_t n = neighbour(idx, i);
+            if (n != SIZE_MAX && pixelClass[n] == PIXEL_NODE && nodeIndex[n] == node) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    int32_t add_node(size_t idx, uint8_t type) {
+        nodeCoords.push_back((int32_t)(idx / width));
+        nodeCoords.push_back((int32_t)(idx % width));
+        nodeTypes.push_back(type);
+        return (int32_t)(nodeTypes.size() - 1);
+    }
+
+    /**
+     * Classify all foreground pixels and create the nodes.
+     * 8-connected junction pixels are merged into a single node
+     * located at its first pixel in raster order.
+     */
+    void classify() {
+        std::vector<size_t> stack;
+        for (size_t y = 0; y < height; y++) {
+            for (size_t x = 0; x < width; x++) {
+                if (IMG_STRIDED_XY(img, x, y, rowStride, pixelStride) == 0) {
+                    continue;
+                }
+                uint8_t code = skeleton_neighbour_code(img, rowStride, pixelStride, width, height, x, y);
+                int transitions = crossing_number(code);
+                // Fully surrounded pixels (not thin) are treated like junctions
+                pixelClass[x + width * y] = (code != 0 && transitions == 2) ? PIXEL_LINE : PIXEL_NODE;
+            }
+        }
+        for (size_t idx = 0; idx < width * height; idx++) {
+            if (pixelClass[idx] != PIXEL_NODE || nodeIndex[idx] != -1) {
+                continue;
+            }
+            uint8_t code = skeleton_neighbour_code(img, rowStride, pixelStride, width, height, idx % width, idx / width);
+            int transitions = crossing_number(code);
+            if (code == 0) {
+                nodeIndex[idx] = add_node(idx, SKELETON_NODE_ISOLATED);
+                nodePixels.push_back(idx);
+            } else if (transitions == 1) {
+                nodeIndex[idx] = add_node(idx, SKELETON_NODE_ENDPOINT);
+                nodePixels.push_back(idx);
+            } else {
+                // Flood-fill the junction cluster
+                int32_t node = add_node(idx, SKELETON_NODE_JUNCTION);
+                nodeIndex[idx] = node;
+                stack.push_back(idx);
+                while (!stack.empty()) {
+                    size_t current = stack.back();
+                    stack.pop_back();
+                    nodePixels.push_back(current);
+                    for (int i = 0; i < 8; i++) {
+                        size_t n = neighbour(current, i);
+                        if (n != SIZE_MAX && pixelClass[n] == PIXEL_NODE && nodeIndex[n] == -1
+                                && is_junction_pixel(n)) {
+                            nodeIndex[n] = node;
+                            stack.push_back(n);
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    bool is_junction_pixel(size_t idx) const {
+        uint8_t code = skeleton_neighbour_code(img, rowStride, pixelStride, width, height, idx % width, idx / width);
+        return code != 0 && crossing_number(code) != 1;
+    }
+
+    /**
+     * Add the given pixels as edge between the start and end node
+     */
+    void emit_edge(const std::vector<size_t>& pixels, int32_t start, int32_t end) {
+        int32_t edge = (int32_t)edgePaths.size();
+        edgeNodes.push_back(start);
+        edgeNodes.push_back(end);
+        edgePaths.push_back(pixels);
+        for (size_t i = 0; i < pixels.size(); i++) {
+            if (pixelClass[pixels[i]] == PIXEL_LINE) {
+                edgeIndex[pixels[i]] = edge;
+            }
+        }
+    }
+
+    void emit_edge(int32_t start, int32_t end) {
+        emit_edge(path, start, end);
+    }
+
+    /**
+     * Two diagonally adjacent pixels are connected via a common orthogonal
+     * neighbour if that neighbour is set. In that case, no direct edge
+     * between them is emitted (it would form a triangle).
+     */
+    bool diagonal_has_corner(size_t a, int i) const {
+        size_t ax = a % width, ay = a / width;
+        size_t cx = ax + neighbourDX[i];
+        size_t cy = ay + neighbourDY[i];
+        return IMG_STRIDED_XY(img, cx, ay, rowStride, pixelStride) != 0
+            || IMG_STRIDED_XY(img, ax, cy, rowStride, pixelStride) != 0;
+    }
+
+    /**
+     * Check if trace_from_node_pixel() connects the adjacent
+     * pixels a and b of different nodes by a direct edge
+     */
+    bool direct_edge(size_t a, size_t b) const {
+        int32_t nodeA = nodeIndex[a], nodeB = nodeIndex[b];
+        if (nodeA == nodeB || (nodeTypes[nodeA] != SKELETON_NODE_ENDPOINT
+                && nodeTypes[nodeB] != SKELETON_NODE_ENDPOINT)) {
+            return false;
+        }
+        for (int i = 0; i < 8; i++) {
+            if (neighbour(a, i) == b) {
+                bool diagonal = (i == 0 || i == 2 || i == 5 || i == 7);
+                return !diagonal || !diagonal_has_corner(a, i);
+            }
+        }
+        return false;
+    }
+
+    /**
+     * Check if the line pixel idx next to the endpoint p belongs to the branch
+     * of a junction that p is directly connected to, i.e. p is a spur of it
+     */
+    bool belongs_to_adjacent_junction(size_t p, size_t idx) const {
+        if (nodeTypes[nodeIndex[p]] != SKELETON_NODE_ENDPOINT) {
+            return false;
+        }
+        for (int i = 0; i < 8; i++) {
+            size_t n = neighbour(idx, i);
+            if (n != SIZE_MAX && pixelClass[n] == PIXEL_NODE && adjacent(n, p)
+                    && nodeTypes[nodeIndex[n]] == SKELETON_NODE_JUNCTION && direct_edge(p, n)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    /**
+     * Mark idx as part of the path currently being traced
+     */
+    void visit(size_t idx) {
+        edgeIndex[idx] = (int32_t)edgePaths.size();
+        path.push_back(idx);
+    }
+
+    /**
+     * Select the untraced line pixel to continue the path with from current.
+     * Pixels that are 8-adjacent to the previous pixel (or to the start node
+     * while still next to it) are the first pixel of another branch at the
+     * corner of a junction. They are stored in fallback and only taken if
+     * there is no other way to continue, except for a pixel that is adjacent
+     * to the selected pixel as well: That is the corner of a staircase,
+     * which is taken first.
+     */
+    size_t next_line_pixel(size_t current, int32_t startNode, bool leftStart, size_t* fallback) const {
+        size_t previous = path[path.size() - 2];
+        size_t next = SIZE_MAX;
+        *fallback = SIZE_MAX;
+        for (int j = 0; j < 8 && next == SIZE_MAX; j++) {
+            size_t n = neighbour(current, traceOrder[j]);
+            if (n == SIZE_MAX || pixelClass[n] != PIXEL_LINE || edgeIndex[n] != -1) {
+                continue;
+            }
+            if (adjacent(n, previous) || (!leftStart && touches_node(n, startNode))) {
+                *fallback = (*fallback == SIZE_MAX) ? n : *fallback;
+            } else {
+                next = n;
+            }
+        }
+        if (next == SIZE_MAX) {
+            return SIZE_MAX;
+        }
+        for (int j = 0; j < 8; j++) {
+            size_t n = neighbour(current, traceOrder[j]);
+            if (n != SIZE_MAX && pixelClass[n] == PIXEL_LINE && edgeIndex[n] == -1
+                    && adjacent(n, previous) && adjacent(n, next)) {
+                return n;
+            }
+        }
+        return next;
+    }
+
+    /**
+     * Insert the line pixel idx into the traced edge containing its
+     * neighbour n if it is a corner between n and the next pixel of that
+     * edge, which must be a pixel of the given node.
+     * Returns false if it is not.
+     */
+    bool insert_corner(size_t idx, size_t n, int32_t node) {
+        int32_t edge = edgeIndex[n];
+        std::vector<size_t>& pixels = edgePaths[edge];
+        for (size_t pos = 0; pos < pixels.size(); pos++) {
+            if (pixels[pos] != n) {
+                continue;
+            }
+            size_t after = (pos + 1 < pixels.size()) ? pos + 1 : pos;
+            size_t before = (pos > 0) ? pos - 1 : pos;
+            size_t insert = pixels.size();
+            if (nodeIndex[pixels[after]] == node && adjacent(pixels[after], idx)) {
+                insert = after;
+            } else if (nodeIndex[pixels[before]] == node && adjacent(pixels[before], idx)) {
+                insert = pos;
+            }
+            if (insert != pixels.size()) {
+                pixels.insert(pixels.begin() + insert, idx);
+                edgeIndex[idx] = edge;
+                return true;
+            }
+        }
+        return false;
+    }
+
+    /**
+     * Turn the traced line pixel idx into a junction node,
+     * splitting the edge containing it. Returns the new node.
+     */
+    int32_t split_edge(size_t idx) {
+        int32_t node = add_node(idx, SKELETON_NODE_JUNCTION);
+        int32_t edge = edgeIndex[idx];
+        pixelClass[idx] = PIXEL_NODE;
+        nodeIndex[idx] = node;
+        nodePixels.push_back(idx);
+        if (edge == (int32_t)edgePaths.size()) {
+            // The current path runs into itself: Emit the part up to idx,
+            // the rest becomes a loop starting and ending at the new node
+            size_t pos = 0;
+            while (path[pos] != idx) {
+                pos++;
+            }
+            std::vector<size_t> loop(path.begin() + pos, path.end());
+            loop.push_back(idx);
+            path.resize(pos + 1);
+            emit_edge(nodeIndex[path[0]], node);
+            path.swap(loop);
+            return node;
+        }
+        std::vector<size_t>& pixels = edgePaths[edge];
+        size_t pos = 0;
+        while (pixels[pos] != idx) {
+            pos++;
+        }
+        if (edgeNodes[2 * edge] == -1 && edgeNodes[2 * edge + 1] == -1) {
+            // A closed loop now starts and ends at the new node
+            std::vector<size_t> rotated(pixels.begin() + pos, pixels.end() - 1);
+            rotated.insert(rotated.end(), pixels.begin(), pixels.begin() + pos + 1);
+            pixels.swap(rotated);
+            edgeNodes[2 * edge] = node;
+            edgeNodes[2 * edge + 1] = node;
+            return node;
+        }
+        std::vector<size_t> tail(pixels.begin() + pos, pixels.end());
+        pixels.resize(pos + 1);
+        int32_t end = edgeNodes[2 * edge + 1];
+        edgeNodes[2 * edge + 1] = node;
+        emit_edge(tail, node, end);
+        return node;
+    }
+
+    /**
+     * Follow the line starting at node pixel start and its neighbour first.
+     * Stops at the next node pixel or when there are no more pixels.
+     */
+    void walk(size_t start, size_t first) {
+        int32_t startNode = nodeIndex[start];
+        path.clear();
+        path.push_back(start);
+        visit(first);
+        size_t current = first;
+        // Loops may only return to the start node once they have left its neighbourhood
+        bool leftStart = false;
+        while (true) {
+            // Stop as soon as we reach a node
+            bool touchesStart = false;
+            for (int j = 0; j < 8; j++) {
+                size_t n = neighbour(current, traceOrder[j]);
+                if (n == SIZE_MAX || pixelClass[n] != PIXEL_NODE) {
+                    continue;
+                }
+                if (nodeIndex[n] == startNode && !leftStart) {
+                    touchesStart = true;
+                    continue;
+                }
+                // Nodes directly connected to the start would form a triangle
+                if (path.size() == 2 && adjacent(n, start) && direct_edge(start, n)) {
+                    continue;
+                }
+                path.push_back(n);
+                emit_edge(startNode, nodeIndex[n]);
+                return;
+            }
+            leftStart = leftStart || !touchesStart;
+            // Else continue along the line
+            size_t fallback;
+            size_t next = next_line_pixel(current, startNode, leftStart, &fallback);
+            if (next != SIZE_MAX) {
+                visit(next);
+                current = next;
+                continue;
+            }
+            /**
+             * If the line runs into an already traced line, there is
+             * a junction the pixel classification could not detect:
+             * Split that line there.
+             */
+            for (int j = 0; j < 8; j++) {
+                size_t n = neighbour(current, traceOrder[j]);
+                if (n == SIZE_MAX || pixelClass[n] != PIXEL_LINE || edgeIndex[n] == -1
+                        || n == path[path.size() - 2] || (path.size() > 2 && n == path[path.size() - 3])) {
+                    continue;
+                }
+                // A single pixel next to the start is just the corner of that line
+                if (path.size() == 2 && edgeIndex[n] != (int32_t)edgePaths.size()
+                        && insert_corner(current, n, startNode)) {
+                    return;
+                }
+                int32_t node = split_edge(n);
+                if (path.back() != n) {
+                    path.push_back(n);
+                }
+                emit_edge(nodeIndex[path[0]], node);
+                return;
+            }
+            if (fallback != SIZE_MAX) {
+                visit(fallback);
+                current = fallback;
+                continue;
+            }
+            // Dead end
+            /**
+             * A line that returns to its start junction without leaving
+             * its neighbourhood encloses a small hole: That is a loop.
+             * A single line pixel that only touches its start junction
+             * is considered part of that junction though.
+             */
+            for (int j = 0; j < 8; j++) {
+                size_t n = neighbour(current, traceOrder[j]);
+                if (n != SIZE_MAX && pixelClass[n] == PIXEL_NODE && nodeIndex[n] == startNode
+                        && (n != start ? path.size() > 2 || !adjacent(n, start) : path.size() > 3)) {
+                    path.push_back(n);
+                    emit_edge(startNode, startNode);
+                    return;
+                }
+            }
+            if (path.size() > 2) {
+                emit_edge(startNode, -1);
+            } else {
+                pixelClass[first] = PIXEL_NODE;
+                nodeIndex[first] = startNode;
+            }
+            return;
+        }
+    }
+
+    void trace_from_node_pixel(size_t p) {
+        int32_t node = nodeIndex[p];
+        int32_t lastDirect = -1;
+        for (int j = 0; j < 8; j++) {
+            int i = traceOrder[j];
+            size_t q = neighbour(p, i);
+            if (q == SIZE_MAX) {
+                continue;
+            }
+            if (pixelClass[q] == PIXEL_LINE && edgeIndex[q] == -1) {
+                if (!belongs_to_adjacent_junction(p, q)) {
+                    walk(p, q);
+                }
+                continue;
+            }
+            /**
+             * Directly adjacent nodes. Junction pixels are never adjacent to
+             * other junctions, so one of them is an endpoint.
+             * Emit these edges from the endpoint (the one with the lower
+             * index if both are endpoints), once per adjacent node.
+             */
+            int32_t other = (pixelClass[q] == PIXEL_NODE) ? nodeIndex[q] : -1;
+            if (other == -1 || other == node || other == lastDirect
+                    || nodeTypes[node] != SKELETON_NODE_ENDPOINT
+                    || (nodeTypes[other] == SKELETON_NODE_ENDPOINT && q < p)) {
+                continue;
+            }
+            bool diagonal = (i == 0 || i == 2 || i == 5 || i == 7);
+            if (!diagonal || !diagonal_has_corner(p, i)) {
+                path.clear();
+                path.push_back(p);
+                path.push_back(q);
+                emit_edge(node, other);
+                lastDirect = other;
+            }
+        }
+    }
+
+    /**
+     * Extend the path from its last pixel along untraced line pixels
+     */
+    void follow_untraced() {
+        while (true) {
+            size_t next = SIZE_MAX;
+            for (int j = 0; j < 8 && next == SIZE_MAX; j++) {
+                size_t n = neighbour(path.back(), traceOrder[j]);
+                if (n != SIZE_MAX && pixelClass[n] == PIXEL_LINE && edgeIndex[n] == -1) {
+                    next = n;
+                }
+            }
+            if (next == SIZE_MAX) {
+                return;
+            }
+            visit(next);
+        }
+    }
+
+    /**
+     * Find a node pixel adjacent to idx, preferring one of a different
+     * node than the node pixel other (if not SIZE_MAX).
+     * Returns SIZE_MAX if idx is not adjacent to any node.
+     */
+    size_t adjacent_node_pixel(size_t idx, size_t other) const {
+        size_t found = SIZE_MAX;
+        for (int j = 0; j < 8; j++) {
+            size_t n = neighbour(idx, traceOrder[j]);
+            if (n == SIZE_MAX || pixelClass[n] != PIXEL_NODE) {
+                continue;
+            }
+            if (other == SIZE_MAX || nodeIndex[n] != nodeIndex[other]) {
+                return n;
+            }
+            if (found == SIZE_MAX) {
+                found = n;
+            }
+        }
+        return found;
+    }
+
+    /**
+     * Turn the line pixel idx at the end of the current path into an endpoint
+     */
+    void add_endpoint(size_t idx) {
+        edgeIndex[idx] = -1;
+        pixelClass[idx] = PIXEL_NODE;
+        nodeIndex[idx] = add_node(idx, SKELETON_NODE_ENDPOINT);
+        nodePixels.push_back(idx);
+    }
+
+    /**
+     * Find a line pixel adjacent to idx that is part of an already
+     * emitted edge (not the pending one) and is not the pixel other.
+     * Returns SIZE_MAX if there is none.
+     */
+    size_t traced_line_neighbour(size_t idx, int32_t pending, size_t other) const {
+        for (int j = 0; j < 8; j++) {
+            size_t n = neighbour(idx, traceOrder[j]);
+            if (n != SIZE_MAX && n != other && pixelClass[n] == PIXEL_LINE
+                    && edgeIndex[n] != -1 && edgeIndex[n] != pending) {
+                return n;
+            }
+        }
+        return SIZE_MAX;
+    }
+
+    /**
+     * Trace the line pixels left after tracing from all nodes.
+     * These are closed loops without any node, which start (and end) at
+     * their first pixel in raster order, or (rarely, in thick clusters)
+     * line pixels only reachable via other nodes or lines. Those are
+     * attached to the nodes and lines they touch like in walk().
+     */
+    void trace_loops() {
+        for (size_t idx = 0; idx < width * height; idx++) {
+            if (pixelClass[idx] != PIXEL_LINE || edgeIndex[idx] != -1) {
+                continue;
+            }
+            path.clear();
+            visit(idx);
+            follow_untraced();
+            int32_t pending = (int32_t)edgePaths.size();
+            if (path.size() > 2 && adjacent(path.back(), idx)) {
+                // Close the loop. If it touches a node or another line,
+                // it starts and ends there instead.
+                size_t pos = 0, node = SIZE_MAX;
+                for (; pos < path.size() && node == SIZE_MAX; pos++) {
+                    node = adjacent_node_pixel(path[pos], SIZE_MAX);
+                    if (node == SIZE_MAX) {
+                        node = traced_line_neighbour(path[pos], pending, SIZE_MAX);
+                    }
+                }
+                if (node == SIZE_MAX) {
+                    path.push_back(idx);
+                    emit_edge(-1, -1);
+                    continue;
+                }
+                if (pixelClass[node] == PIXEL_LINE) {
+                    split_edge(node);
+                }
+                std::rotate(path.begin(), path.begin() + (pos - 1), path.end());
+                path.push_back(path.front());
+                path.insert(path.begin(), node);
+                path.push_back(node);
+                emit_edge(nodeIndex[node], nodeIndex[node]);
+                continue;
+            }
+            // Not a loop: Also extend the path backwards from idx
+            std::reverse(path.begin(), path.end());
+            follow_untraced();
+            // Attach both ends to adjacent nodes or join the lines they run into
+            size_t first = adjacent_node_pixel(path.front(), SIZE_MAX);
+            if (first == SIZE_MAX) {
+                first = traced_line_neighbour(path.front(), pending, SIZE_MAX);
+            }
+            size_t last = adjacent_node_pixel(path.back(), first);
+            if (last == SIZE_MAX || (first != SIZE_MAX && nodeIndex[last] == nodeIndex[first])) {
+                size_t line = traced_line_neighbour(path.back(), pending, first);
+                last = (line != SIZE_MAX) ? line : last;
+            }
+            // An end touching nothing but its own line (e.g. the corner of
+            // a triangle) becomes an endpoint
+            bool ownFirst = (first == SIZE_MAX), ownLast = (last == SIZE_MAX);
+            if (ownFirst) {
+                first = path.front();
+                add_endpoint(first);
+            }
+            if (ownLast) {
+                last = path.back();
+                if (last != first) {
+                    add_endpoint(last);
+                }
+            }
+            if (pixelClass[first] == PIXEL_LINE) {
+                split_edge(first);
+            }
+            if (pixelClass[last] == PIXEL_LINE) {
+                split_edge(last);
+            }
+            if (path.size() == 1 && nodeIndex[first] == nodeIndex[last]) {
+                // A single pixel only touching one node is part of it
+                edgeIndex[idx] = -1;
+                pixelClass[idx] = PIXEL_NODE;
+                nodeIndex[idx] = nodeIndex[first];
+            } else {
+                if (!ownFirst) {
+                    path.insert(path.begin(), first);
+                }
+                if (!ownLast) {
+                    path.push_back(last);
+                }
+                emit_edge(nodeIndex[first], nodeIndex[last]);
+            }
+        }
+    }
+};
+
+/**
+ * Copy a vector to a newly malloc()ed array.
+ * Returns false if the allocation failed.
+ */
+template<typename T>
+static bool copy_to_malloc(T** dst, const std::vector<T>& src) {
+    // Always allocate at least one element so NULL means failure
+    *dst = (T*) malloc((src.size() > 0 ? src.size() : 1) * sizeof(T));
+    if (*dst == NULL) {
+        return false;
+    }
+    if (!src.empty()) {
+        memcpy(*dst, src.data(), src.size() * sizeof(T));
+    }
+    return true;
+}
+
+/**
+ * Extract the graph of a skeleton, i.e. a thinned binary image
+ * (every non-zero value is foreground).
+ *
+ * Endpoints (one connected run of neighbours), junctions (three or more)
+ * and isolated pixels are nodes, 8-connected junction pixels are merged
+ * into a single node. Edges are traced along the line pixels between
+ * the nodes. Closed loops without any nodes are separate edges.
+ * Where a line runs into another line at a pixel that is not classified
+ * as junction (e.g. at junction triangles), a junction node is added there.
+ * img is accessed using the given strides (in bytes, may be negative).
+ *
+ * Returns 0 on success and -1 if memory allocation failed.
+ * The caller must call skeleton_graph_free() in any case.
+ */
+CFFI_DLLEXPORT int skeleton_graph(skeleton_graph_t* graph, const uint8_t* img,
+        ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height) {
+    memset(graph, 0, sizeof(skeleton_graph_t));
+    try {
+        SkeletonTracer tracer(img, row_stride, pixel_stride, width, height);
+        tracer.run();
+        graph->num_nodes = tracer.nodeTypes.size();
+        graph->num_edges = tracer.edgeLengths.size();
+        graph->num_coords = tracer.edgeCoords.size() / 2;
+        if (!copy_to_malloc(&graph->node_coords, tracer.nodeCoords)
+                || !copy_to_malloc(&graph->node_types, tracer.nodeTypes)
+                || !copy_to_malloc(&graph->edge_nodes, tracer.edgeNodes)
+                || !copy_to_malloc(&graph->edge_offsets, tracer.edgeOffsets)
+                || !copy_to_malloc(&graph->edge_lengths, tracer.edgeLengths)
+                || !copy_to_malloc(&graph->edge_coords, tracer.edgeCoords)) {
+            return -1;
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+CFFI_DLLEXPORT void skeleton_graph_free(skeleton_graph_t* graph) {
+    free(graph->node_coords);
+    free(graph->node_types);
+    free(graph->edge_nodes);
+    free(graph->edge_offsets);
+    free(graph->edge_lengths);
+    free(graph->edge_coords);
+    memset(graph, 0, sizeof(skeleton_graph_t));
+}
+
+/**
+ * Type of a foreground pixel with the given neighbour code,
+ * using the same rules as skeleton_graph():
+ * The number of separate runs of neighbours around the pixel
+ * (crossing number) is 1 for endpoints, 2 for line pixels and 3
+ * or more for junctions, so diagonal steps of a line are not
+ * mistaken for additional branches.
+ */
+static uint8_t skeleton_pixel_type(uint8_t code) {
+    if (code == 0) {
+        return SKELETON_NODE_ISOLATED;
+    }
+    int transitions = crossing_number(code);
+    if (transitions == 1) {
+        return SKELETON_NODE_ENDPOINT;
+    }
+    // Fully surrounded pixels (not thin) are treated like junctions
+    return (transitions == 2) ? SKELETON_PIXEL_LINE : SKELETON_NODE_JUNCTION;
+}
+
+/**
+ * Classify every foreground pixel of a skeleton as isolated pixel,
+ * endpoint, junction or line pixel in a single row-major pass.
+ * Line pixel coordinates are only stored if include_lines is set.
+ *
+ * Returns 0 on success and -1 if memory allocation failed.
+ * The caller must call skeleton_points_free() in any case.
+ */
+CFFI_DLLEXPORT int skeleton_points(skeleton_points_t* points, const uint8_t* img,
+        ptrdiff_t row_stride, ptrdiff_t pixel_stride, size_t width, size_t height, int include_lines) {
+    memset(points, 0, sizeof(skeleton_points_t));
+    if (width == 0 || height == 0) {
+        return 0;
+    }
+    uint8_t types[256];
+    for (int code = 0; code < 256; code++) {
+        types[code] = skeleton_pixel_type(code);
+    }
+    try {
+        std::vector<int32_t> coords[4];
+        std::vector<uint8_t> codes(width);
+        for_each_neighbours_row(img, row_stride, pixel_stride, width, height,
+                0, 0, width, height,
+                [&](size_t y, const uint8_t* above, const uint8_t* row, const uint8_t* below) {
+            combine_neighbours_rows(&codes[0], above, row, below, width);
+            for (size_t x = 0; x < width; x++) {
+                if (row[x + 1] == 0) {
+                    continue;
+                }
+                uint8_t type = types[codes[x]];
+                if (type == SKELETON_PIXEL_LINE && !include_lines) {
+                    points->counts[type]++;
+                    continue;
+                }
+                coords[type].push_back((int32_t)y);
+                coords[type].push_back((int32_t)x);
+            }
+        });
+        for (int type = 0; type < 4; type++) {
+            if (type != SKELETON_PIXEL_LINE || include_lines) {
+                points->counts[type] = coords[type].size() / 2;
+            }
+            if (!copy_to_malloc(&points->coords[type], coords[type])) {
+                return -1;
+            }
+        }
+    } catch (const std::bad_alloc&) {
+        return -1;
+    }
+    return 0;
+}
+
+CFFI_DLLEXPORT void skeleton_points_free(skeleton_points_t* points) {
+    for (int type = 0; type < 4; type++) {
+        free(points->coords[type]);
+    }
+    memset(points, 0, sizeof(skeleton_points_t));
+}
@@ -1,19 +1,171 @@
 #include "common.hpp"
+#include "parallel.hpp"
+#include "packed.hpp"
 #include <stdlib.h>
 #include <assert.h>
 #include <stdbool.h>
 #include <limits.h>
 #include <string.h>
 #include <stdint.h>
+#include <vector>
+#include <new>
+#include <atomic>
+#include <chrono>
 
+/**
+ * Statistics recorded by thinning() & thinning_packed()
+ * if a non-NULL pointer is passed.
+ * Keep in sync with the cdef in thinning.py
+ */
+typedef struct {
+	/* Number of iterations (pairs of sub-iterations) performed */
+	size_t iterations;
+	/* 1 if the last iteration did not delete any pixel, else 0 (max_iterations reached) */
+	int converged;
+	/* Pixels deleted in each sub-iteration. Allocated by the C code, free using thinning_stats_free() */
+	size_t* deletions;
+	size_t num_subiterations;
+	size_t deletions_capacity;
+	/* Estimated number of image & scratch buffer bytes read or written */
+	size_t bytes_touched;
+	/* Wall time of the individual phases */
+	double setup_seconds; /* Scratch buffer initialization, packing */
+	double evaluate_seconds; /* Finding deletable pixels */
+	double apply_seconds; /* Deleting pixels */
+	double finish_seconds; /* Unpacking */
+} thinning_stats;
+
+/**
+ * Opaque scratch buffers for thinning(), see below
+ */
+struct thinning_workspace;
 
 //Forward declaration required due to CFFI's requirement to have unmangled symbols
 extern "C" {
 	CFFI_DLLEXPORT int guo_hall_thinning(uint8_t* binary_image, size_t width, size_t height);
 	CFFI_DLLEXPORT int zhang_suen_thinning(uint8_t* binary_image, size_t width, size_t height);
+	CFFI_DLLEXPORT int thinning(uint8_t* binary_image, size_t width, size_t height, int algorithm, int method, int num_threads,
+		size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, size_t max_iterations, thinning_stats* stats,
+		thinning_workspace* workspace);
+	CFFI_DLLEXPORT int thinning_table(uint8_t* dst, int algorithm);
+	CFFI_DLLEXPORT int thinning_packed(uint64_t* binary_image, size_t words_per_row, size_t width, size_t height, int algorithm,
+		size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, size_t max_iterations, thinning_stats* stats);
+	CFFI_DLLEXPORT void thinning_stats_free(thinning_stats* stats);
+	CFFI_DLLEXPORT thinning_workspace* thinning_workspace_new();
+	CFFI_DLLEXPORT void thinning_workspace_free(thinning_workspace* workspace);
+	CFFI_DLLEXPORT size_t thinning_workspace_size(const thinning_workspace* workspace);
+	CFFI_DLLEXPORT int thinning_batch(uint8_t* images, size_t count, size_t width, size_t height, int algorithm, int method, int num_threads);
+}
+
+/**
+ * Algorithm & method identifiers.
+ * Keep in sync with ThinningAlgorithm and ThinningMethod in thinning.py
+ */
+enum {
+	THINNING_GUO_HALL = 0,
+	THINNING_ZHANG_SUEN = 1
+};
+
+enum {
+	THINNING_METHOD_RASTER = 0,
+	THINNING_METHOD_FRONTIER = 1,
+	THINNING_METHOD_PACKED = 2
+};
+
+
+/**
+ * Tracks the progress of a thinning run: Decides when to stop
+ * (convergence or max_iterations) and, if stats is not NULL,
+ * records the statistics.
+ */
+class ThinningMonitor {
+public:
+	ThinningMonitor(thinning_stats* stats, size_t max_iterations)
+		: stats(stats), max_iterations(max_iterations), iterations(0), failed(false) {
+		if (stats != NULL) {
+			memset(stats, 0, sizeof(thinning_stats));
+			last = std::chrono::steady_clock::now();
+		}
+	}
+
+	/**
+	 * Add the wall time since the last call (or the construction)
+	 * to the given phase of the statistics.
+	 */
+	void lap(double thinning_stats::* phase) {
+		if (stats != NULL) {
+			std::chrono::steady_clock::time_point now = std::chrono::steady_clock::now();
+			stats->*phase += std::chrono::duration<double>(now - last).count();
+			last = now;
+		}
+	}
+
+	void touched(size_t bytes) {
+		if (stats != NULL) {
+			stats->bytes_touched += bytes;
+		}
+	}
+
+	/**
+	 * Record the number of pixels deleted in a sub-iteration
+	 */
+	void subiteration(size_t deleted) {
+		if (stats == NULL) {
+			return;
+		}
+		if (stats->num_subiterations == stats->deletions_capacity) {
+			size_t capacity = (stats->deletions_capacity == 0) ? 64 : 2 * stats->deletions_capacity;
+			size_t* deletions = (size_t*) realloc(stats->deletions, capacity * sizeof(size_t));
+			if (deletions == NULL) {
+				failed = true;
+				return;
+			}
+			stats->deletions = deletions;
+			stats->deletions_capacity = capacity;
+		}
+		stats->deletions[stats->num_subiterations++] = deleted;
+	}
+
+	/**
+	 * Call after every iteration (pair of sub-iterations) with the total
+	 * number of pixels deleted in that iteration.
+	 * Returns true if another iteration shall be performed.
+	 */
+	bool next_iteration(size_t changed) {
+		iterations++;
+		bool converged = (changed == 0);
+		if (stats != NULL) {
+			stats->iterations = iterations;
+			stats->converged = converged;
+		}
+		return !converged && (max_iterations == 0 || iterations < max_iterations);
+	}
+
+	/**
+	 * Return code: -1 if the statistics could not be recorded
+	 * due to a memory allocation failure, else 0.
+	 */
+	int result() const {
+		return failed ? -1 : 0;
+	}
+
+private:
+	thinning_stats* stats;
+	size_t max_iterations;
+	size_t iterations;
+	bool failed;
+	std::chrono::steady_clock::time_point last;
+};
+
+/**
+ * Free the memory allocated by the C code for the statistics
+ */
+CFFI_DLLEXPORT void thinning_stats_free(thinning_stats* stats) {
+	free(stats->deletions);
+	stats->deletions = NULL;
+	stats->deletions_capacity = 0;
 }
 
- 
 /**
  * Perform a logical AND on a memory array (a), ANDing it with another array (b)
  * We expect this function to be optimized by the compiler
@@ -26,156 +178,868 @@ void bitwiseANDInPlace(uint8_t* a, const uint8_t* b, size_t size) {
 }
 
 /**
- * Performs a single iteration of the Guo-Hall algorithm.
+ * Guo-Hall deletion condition for a foreground pixel with the given
+ * neighbourhood code (bit layout as computed by binary_neighbours()).
  * See http://opencv-code.com/quick-tips/implementation-of-guo-hall-thinning-algorithm/
  * and the original paper http://dx.doi.org/10.1145/62065.62074 for details.
  *
+ * This is only used to build the deletion tables.
+ */
+static bool guo_hall_deletable(uint8_t code, bool oddIteration) {
+	// In the paper, figure 1 lists which Px corresponds to which coordinate
+	bool p2 = code & (1 << 1); // N
+	bool p3 = code & (1 << 2); // NE
+	bool p4 = code & (1 << 4); // E
+	bool p5 = code & (1 << 7); // SE
+	bool p6 = code & (1 << 6); // S
+	bool p7 = code & (1 << 5); // SW
+	bool p8 = code & (1 << 3); // W
+	bool p9 = code & (1 << 0); // NW
+
+	unsigned int N1 = (p9 || p2) + (p3 || p4) + (p5 || p6) + (p7 || p8);
+	unsigned int N2 = (p2 || p3) + (p4 || p5) + (p6 || p7) + (p8 || p9);
+	unsigned int N = N1 < N2 ? N1 : N2;
+	unsigned int m =
+		oddIteration ? (p8 && (p6 || p7 || !p9))
+				     : (p4 && (p2 || p3 || !p5));
+	unsigned int C =
+		((!p2 && (p3 || p4)) +
+		 (!p4 && (p5 || p6)) +
+		 (!p6 && (p7 || p8)) +
+		 (!p8 && (p9 || p2)));
+	return C == 1 && N >= 2 && N <= 3 && m == 0;
+}
+
+/**
+ * Zhang-Suen deletion condition for a foreground pixel with the given
+ * neighbourhood code (bit layout as computed by binary_neighbours()).
+ * See http://opencv-code.com/quick-tips/implementation-of-thinning-algorithm-in-opencv/
+ * and the original paper https://dx.doi.org/10.1145/357994.358023 for details.
+ *
+ * This is only used to build the deletion tables.
+ */
+static bool zhang_suen_deletable(uint8_t code, bool oddIteration) {
+	// In the Guo-Hall paper, figure 1 lists which Px corresponds to which coordinate
+	bool p2 = code & (1 << 1); // N
+	bool p3 = code & (1 << 2); // NE
+	bool p4 = code & (1 << 4); // E
+	bool p5 = code & (1 << 7); // SE
+	bool p6 = code & (1 << 6); // S
+	bool p7 = code & (1 << 5); // SW
+	bool p8 = code & (1 << 3); // W
+	bool p9 = code & (1 << 0); // NW
+
+	int A  = (p2 == 0 && p3 == 1) + (p3 == 0 && p4 == 1) +
+	         (p4 == 0 && p5 == 1) + (p5 == 0 && p6 == 1) +
+	         (p6 == 0 && p7 == 1) + (p7 == 0 && p8 == 1) +
+	         (p8 == 0 && p9 == 1) + (p9 == 0 && p2 == 1);
+	int B  = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9;
+	int m1 = oddIteration ? (p2 * p4 * p8) : (p2 * p4 * p6);
+	int m2 = oddIteration ? (p2 * p6 * p8) : (p4 * p6 * p8);
+
+	return A == 1 && (B >= 2 && B <= 6) && m1 == 0 && m2 == 0;
+}
+
+/**
+ * Precomputed deletion tables.
+ *
+ * code[algorithm][parity][c] is 1 if a foreground pixel with the
+ * binary_neighbours() code c is deleted in an even (parity 0)
+ * or odd (parity 1) sub-iteration.
+ *
+ * window[algorithm][parity][w] is the same table indexed by the 3x3
+ * window w (including the center pixel) as maintained by the rolling
+ * raster scan. For a row r, the three bits (r[x-1], r[x], r[x+1]) are
+ * stored as bits (2, 1, 0). The top row occupies bits 0-2,
+ * the center row bits 3-5 and the bottom row bits 6-8.
+ * Windows with a background center pixel are never deleted.
+ */
+struct ThinningTables {
+	uint8_t code[2][2][256];
+	uint8_t window[2][2][512];
+
+	ThinningTables() {
+		for (int algorithm = 0; algorithm < 2; algorithm++) {
+			for (int parity = 0; parity < 2; parity++) {
+				for (int c = 0; c < 256; c++) {
+					code[algorithm][parity][c] = (algorithm == THINNING_GUO_HALL)
+						? guo_hall_deletable(c, parity == 1)
+						: zhang_suen_deletable(c, parity == 1);
+				}
+				for (int w = 0; w < 512; w++) {
+					window[algorithm][parity][w] = ((w >> 4) & 1)
+						? code[algorithm][parity][window_to_code(w)] : 0;
+				}
+			}
+		}
+	}
+
+	static uint8_t window_to_code(unsigned int w) {
+		return ((w >> 2) & 1) << 0  // NW
+			| ((w >> 1) & 1) << 1   // N
+			| ((w >> 0) & 1) << 2   // NE
+			| ((w >> 5) & 1) << 3   // W
+			| ((w >> 3) & 1) << 4   // E
+			| ((w >> 8) & 1) << 5   // SW
+			| ((w >> 7) & 1) << 6   // S
+			| ((w >> 6) & 1) << 7;  // SE
+	}
+};
+
+static const ThinningTables& thinning_tables() {
+	static const ThinningTables tables;
+	return tables;
+}
+
+/**
+ * Compute the binary_neighbours() code of the interior pixel at (x, y)
+ */
+static inline uint8_t neighbourhood_code(const uint8_t* img, size_t width, size_t x, size_t y) {
+	return (IMG_XY(img, x - 1, y - 1) != 0) << 0
+		| (IMG_XY(img, x, y - 1) != 0) << 1
+		| (IMG_XY(img, x + 1, y - 1) != 0) << 2
+		| (IMG_XY(img, x - 1, y) != 0) << 3
+		| (IMG_XY(img, x + 1, y) != 0) << 4
+		| (IMG_XY(img, x - 1, y + 1) != 0) << 5
+		| (IMG_XY(img, x, y + 1) != 0) << 6
+		| (IMG_XY(img, x + 1, y + 1) != 0) << 7;
+}
+
+/**
+ * Region of the image the thinning algorithms operate on:
+ * Columns [x0, x1) and rows [y0, y1), clipped to the interior of the
+ * image (the outermost rows and columns are never modified).
+ * Neighbours outside the region are read from the image as usual.
+ */
+struct ThinningRoi {
+	size_t x0, x1, y0, y1;
+
+	ThinningRoi(size_t width, size_t height, size_t x, size_t y, size_t w, size_t h) {
+		x0 = (x > 1) ? x : 1;
+		y0 = (y > 1) ? y : 1;
+		x1 = (x + w < width - 1) ? x + w : width - 1;
+		y1 = (y + h < height - 1) ? y + h : height - 1;
+		if (x1 < x0) x1 = x0;
+		if (y1 < y0) y1 = y0;
+	}
+};
+
+/**
+ * Half-open range [start, end) of columns of a row
+ * that contains all its foreground pixels. Empty if start == end.
+ */
+struct RowSpan {
+	size_t start;
+	size_t end;
+};
+
+/**
+ * Compute the foreground span of every row in the region
+ * and initialize the mask for these spans.
+ */
+static void init_row_spans(const uint8_t* img, uint8_t* mask, RowSpan* spans, size_t width, const ThinningRoi& roi) {
+	for (size_t y = roi.y0; y < roi.y1; y++) {
+		const uint8_t* row = img + width * y;
+		size_t start = roi.x0;
+		size_t end = roi.x1;
+		while (start < end && row[start] == 0) start++;
+		while (end > start && row[end - 1] == 0) end--;
+		spans[y].start = start;
+		spans[y].end = end;
+		/**
+		 * It is important to understand that with Guo-Hall black pixels will never get white.
+		 * Therefore we don't need to reset the mask in each iteration.
+		 * Especially for large images, this saves us many Mibibytes of memory transfer.
+		 */
+		memset(mask + width * y + start, UCHAR_MAX, end - start);
+	}
+}
+
+/**
+ * Performs a single sub-iteration of a table-driven thinning algorithm
+ * on the foreground spans of the rows [ystart, yend).
+ * table is one of the ThinningTables::window tables.
+ *
+ * Deletable pixels are only marked in the mask, img is not modified.
+ * Use apply_mask_rows() once all rows have been processed.
+ *
+ * The 3x3 window is rolled along each row so every pixel costs
+ * three loads and a single table lookup. Empty parts of the image
+ * are skipped 8 pixels at a time.
+ *
  * Compared to the opencv-code.com implementation, we also count the number of
  * changes during the iteration in order to avoid the cv::absdiff() call and the
  * super-expensive whole-image (possibly multi-Mibibyte) copy to prev.
  */
-int guo_hall_iteration(uint8_t* img, uint8_t* mask, size_t width, size_t height, bool oddIteration) {
-	/** 
+static size_t thinning_rows(const uint8_t* img, uint8_t* mask, const RowSpan* spans, size_t width, size_t ystart, size_t yend,
+		const uint8_t* table, size_t& scanned) {
+	/**
 	 * Compared to
 	 * http://opencv-code.com/quick-tips/implementation-of-guo-hall-thinning-algorithm/
 	 * we compute the mask in an inverted way so we don't have to invert while performing
 	 * the AND.
 	 */
-	int changed = 0;
-	for (unsigned int y = 1; y < height - 1; y++) {
-		for (unsigned int x = 1; x < width - 1; x++) {
-			if(IMG_XY(img, x, y) == 0) continue;
-			// In the paper, figure 1 lists which Px corresponds to which coordinate
-			bool p2 = IMG_XY(img, x, y - 1);
-			bool p3 = IMG_XY(img, x + 1, y - 1);
-			bool p4 = IMG_XY(img, x + 1, y);
-			bool p5 = IMG_XY(img, x + 1, y + 1);
-			bool p6 = IMG_XY(img, x, y + 1);
-			bool p7 = IMG_XY(img, x - 1, y + 1);
-			bool p8 = IMG_XY(img, x - 1, y);
-			bool p9 = IMG_XY(img, x - 1, y - 1);
-
-			unsigned int N1 = (p9 || p2) + (p3 || p4) + (p5 || p6) + (p7 || p8);
-			unsigned int N2 = (p2 || p3) + (p4 || p5) + (p6 || p7) + (p8 || p9);
-			unsigned int N = N1 < N2 ? N1 : N2;
-			unsigned int m = 
-				oddIteration ? (p8 && (p6 || p7 || !p9))
-						     : (p4 && (p2 || p3 || !p5));
-			unsigned int C =
-				((!p2 && (p3 || p4)) +
-				 (!p4 && (p5 || p6)) +
-				 (!p6 && (p7 || p8)) +
-				 (!p8 && (p9 || p2)));
-			if (C == 1 && N >= 2 && N <= 3 && m == 0)   {
-				//See above - mask is computed in an inverted waay
-				IMG_XY(mask, x, y) = 0;
-				changed++;
+	size_t changed = 0;
+	for (size_t y = ystart; y < yend; y++) {
+		size_t x = spans[y].start;
+		size_t xlimit = spans[y].end;
+		if (x == xlimit) {
+			continue;
+		}
+		scanned += xlimit - x;
+		const uint8_t* top = img + width * (y - 1);
+		const uint8_t* mid = img + width * y;
+		const uint8_t* bot = img + width * (y + 1);
+		uint8_t* maskrow = mask + width * y;
+		// Window for x - 1 (the column x - 2 is shifted out before use)
+		unsigned int window =
+			  ((top[x - 1] != 0) << 1) | (top[x] != 0)
+			| ((mid[x - 1] != 0) << 4) | ((mid[x] != 0) << 3)
+			| ((bot[x - 1] != 0) << 7) | ((bot[x] != 0) << 6);
+		while (x < xlimit) {
+			/**
+			 * Skip blocks of 8 pixels whose windows are all empty.
+			 * window currently covers the columns x - 2 .. x, so
+			 * columns x - 1 and x are taken from there.
+			 */
+			if ((window & 0333) == 0 && x + 9 <= width) {
+				uint64_t t, m, b;
+				memcpy(&t, top + x + 1, 8);
+				memcpy(&m, mid + x + 1, 8);
+				memcpy(&b, bot + x + 1, 8);
+				if ((t | m | b) == 0) {
+					window = 0;
+					x += 8;
+					continue;
+				}
+			}
+			size_t xend = (x + 8 < xlimit) ? x + 8 : xlimit;
+			for (; x < xend; x++) {
+				window = ((window << 1) & 0666)
+					| (top[x + 1] != 0)
+					| ((mid[x + 1] != 0) << 3)
+					| ((bot[x + 1] != 0) << 6);
+				if (table[window]) {
+					//See above - mask is computed in an inverted waay
+					maskrow[x] = 0;
+					changed++;
+				}
 			}
 		}
 	}
-	bitwiseANDInPlace(img, mask, width * height);
 	return changed;
 }
 
+/**
+ * Apply the (inverted) deletion mask to the foreground spans
+ * of the rows [ystart, yend) and shrink the spans accordingly.
+ */
+static void apply_mask_rows(uint8_t* img, const uint8_t* mask, RowSpan* spans, size_t width, size_t ystart, size_t yend) {
+	for (size_t y = ystart; y < yend; y++) {
+		size_t start = spans[y].start;
+		size_t end = spans[y].end;
+		if (start == end) {
+			continue;
+		}
+		uint8_t* row = img + width * y;
+		bitwiseANDInPlace(row + start, mask + width * y + start, end - start);
+		while (start < end && row[start] == 0) start++;
+		while (end > start && row[end - 1] == 0) end--;
+		spans[y].start = start;
+		spans[y].end = end;
+	}
+}
 
 /**
- * Performs a single iteration of the Zhang-Suen algorithm.
- * See http://opencv-code.com/quick-tips/implementation-of-thinning-algorithm-in-opencv/
- * and the original paper https://dx.doi.org/10.1145/357994.358023 for details.
- * 
- * This function is very similar to the Guo-Hall algorithm. See guo_hall_iteration() for more implementation details
- */
-int zhang_suen_iteration(uint8_t* img, uint8_t* mask, size_t width, size_t height, bool oddIteration) {
-
-	int changed = 0;
-	for (unsigned int y = 1; y < height - 1; y++) {
-		for (unsigned int x = 1; x < width - 1; x++) {
-			if(IMG_XY(img, x, y) == 0) continue;
-			// In the Guo-Hall paper, figure 1 lists which Px corresponds to which coordinate
-			bool p2 = IMG_XY(img, x, y - 1);
-			bool p3 = IMG_XY(img, x + 1, y - 1);
-			bool p4 = IMG_XY(img, x + 1, y);
-			bool p5 = IMG_XY(img, x + 1, y + 1);
-			bool p6 = IMG_XY(img, x, y + 1);
-			bool p7 = IMG_XY(img, x - 1, y + 1);
-			bool p8 = IMG_XY(img, x - 1, y);
-			bool p9 = IMG_XY(img, x - 1, y - 1);
-
-			int A  = (p2 == 0 && p3 == 1) + (p3 == 0 && p4 == 1) + 
-                     (p4 == 0 && p5 == 1) + (p5 == 0 && p6 == 1) + 
-                     (p6 == 0 && p7 == 1) + (p7 == 0 && p8 == 1) +
-                     (p8 == 0 && p9 == 1) + (p9 == 0 && p2 == 1);
-            int B  = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9;
-            int m1 = oddIteration ? (p2 * p4 * p8) : (p2 * p4 * p6);
-            int m2 = oddIteration ? (p2 * p6 * p8) : (p4 * p6 * p8);
-
-			if (A == 1 && (B >= 2 && B <= 6) && m1 == 0 && m2 == 0)   {
-				IMG_XY(mask, x, y) = 0; //Inverted mask!
-				changed++;
+ * Minimum number of rows per thread for parallel raster thinning.
+ * Below that, synchronizing the threads costs more than it gains.
+ */
+#define THINNING_MIN_BAND_HEIGHT 16
+
+/**
+ * Parallel raster thinning.
+ *
+ * The rows of the region are split into one band per thread.
+ * Every sub-iteration is performed in two phases separated by barriers:
+ * First, all threads mark the deletable pixels of their band (reading
+ * one row above and below their band). Then, all threads apply the mask
+ * to their band. Hence the result is identical to the serial version.
+ */
+static void parallel_raster_thinning(uint8_t* img, uint8_t* mask, RowSpan* spans, size_t width,
+		const ThinningRoi& roi, const uint8_t* const* tables, size_t num_threads, ThinningMonitor& monitor) {
+	Barrier barrier;
+	std::atomic<size_t> changed(0);
+	std::atomic<size_t> scanned(0);
+	size_t iterationChanged = 0;
+	bool done = false;
+	run_threads(num_threads, [&](size_t index, size_t count) {
+		size_t rows = roi.y1 - roi.y0;
+		size_t ystart = roi.y0 + rows * index / count;
+		size_t yend = roi.y0 + rows * (index + 1) / count;
+		while (!done) {
+			for (int parity = 0; parity < 2; parity++) {
+				size_t bandScanned = 0;
+				changed += thinning_rows(img, mask, spans, width, ystart, yend, tables[parity], bandScanned);
+				scanned += bandScanned;
+				// All bands must be evaluated before any band is modified ...
+				barrier.wait([&] { monitor.lap(&thinning_stats::evaluate_seconds); });
+				apply_mask_rows(img, mask, spans, width, ystart, yend);
+				// ... and modified before the next sub-iteration starts
+				barrier.wait([&] {
+					monitor.lap(&thinning_stats::apply_seconds);
+					monitor.subiteration(changed);
+					monitor.touched(6 * scanned);
+					iterationChanged += changed;
+					changed = 0;
+					scanned = 0;
+					if (parity == 1) {
+						done = !monitor.next_iteration(iterationChanged);
+						iterationChanged = 0;
+					}
+				});
 			}
 		}
+	}, &barrier);
+}
+
+/**
+ * Raster thinning: Scan the region in every sub-iteration
+ * until an iteration does not change any pixel.
+ *
+ * Only the foreground span of every row is scanned, and the spans as
+ * well as the range of non-empty rows shrink as pixels are deleted.
+ *
+ * mask is a scratch buffer the size of the image,
+ * spans a scratch buffer of height RowSpans.
+ */
+static void raster_thinning_masked(uint8_t* binary_image, uint8_t* mask, RowSpan* spans, size_t width,
+		const ThinningRoi& roi, int algorithm, int num_threads, ThinningMonitor& monitor) {
+	init_row_spans(binary_image, mask, spans, width, roi);
+	monitor.touched(2 * (roi.x1 - roi.x0) * (roi.y1 - roi.y0));
+	monitor.lap(&thinning_stats::setup_seconds);
+
+	const ThinningTables& tables = thinning_tables();
+	const uint8_t* parityTables[2] = {tables.window[algorithm][0], tables.window[algorithm][1]};
+
+	size_t maxThreads = (roi.y1 - roi.y0) / THINNING_MIN_BAND_HEIGHT;
+	size_t threads = (num_threads < 1) ? 1 : (size_t)num_threads;
+	threads = (threads < maxThreads) ? threads : maxThreads;
+	if (threads > 1) {
+		parallel_raster_thinning(binary_image, mask, spans, width, roi, parityTables, threads, monitor);
+	} else {
+		size_t ystart = roi.y0;
+		size_t yend = roi.y1;
+		size_t changed;
+		do {
+			changed = 0;
+			for (int parity = 0; parity < 2; parity++) {
+				size_t scanned = 0;
+				size_t deleted = thinning_rows(binary_image, mask, spans, width, ystart, yend, parityTables[parity], scanned);
+				monitor.lap(&thinning_stats::evaluate_seconds);
+				apply_mask_rows(binary_image, mask, spans, width, ystart, yend);
+				monitor.lap(&thinning_stats::apply_seconds);
+				monitor.subiteration(deleted);
+				// 3 rows read for evaluation, mask & image read and image written when applying
+				monitor.touched(6 * scanned);
+				changed += deleted;
+			}
+			// Shrink the range of rows to the ones that still have foreground pixels
+			while (ystart < yend && spans[ystart].start == spans[ystart].end) ystart++;
+			while (yend > ystart && spans[yend - 1].start == spans[yend - 1].end) yend--;
+		} while (monitor.next_iteration(changed));
 	}
-	bitwiseANDInPlace(img, mask, width * height);
-	return changed;
 }
 
 /**
  * Main Guo-Hall thinning function (optimized).
- * See guo_hall_iteration() for more documentation.
+ * See guo_hall_deletable() for the deletion condition.
  */
 CFFI_DLLEXPORT int guo_hall_thinning(uint8_t* binary_image, size_t width, size_t height) {
-	/* return -1 if we can't allocate the memory for the mask, else 0 */
-	uint8_t* mask = (uint8_t*) malloc(width * height);
-	if (mask == NULL) {
-		return -1;
+	return thinning(binary_image, width, height, THINNING_GUO_HALL, THINNING_METHOD_RASTER, 1,
+		0, 0, width, height, 0, NULL, NULL);
+}
+
+
+/**
+ * Main Zhang-Suen thinning function (optimized).
+ * See zhang_suen_deletable() for the deletion condition.
+ */
+CFFI_DLLEXPORT int zhang_suen_thinning(uint8_t* binary_image, size_t width, size_t height) {
+	return thinning(binary_image, width, height, THINNING_ZHANG_SUEN, THINNING_METHOD_RASTER, 1,
+		0, 0, width, height, 0, NULL, NULL);
+}
+
+
+/**
+ * Append the foreground pixels of the region in the 8-neighbourhood of
+ * every pixel in deleted to candidates. Uses queued to avoid
+ * duplicate entries (queued must be all-zero on entry and is
+ * reset to all-zero by the caller).
+ */
+static void frontier_enqueue_neighbours(const uint8_t* img, uint8_t* queued,
+		const std::vector<size_t>& deleted, std::vector<size_t>& candidates,
+		size_t width, const ThinningRoi& roi) {
+	for (size_t i = 0; i < deleted.size(); i++) {
+		size_t x = deleted[i] % width;
+		size_t y = deleted[i] / width;
+		size_t ystart = (y > roi.y0) ? y - 1 : roi.y0;
+		size_t yend = (y + 2 <= roi.y1) ? y + 1 : roi.y1 - 1;
+		size_t xstart = (x > roi.x0) ? x - 1 : roi.x0;
+		size_t xend = (x + 2 <= roi.x1) ? x + 1 : roi.x1 - 1;
+		for (size_t ny = ystart; ny <= yend; ny++) {
+			for (size_t nx = xstart; nx <= xend; nx++) {
+				size_t idx = nx + width * ny;
+				if (img[idx] != 0 && !queued[idx]) {
+					queued[idx] = 1;
+					candidates.push_back(idx);
+				}
+			}
+		}
 	}
+}
 
-	/**
-	 * It is important to understand that with Guo-Hall black pixels will never get white.
-	 * Therefore we don't need to reset the mask in each iteration.
-	 * Especially for large images, this saves us many Mibibytes of memory transfer.
-	 */
-	memset(mask, UCHAR_MAX, width*height);
+/**
+ * Scratch buffers for frontier_thinning(), reusable across calls.
+ * queued is all-zero between calls.
+ */
+struct FrontierScratch {
+	std::vector<uint8_t> queued;
+	std::vector<size_t> candidates;
+	std::vector<size_t> deleted, lastDeleted, prevDeleted;
+};
 
-	int changed;
+/**
+ * Worklist-driven thinning.
+ *
+ * Whether a pixel is deleted in a sub-iteration depends only on its
+ * 3x3 neighbourhood and the sub-iteration parity. Hence a pixel needs
+ * to be re-examined only if its neighbourhood changed since it was last
+ * examined with the same parity, i.e. if one of its neighbours was
+ * deleted in one of the previous two sub-iterations.
+ * The first two sub-iterations examine every foreground pixel.
+ *
+ * Deletions are applied only after all candidates have been examined,
+ * so the result is identical to the raster implementation while the
+ * cost is roughly proportional to the number of foreground pixels.
+ *
+ * Throws std::bad_alloc if the scratch buffers can't be allocated.
+ */
+static void frontier_thinning_scratch(uint8_t* img, size_t width, size_t height, const ThinningRoi& roi,
+		int algorithm, FrontierScratch& scratch, ThinningMonitor& monitor) {
+	const ThinningTables& tables = thinning_tables();
+	std::vector<uint8_t>& queued = scratch.queued;
+	std::vector<size_t>& candidates = scratch.candidates;
+	std::vector<size_t>& deleted = scratch.deleted;
+	std::vector<size_t>& lastDeleted = scratch.lastDeleted;
+	std::vector<size_t>& prevDeleted = scratch.prevDeleted;
+	if (queued.size() < width * height) {
+		queued.resize(width * height, 0);
+	}
+	lastDeleted.clear();
+	prevDeleted.clear();
+	monitor.lap(&thinning_stats::setup_seconds);
+	bool firstIteration = true;
+	size_t changed;
 	do {
-		changed =
-			guo_hall_iteration(binary_image, mask, width, height, false) +
-		    guo_hall_iteration(binary_image, mask, width, height, true);
-	} while (changed != 0);
+		changed = 0;
+		for (int parity = 0; parity < 2; parity++) {
+			const uint8_t* table = tables.code[algorithm][parity];
+			candidates.clear();
+			if (firstIteration) {
+				for (size_t y = roi.y0; y < roi.y1; y++) {
+					for (size_t x = roi.x0; x < roi.x1; x++) {
+						if (IMG_XY(img, x, y) != 0) {
+							candidates.push_back(x + width * y);
+						}
+					}
+				}
+				monitor.touched((roi.x1 - roi.x0) * (roi.y1 - roi.y0));
+			} else {
+				frontier_enqueue_neighbours(img, queued.data(), lastDeleted, candidates, width, roi);
+				frontier_enqueue_neighbours(img, queued.data(), prevDeleted, candidates, width, roi);
+				for (size_t i = 0; i < candidates.size(); i++) {
+					queued[candidates[i]] = 0;
+				}
+				monitor.touched(9 * (lastDeleted.size() + prevDeleted.size()) + candidates.size());
+			}
+			// Examine all candidates before deleting anything
+			deleted.clear();
+			for (size_t i = 0; i < candidates.size(); i++) {
+				size_t idx = candidates[i];
+				if (table[neighbourhood_code(img, width, idx % width, idx / width)]) {
+					deleted.push_back(idx);
+				}
+			}
+			monitor.touched(8 * candidates.size());
+			monitor.lap(&thinning_stats::evaluate_seconds);
+			for (size_t i = 0; i < deleted.size(); i++) {
+				img[deleted[i]] = 0;
+			}
+			monitor.touched(deleted.size());
+			monitor.lap(&thinning_stats::apply_seconds);
+			monitor.subiteration(deleted.size());
+			changed += deleted.size();
+			prevDeleted.swap(lastDeleted);
+			lastDeleted.swap(deleted);
+		}
+		firstIteration = false;
+	} while (monitor.next_iteration(changed));
+}
 
-	//Cleanup
-	free(mask);
-	return 0;
+/**
+ * Bit-sliced counter: Tracks, for each of the 64 lanes of a word,
+ * whether at least one or at least two of the added words had the bit set.
+ */
+struct BitCounter {
+	uint64_t ones;
+	uint64_t twos;
+
+	BitCounter() : ones(0), twos(0) {}
+
+	inline void add(uint64_t word) {
+		twos |= ones & word;
+		ones |= word;
+	}
+
+	inline uint64_t exactly_one() const {
+		return ones & ~twos;
+	}
+};
+
+/**
+ * Evaluate the deletion condition for 64 pixels at once.
+ * The arguments are the neighbour bit planes (see guo_hall_deletable()
+ * and zhang_suen_deletable() for the naming), the result has a bit set
+ * for every lane that is deleted if the center pixel is set.
+ */
+static inline uint64_t guo_hall_deletable_word(uint64_t p2, uint64_t p3, uint64_t p4, uint64_t p5,
+		uint64_t p6, uint64_t p7, uint64_t p8, uint64_t p9, bool oddIteration) {
+	// C == 1
+	BitCounter C;
+	C.add(~p2 & (p3 | p4));
+	C.add(~p4 & (p5 | p6));
+	C.add(~p6 & (p7 | p8));
+	C.add(~p8 & (p9 | p2));
+	// 2 <= min(N1, N2) <= 3
+	uint64_t n1a = p9 | p2, n1b = p3 | p4, n1c = p5 | p6, n1d = p7 | p8;
+	uint64_t n2a = p2 | p3, n2b = p4 | p5, n2c = p6 | p7, n2d = p8 | p9;
+	BitCounter N1, N2;
+	N1.add(n1a); N1.add(n1b); N1.add(n1c); N1.add(n1d);
+	N2.add(n2a); N2.add(n2b); N2.add(n2c); N2.add(n2d);
+	uint64_t N = N1.twos & N2.twos & ~(n1a & n1b & n1c & n1d & n2a & n2b & n2c & n2d);
+	uint64_t m = oddIteration ? (p8 & (p6 | p7 | ~p9))
+	                          : (p4 & (p2 | p3 | ~p5));
+	return C.exactly_one() & N & ~m;
 }
 
+static inline uint64_t zhang_suen_deletable_word(uint64_t p2, uint64_t p3, uint64_t p4, uint64_t p5,
+		uint64_t p6, uint64_t p7, uint64_t p8, uint64_t p9, bool oddIteration) {
+	// A == 1: Exactly one 0 -> 1 transition in the sequence p2, p3, ..., p9, p2
+	BitCounter A;
+	A.add(~p2 & p3); A.add(~p3 & p4); A.add(~p4 & p5); A.add(~p5 & p6);
+	A.add(~p6 & p7); A.add(~p7 & p8); A.add(~p8 & p9); A.add(~p9 & p2);
+	// 2 <= B <= 6: At least two set and at least two unset neighbours
+	BitCounter set, unset;
+	uint64_t p[8] = {p2, p3, p4, p5, p6, p7, p8, p9};
+	for (int i = 0; i < 8; i++) {
+		set.add(p[i]);
+		unset.add(~p[i]);
+	}
+	uint64_t m1 = oddIteration ? (p2 & p4 & p8) : (p2 & p4 & p6);
+	uint64_t m2 = oddIteration ? (p2 & p6 & p8) : (p4 & p6 & p8);
+	return A.exactly_one() & set.twos & unset.twos & ~m1 & ~m2;
+}
 
 /**
- * Main Zhang-Suen thinning function (optimized).
- * See guo_hall_thinning() for more documentation.
+ * Performs a single sub-iteration of word-parallel thinning on the rows
+ * [ystart, yend) of a packed binary image (see packed.hpp),
+ * evaluating 64 pixels at once.
+ *
+ * above and current are scratch buffers of words_per_row words.
+ * colmask has the bits of all columns of the region set.
  */
-CFFI_DLLEXPORT int zhang_suen_thinning(uint8_t* binary_image, size_t width, size_t height) {
-	/* return -1 if we can't allocate the memory for the mask, else 0 */
-	uint8_t* mask = (uint8_t*) malloc(width * height);
-	if (mask == NULL) {
-		return -1;
+template<uint64_t (*deletable)(uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, uint64_t, bool)>
+static size_t packed_thinning_iteration(uint64_t* img, size_t words, size_t ystart, size_t yend,
+		uint64_t* above, uint64_t* current, const uint64_t* colmask, bool oddIteration) {
+	size_t changed = 0;
+	// We need the unmodified previous row, so we keep a copy of it
+	memcpy(above, img + words * (ystart - 1), words * sizeof(uint64_t));
+	for (size_t y = ystart; y < yend; y++) {
+		uint64_t* row = img + words * y;
+		const uint64_t* below = img + words * (y + 1);
+		memcpy(current, row, words * sizeof(uint64_t));
+		for (size_t w = 0; w < words; w++) {
+			uint64_t center = current[w];
+			if ((center & colmask[w]) == 0) {
+				continue;
+			}
+			// Bit x of "west" is pixel x - 1, bit x of "east" is pixel x + 1
+			uint64_t upWest = (above[w] << 1) | (w > 0 ? above[w - 1] >> 63 : 0);
+			uint64_t upEast = (above[w] >> 1) | (w + 1 < words ? above[w + 1] << 63 : 0);
+			uint64_t west = (center << 1) | (w > 0 ? current[w - 1] >> 63 : 0);
+			uint64_t east = (center >> 1) | (w + 1 < words ? current[w + 1] << 63 : 0);
+			uint64_t downWest = (below[w] << 1) | (w > 0 ? below[w - 1] >> 63 : 0);
+			uint64_t downEast = (below[w] >> 1) | (w + 1 < words ? below[w + 1] << 63 : 0);
+			uint64_t del = center & colmask[w] & deletable(
+				above[w], upEast, east, downEast, below[w], downWest, west, upWest, oddIteration);
+			row[w] = center & ~del;
+			changed += __builtin_popcountll(del);
+		}
+		uint64_t* tmp = above;
+		above = current;
+		current = tmp;
 	}
+	return changed;
+}
 
-	/**
-	 * It is important to understand that with Guo-Hall black pixels will never get white.
-	 * Therefore we don't need to reset the mask in each iteration.
-	 * Especially for large images, this saves us many Mibibytes of memory transfer.
-	 */
-	memset(mask, UCHAR_MAX, width*height);
+/**
+ * Word-parallel thinning of a packed binary image (see packed.hpp).
+ * Only the pixels in the given region of interest are modified.
+ * The result is identical to raster thinning.
+ *
+ * scratch is a buffer of 3 * words_per_row words.
+ */
+static void packed_thinning_words(uint64_t* binary_image, size_t words_per_row, const ThinningRoi& roi,
+		int algorithm, uint64_t* scratch, ThinningMonitor& monitor) {
+	uint64_t* above = scratch;
+	uint64_t* current = scratch + words_per_row;
+	uint64_t* colmask = scratch + 2 * words_per_row;
+	for (size_t w = 0; w < words_per_row; w++) {
+		uint64_t word = 0;
+		for (size_t bit = 0; bit < 64; bit++) {
+			size_t x = w * 64 + bit;
+			if (x >= roi.x0 && x < roi.x1) {
+				word |= (uint64_t)1 << bit;
+			}
+		}
+		colmask[w] = word;
+	}
+	monitor.lap(&thinning_stats::setup_seconds);
 
-	int changed;
+	size_t changed;
 	do {
-		changed =
-			zhang_suen_iteration(binary_image, mask, width, height, false) +
-		    zhang_suen_iteration(binary_image, mask, width, height, true);
-	} while (changed != 0);
+		changed = 0;
+		for (int parity = 0; parity < 2; parity++) {
+			// Deleted pixels are cleared immediately, so there is no separate apply phase.
+			// An empty ROI still records its (empty) sub-iterations like the other methods.
+			size_t deleted = 0;
+			if (roi.y0 < roi.y1) {
+				deleted = (algorithm == THINNING_GUO_HALL)
+					? packed_thinning_iteration<guo_hall_deletable_word>(
+						binary_image, words_per_row, roi.y0, roi.y1, above, current, colmask, parity == 1)
+					: packed_thinning_iteration<zhang_suen_deletable_word>(
+						binary_image, words_per_row, roi.y0, roi.y1, above, current, colmask, parity == 1);
+			}
+			monitor.lap(&thinning_stats::evaluate_seconds);
+			monitor.subiteration(deleted);
+			// 3 rows read, 1 row written, plus the row copy
+			monitor.touched(6 * sizeof(uint64_t) * words_per_row * (roi.y1 - roi.y0));
+			changed += deleted;
+		}
+	} while (monitor.next_iteration(changed));
+}
+
+/**
+ * Word-parallel thinning of a packed binary image (see packed.hpp).
+ * See thinning() for the other arguments.
+ *
+ * Returns 0 on success, -1 if memory allocation failed
+ * and -2 for invalid arguments.
+ */
+CFFI_DLLEXPORT int thinning_packed(uint64_t* binary_image, size_t words_per_row, size_t width, size_t height, int algorithm,
+		size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, size_t max_iterations, thinning_stats* stats) {
+	if (algorithm != THINNING_GUO_HALL && algorithm != THINNING_ZHANG_SUEN) {
+		return -2;
+	}
+	if (words_per_row * 64 < width || width < 3 || height < 3) {
+		return -2;
+	}
+	ThinningMonitor monitor(stats, max_iterations);
+	ThinningRoi roi(width, height, roi_x, roi_y, roi_width, roi_height);
+	uint64_t* scratch = (uint64_t*) malloc(3 * words_per_row * sizeof(uint64_t));
+	if (scratch == NULL) {
+		return -1;
+	}
+	packed_thinning_words(binary_image, words_per_row, roi, algorithm, scratch, monitor);
+	free(scratch);
+	return monitor.result();
+}
+
+/**
+ * Thin a uint8 image by packing it into packed (words_per_row * height words),
+ * running packed_thinning_words() and clearing all pixels that have been deleted.
+ */
+static void packed_thinning(uint8_t* binary_image, size_t width, size_t height, const ThinningRoi& roi, int algorithm,
+		uint64_t* packed, uint64_t* scratch, ThinningMonitor& monitor) {
+	size_t words = packed_words_per_row(width);
+	pack_binary(packed, binary_image, words, width, height);
+	packed_thinning_words(packed, words, roi, algorithm, scratch, monitor);
+	apply_packed_binary_mask(binary_image, packed, words, width, height);
+	monitor.lap(&thinning_stats::finish_seconds);
+	// Packing & unpacking read and write both images
+	monitor.touched(2 * (width + words * sizeof(uint64_t)) * height);
+}
+
+/**
+ * Scratch buffers for all thinning methods, reusable across calls.
+ * The buffers only ever grow, so once they have reached the size
+ * required for the images being processed, thinning() does not
+ * allocate any memory.
+ */
+struct thinning_workspace {
+	std::vector<uint8_t> mask;
+	std::vector<RowSpan> spans;
+	FrontierScratch frontier;
+	std::vector<uint64_t> packed;
+	std::vector<uint64_t> packedScratch;
+};
+
+/**
+ * Allocate a new, empty workspace. Returns NULL on failure.
+ */
+CFFI_DLLEXPORT thinning_workspace* thinning_workspace_new() {
+	return new (std::nothrow) thinning_workspace();
+}
+
+CFFI_DLLEXPORT void thinning_workspace_free(thinning_workspace* workspace) {
+	delete workspace;
+}
+
+/**
+ * Number of bytes currently allocated by the workspace buffers
+ */
+CFFI_DLLEXPORT size_t thinning_workspace_size(const thinning_workspace* workspace) {
+	const FrontierScratch& frontier = workspace->frontier;
+	return workspace->mask.capacity()
+		+ workspace->spans.capacity() * sizeof(RowSpan)
+		+ frontier.queued.capacity()
+		+ (frontier.candidates.capacity() + frontier.deleted.capacity()
+			+ frontier.lastDeleted.capacity() + frontier.prevDeleted.capacity()) * sizeof(size_t)
+		+ (workspace->packed.capacity() + workspace->packedScratch.capacity()) * sizeof(uint64_t);
+}
+
+template<typename T>
+static T* grow_buffer(std::vector<T>& buffer, size_t size) {
+	if (buffer.size() < size) {
+		buffer.resize(size);
+	}
+	return buffer.data();
+}
 
-	//Cleanup
-	free(mask);
+/**
+ * Run the given thinning method using the scratch buffers of workspace.
+ * Throws std::bad_alloc if the buffers can't be allocated.
+ */
+static void workspace_thinning(uint8_t* binary_image, size_t width, size_t height, const ThinningRoi& roi,
+		int algorithm, int method, int num_threads, thinning_workspace& workspace, ThinningMonitor& monitor) {
+	if (method == THINNING_METHOD_RASTER) {
+		uint8_t* mask = grow_buffer(workspace.mask, width * height);
+		RowSpan* spans = grow_buffer(workspace.spans, height);
+		raster_thinning_masked(binary_image, mask, spans, width, roi, algorithm, num_threads, monitor);
+	} else if (method == THINNING_METHOD_FRONTIER) {
+		frontier_thinning_scratch(binary_image, width, height, roi, algorithm, workspace.frontier, monitor);
+	} else {
+		size_t words = packed_words_per_row(width);
+		uint64_t* packed = grow_buffer(workspace.packed, words * height);
+		uint64_t* scratch = grow_buffer(workspace.packedScratch, 3 * words);
+		packed_thinning(binary_image, width, height, roi, algorithm, packed, scratch, monitor);
+	}
+}
+
+/**
+ * Generic thinning entry point.
+ * algorithm is one of the THINNING_* constants,
+ * method is one of the THINNING_METHOD_* constants.
+ * num_threads is the maximum number of threads to use
+ * (only used by the raster method).
+ * Only pixels in the region of interest (roi_x, roi_y, roi_width, roi_height)
+ * are modified, their neighbours outside the region are taken into account.
+ * At most max_iterations iterations are performed (0 = until convergence).
+ * If stats is not NULL, statistics are recorded. The caller must
+ * call thinning_stats_free() on it afterwards, even if an error occurred.
+ * If workspace is not NULL, its scratch buffers are used instead of
+ * allocating new ones. A workspace must not be used by multiple
+ * threads at the same time.
+ *
+ * Returns 0 on success, -1 if memory allocation failed
+ * and -2 for invalid arguments.
+ */
+CFFI_DLLEXPORT int thinning(uint8_t* binary_image, size_t width, size_t height, int algorithm, int method, int num_threads,
+		size_t roi_x, size_t roi_y, size_t roi_width, size_t roi_height, size_t max_iterations, thinning_stats* stats,
+		thinning_workspace* workspace) {
+	if (algorithm != THINNING_GUO_HALL && algorithm != THINNING_ZHANG_SUEN) {
+		return -2;
+	}
+	if (method != THINNING_METHOD_RASTER && method != THINNING_METHOD_FRONTIER
+			&& method != THINNING_METHOD_PACKED) {
+		return -2;
+	}
+	ThinningMonitor monitor(stats, max_iterations);
+	ThinningRoi roi(width, height, roi_x, roi_y, roi_width, roi_height);
+	try {
+		if (workspace != NULL) {
+			workspace_thinning(binary_image, width, height, roi, algorithm, method, num_threads, *workspace, monitor);
+		} else {
+			thinning_workspace temporary;
+			workspace_thinning(binary_image, width, height, roi, algorithm, method, num_threads, temporary, monitor);
+		}
+	} catch (const std::bad_alloc&) {
+		return -1;
+	}
+	return monitor.result();
+}
+
+/**
+ * Copy the deletion tables of the given algorithm to dst,
+ * which must have space for 512 bytes.
+ * dst[parity * 256 + code] is 1 if a foreground pixel with the given
+ * binary_neighbours() code is deleted in an even (parity 0)
+ * or odd (parity 1) sub-iteration, else 0.
+ */
+CFFI_DLLEXPORT int thinning_table(uint8_t* dst, int algorithm) {
+	if (algorithm != THINNING_GUO_HALL && algorithm != THINNING_ZHANG_SUEN) {
+		return -2;
+	}
+	memcpy(dst, thinning_tables().code[algorithm], 2 * 256);
 	return 0;
 }
+
+/**
+ * Thin a C-contiguous stack of count images, each width x height,
+ * in a single call. Every image has its own convergence loop.
+ *
+ * Every thread uses its own workspace for all images it processes.
+ * Up to num_threads images are processed in parallel.
+ *
+ * Returns 0 on success, -1 if memory allocation failed
+ * and -2 for invalid arguments.
+ */
+CFFI_DLLEXPORT int thinning_batch(uint8_t* images, size_t count, size_t width, size_t height, int algorithm, int method, int num_threads) {
+	if (algorithm != THINNING_GUO_HALL && algorithm != THINNING_ZHANG_SUEN) {
+		return -2;
+	}
+	if (method != THINNING_METHOD_RASTER && method != THINNING_METHOD_FRONTIER
+			&& method != THINNING_METHOD_PACKED) {
+		return -2;
+	}
+	size_t threads = (num_threads < 1) ? 1 : (size_t)num_threads;
+	threads = (threads < count) ? threads : count;
+
+	ThinningRoi roi(width, height, 0, 0, width, height);
+	std::atomic<size_t> next(0);
+	std::atomic<int> rc(0);
+	run_threads(threads, [&](size_t, size_t) {
+		try {
+			thinning_workspace workspace;
+			size_t i;
+			while (rc == 0 && (i = next++) < count) {
+				ThinningMonitor monitor(NULL, 0);
+				workspace_thinning(images + i * width * height, width, height, roi,
+					algorithm, method, 1, workspace, monitor);
+			}
+		} catch (const std::bad_alloc&) {
+			rc = -1;
+		}
+	});
+	return rc;
+}
@@ -0,0 +1,239 @@
+#include "common.hpp"
+#include "parallel.hpp"
+#include <stdint.h>
+#include <string.h>
+#include <vector>
+#include <new>
+
+/**
+ * 3D topology-preserving thinning of binary volumes.
+ *
+ * Voxels are deleted in six directional sub-iterations (one for every
+ * face direction) until no voxel is deleted in six consecutive
+ * sub-iterations. A voxel is deleted if it is a border voxel in the
+ * current direction, not the end of a line and a simple point, i.e.
+ * deleting it does not change the topology (26-connected foreground,
+ * 6-connected background).
+ * Candidates are searched in parallel, then re-checked and deleted
+ * sequentially so deleting several candidates at once can't change the
+ * topology either. The result does not depend on the number of threads.
+ */
+
+//Forward declaration required due to CFFI's requirement to have unmangled symbols
+extern "C" {
+	CFFI_DLLEXPORT int thinning3d(uint8_t* volume, size_t width, size_t height, size_t depth, int num_threads);
+}
+
+/**
+ * The 3x3x3 neighbourhood of a voxel is stored as a 27 bit mask,
+ * bit (dz + 1) * 9 + (dy + 1) * 3 + (dx + 1) being the voxel at (dx, dy, dz).
+ */
+#define CENTER 13
+
+/**
+ * Adjacency of the cells in the 3x3x3 neighbourhood, as bitmasks
+ */
+struct Neighbourhood3D {
+	uint32_t adj26[27]; // 26-adjacent cells
+	uint32_t adj6[27]; // 6-adjacent cells
+	uint32_t n26; // All cells except the center
+	uint32_t n18; // Cells that share a face or an edge with the center
+	uint32_t n6; // Cells that share a face with the center
+
+	Neighbourhood3D() : n26(0), n18(0), n6(0) {
+		for (int a = 0; a < 27; a++) {
+			int ax = a % 3, ay = (a / 3) % 3, az = a / 9;
+			int dist = (ax != 1) + (ay != 1) + (az != 1);
+			if (dist > 0) {
+				n26 |= 1u << a;
+			}
+			if (dist > 0 && dist <= 2) {
+				n18 |= 1u << a;
+			}
+			if (dist == 1) {
+				n6 |= 1u << a;
+			}
+			adj26[a] = adj6[a] = 0;
+			for (int b = 0; b < 27; b++) {
+				int dx = b % 3 - ax, dy = (b / 3) % 3 - ay, dz = b / 9 - az;
+				int nonzero = (dx != 0) + (dy != 0) + (dz != 0);
+				if (nonzero == 0 || dx * dx > 1 || dy * dy > 1 || dz * dz > 1) {
+					continue;
+				}
+				adj26[a] |= 1u << b;
+				if (nonzero == 1) {
+					adj6[a] |= 1u << b;
+				}
+			}
+		}
+	}
+};
+
+static const Neighbourhood3D& neighbourhood3d() {
+	static const Neighbourhood3D nb;
+	return nb;
+}
+
+/**
+ * Number of connected components (using the given adjacency) of the
+ * cells in set that contain at least one of the required cells.
+ * Stops counting at limit + 1.
+ */
+static int count_components(uint32_t set, const uint32_t* adj, uint32_t required, int limit) {
+	int count = 0;
+	while (set != 0) {
+		uint32_t component = set & (~set + 1); // Lowest cell
+		uint32_t frontier = component;
+		while (frontier != 0) {
+			uint32_t cell = frontier & (~frontier + 1);
+			frontier ^= cell;
+			uint32_t grow = adj[__builtin_popcount(cell - 1)] & set & ~component;
+			component |= grow;
+			frontier |= grow;
+		}
+		set &= ~component;
+		if ((component & required) != 0 && ++count > limit) {
+			break;
+		}
+	}
+	return count;
+}
+
+/**
+ * A voxel is simple if the foreground in its 26-neighbourhood is
+ * 26-connected and the background in its 18-neighbourhood has exactly
+ * one 6-connected component that touches one of its faces.
+ */
+static bool is_simple_point(uint32_t nb) {
+	const Neighbourhood3D& n = neighbourhood3d();
+	uint32_t foreground = nb & n.n26;
+	if (count_components(foreground, n.adj26, n.n26, 1) != 1) {
+		return false;
+	}
+	uint32_t background = ~nb & n.n18;
+	return count_components(background, n.adj6, n.n6, 1) == 1;
+}
+
+/**
+ * Padded (0/1) copy of the volume so neighbourhoods can be read
+ * without bounds checks
+ */
+struct Volume3D {
+	std::vector<uint8_t> data;
+	size_t pw, ph, pd; // Padded size
+	ptrdiff_t offsets[27];
+
+	Volume3D(const uint8_t* volume, size_t width, size_t height, size_t depth)
+			: data((width + 2) * (height + 2) * (depth + 2), 0),
+			pw(width + 2), ph(height + 2), pd(depth + 2) {
+		for (size_t z = 0; z < depth; z++) {
+			for (size_t y = 0; y < height; y++) {
+				const uint8_t* src = volume + (z * height + y) * width;
+				uint8_t* dst = &data[index(1, y + 1, z + 1)];
+				for (size_t x = 0; x < width; x++) {
+					dst[x] = (src[x] != 0);
+				}
+			}
+		}
+		for (int i = 0; i < 27; i++) {
+			offsets[i] = (ptrdiff_t)(i % 3 - 1) + (ptrdiff_t)pw * ((i / 3) % 3 - 1)
+				+ (ptrdiff_t)(pw * ph) * (i / 9 - 1);
+		}
+	}
+
+	size_t index(size_t x, size_t y, size_t z) const {
+		return x + pw * (y + ph * z);
+	}
+
+	uint32_t neighbourhood(size_t idx) const {
+		const uint8_t* p = &data[idx];
+		uint32_t nb = 0;
+		for (int i = 0; i < 27; i++) {
+			nb |= (uint32_t)p[offsets[i]] << i;
+		}
+		return nb;
+	}
+};
+
+/**
+ * Neighbourhood cell that must be background for a border voxel
+ * in each of the six directions
+ */
+static const int border_cells[6] = {
+	CENTER - 9, CENTER + 9, // Up, Down (z)
+	CENTER - 3, CENTER + 3, // North, South (y)
+	CENTER - 1, CENTER + 1 // West, East (x)
+};
+
+static inline bool is_deletable(uint32_t nb) {
+	// Line ends have exactly one neighbour
+	return __builtin_popcount(nb & neighbourhood3d().n26) > 1 && is_simple_point(nb);
+}
+
+/**
+ * Perform 3D thinning on a C-contiguous (depth, height, width) volume
+ * (every non-zero value is foreground). Deleted voxels are set to 0.
+ * Candidate voxels are searched by num_threads threads in parallel,
+ * each thread processing a range of planes.
+ *
+ * Returns 0 on success and -1 if memory allocation failed.
+ */
+CFFI_DLLEXPORT int thinning3d(uint8_t* volume, size_t width, size_t height, size_t depth, int num_threads) {
+	if (width == 0 || height == 0 || depth == 0) {
+		return 0;
+	}
+	try {
+		Volume3D vol(volume, width, height, depth);
+		size_t threads = (num_threads < 1) ? 1 : (size_t)num_threads;
+		threads = (threads < depth) ? threads : depth;
+		std::vector<std::vector<size_t> > candidates(threads);
+		int unchanged = 0;
+		for (int direction = 0; unchanged < 6; direction = (direction + 1) % 6) {
+			ptrdiff_t border_offset = vol.offsets[border_cells[direction]];
+			run_threads(threads, [&](size_t index, size_t count) {
+				std::vector<size_t>& found = candidates[index];
+				found.clear();
+				size_t z0 = depth * index / count, z1 = depth * (index + 1) / count;
+				for (size_t z = z0 + 1; z <= z1; z++) {
+					for (size_t y = 1; y <= height; y++) {
+						size_t idx = vol.index(1, y, z);
+						for (size_t x = 0; x < width; x++, idx++) {
+							if (vol.data[idx] == 0 || vol.data[idx + border_offset] != 0) {
+								continue;
+							}
+							if (is_deletable(vol.neighbourhood(idx))) {
+								found.push_back(idx);
+							}
+						}
+					}
+				}
+			});
+			// Sequential re-check, in raster order
+			bool changed = false;
+			for (size_t t = 0; t < threads; t++) {
+				for (size_t idx : candidates[t]) {
+					if (is_deletable(vol.neighbourhood(idx))) {
+						vol.data[idx] = 0;
+						changed = true;
+					}
+				}
+			}
+			unchanged = changed ? 0 : unchanged + 1;
+		}
+		// Write back deleted voxels
+		for (size_t z = 0; z < depth; z++) {
+			for (size_t y = 0; y < height; y++) {
+				uint8_t* dst = volume + (z * height + y) * width;
+				const uint8_t* src = &vol.data[vol.index(1, y + 1, z + 1)];
+				for (size_t x = 0; x < width; x++) {
+					if (src[x] == 0) {
+						dst[x] = 0;
+					}
+				}
+			}
+		}
+	} catch (const std::bad_alloc&) {
+		return -1;
+	}
+	return 0;
+}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import cv2
+import cv_algorithms
+from cv_algorithms import ChainCode, ChainCodeFormat, Direction
+import numpy as np
+from numpy.testing import assert_array_equal
+import unittest
+
+class TestChainCode(unittest.TestCase):
+    def test_roundtrip(self):
+        rng = np.random.default_rng(0)
+        # Random walk with long straight runs
+        steps = np.repeat(rng.integers(0, 8, 50), rng.integers(1, 80, 50))
+        offsets = np.array([[-1, -1], [-1, 0], [-1, 1], [0, -1], [0, 1], [1, -1], [1, 0], [1, 1]])
+        path = np.cumsum(np.vstack([[[100, -5]], offsets[steps]]), axis=0).astype(np.int32)
+        for format in ChainCodeFormat:
+            code = cv_algorithms.chain_encode(path, format)
+            self.assertEqual(len(steps), len(code))
+            self.assertEqual((100, -5), code.start)
+            assert_array_equal(path, code.decode())
+            self.assertEqual([Direction(s + 1) for s in steps], code.directions())
+        self.assertEqual(len(steps), cv_algorithms.chain_encode(path, ChainCodeFormat.Plain).nbytes)
+        self.assertEqual((3 * len(steps) + 7) // 8, cv_algorithms.chain_encode(path, ChainCodeFormat.Packed).nbytes)
+        self.assertLess(cv_algorithms.chain_encode(path).nbytes, path.nbytes // 20)
+        # Single point
+        code = cv_algorithms.chain_encode([[3, 4]])
+        self.assertEqual(0, len(code))
+        assert_array_equal([[3, 4]], code.decode())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            cv_algorithms.chain_encode([[0, 0], [0, 2]])
+        with self.assertRaises(ValueError):
+            cv_algorithms.chain_encode([[0, 0], [0, 0]])
+        with self.assertRaises(ValueError):
+            ChainCode((0, 0), 40, ChainCodeFormat.RunLength, [0xF8]).decode()
+        with self.assertRaisesRegex(ValueError, "int32"):
+            cv_algorithms.chain_encode([[0, 2**32], [0, 2**32 + 1]])
+        with self.assertRaisesRegex(ValueError, "int32"):
+            cv_algorithms.chain_encode(np.array([[0, -2**31 - 1], [0, -2**31]], dtype=np.int64))
+        with self.assertRaisesRegex(ValueError, "> 7"):
+            ChainCode((0, 0), 2, ChainCodeFormat.Plain, [9, 200]).decode()
+        with self.assertRaisesRegex(ValueError, "bytes"):
+            ChainCode((0, 0), 2, ChainCodeFormat.Plain, [1, 2, 3]).decode()
+        with self.assertRaisesRegex(ValueError, "bytes"):
+            ChainCode((0, 0), 6, ChainCodeFormat.Packed, [0, 0]).decode()
+
+    def test_skeleton_edges(self):
+        img = cv2.imread("examples/thinning-example.png", cv2.IMREAD_GRAYSCALE)
+        img = cv2.threshold(img, 180, 255, cv2.THRESH_BINARY)[1]
+        graph = cv_algorithms.skeleton_graph(cv_algorithms.guo_hall(img))
+        for i in range(graph.num_edges):
+            code = graph.edge_chain_code(i)
+            assert_array_equal(graph.edge(i), code.decode())
+            self.assertEqual(graph.edge_directions(i), code.directions())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from numpy.testing import assert_array_equal
+import cv_algorithms
+from cv_algorithms import CpuFeatureLevel
+from cv_algorithms.neighbours import _binary_neighbours_reference
+import numpy as np
+import os
+import subprocess
+import sys
+import unittest
+
+
+class TestCpuFeatureLevel(unittest.TestCase):
+    def tearDown(self):
+        cv_algorithms.set_cpu_feature_level(None)
+
+    def supported_levels(self):
+        supported = cv_algorithms.get_supported_cpu_feature_level()
+        return [level for level in CpuFeatureLevel if level <= supported]
+
+    def assert_same_for_all_levels(self, fn):
+        results = []
+        for level in self.supported_levels():
+            cv_algorithms.set_cpu_feature_level(level)
+            self.assertEqual(cv_algorithms.get_cpu_feature_level(), level)
+            results.append(fn())
+        for result in results[1:]:
+            assert_array_equal(results[0], result)
+        return results[0]
+
+    def test_set_level(self):
+        supported = cv_algorithms.get_supported_cpu_feature_level()
+        self.assertEqual(cv_algorithms.get_cpu_feature_level(), supported)
+        cv_algorithms.set_cpu_feature_level("Baseline")
+        self.assertEqual(cv_algorithms.get_cpu_feature_level(), CpuFeatureLevel.Baseline)
+        cv_algorithms.set_cpu_feature_level()
+        self.assertEqual(cv_algorithms.get_cpu_feature_level(), supported)
+        with self.assertRaises(ValueError):
+            cv_algorithms.set_cpu_feature_level("SSE9")
+        with self.assertRaises(ValueError):
+            cv_algorithms.set_cpu_feature_level(7)
+        if supported < CpuFeatureLevel.AVX512:
+            with self.assertRaises(ValueError):
+                cv_algorithms.set_cpu_feature_level(CpuFeatureLevel.AVX512)
+
+    def test_invalid_environment_level(self):
+        env = dict(os.environ, CV_ALGORITHMS_CPU_LEVEL="SSE9")
+        code = "import cv_algorithms; print(cv_algorithms.get_cpu_feature_level().name)"
+        result = subprocess.run([sys.executable, "-W", "always", "-c", code], env=env,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), cv_algorithms.get_supported_cpu_feature_level().name)
+        self.assertIn("CV_ALGORITHMS_CPU_LEVEL", result.stderr)
+
+    def test_popcount(self):
+        rng = np.random.default_rng(0)
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            # Odd sizes to test the SIMD tails
+            arr = rng.integers(0, np.iinfo(dtype).max, (37, 203), dtype=dtype, endpoint=True)
+            expected = np.unpackbits(arr.view(np.uint8), axis=1).reshape(37, 203, -1).sum(axis=2)
+            assert_array_equal(self.assert_same_for_all_levels(lambda: cv_algorithms.popcount(arr)), expected)
+            self.assert_same_for_all_levels(lambda: cv_algorithms.popcount(arr[:, 3:150:2]))
+            total = self.assert_same_for_all_levels(lambda: cv_algorithms.popcount_sum(arr))
+            self.assertEqual(total, expected.sum())
+            assert_array_equal(self.assert_same_for_all_levels(
+                lambda: cv_algorithms.popcount_sum(arr, block=(5, 77))),
+                np.add.reduceat(np.add.reduceat(expected, range(0, 37, 5), axis=0), range(0, 203, 77), axis=1))
+
+    def test_binary_neighbours(self):
+        rng = np.random.default_rng(1)
+        img = (rng.random((61, 301)) < 0.4).astype(np.uint8)
+        expected = _binary_neighbours_reference(img)
+        assert_array_equal(self.assert_same_for_all_levels(lambda: cv_algorithms.binary_neighbours(img)), expected)
+        self.assert_same_for_all_levels(lambda: cv_algorithms.binary_neighbours_histogram(img))
@@ -21,6 +21,55 @@ class TestXYDistance(unittest.TestCase):
         result = cv_algorithms.pairwise_diff(a, b)
         assert_allclose(result, [[1, 2, 3], [0, 1, 2], [1, 0, 1]])
 
+    def test_out(self):
+        a = np.asarray([1., 2., 3.])
+        out = np.full((3, 3), -1.)
+        result = cv_algorithms.pairwise_diff(a, a, out=out)
+        self.assertIs(out, result)
+        assert_allclose(result, [[0, 1, 2], [1, 0, 1], [2, 1, 0]])
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_diff(a, a, out=np.zeros((3, 3), np.float32))
+
+    def test_fractional_non_square(self):
+        rng = np.random.default_rng(0)
+        a = rng.random(7) * 10
+        b = rng.random(300) * 10
+        for dtype in [np.float32, np.float64]:
+            result = cv_algorithms.pairwise_diff(a.astype(dtype), b.astype(dtype), num_threads=3)
+            self.assertEqual(dtype, result.dtype)
+            assert_array_equal(np.abs(a.astype(dtype)[:, None] - b.astype(dtype)[None]), result)
+        # Strided views & integers
+        assert_array_equal(np.abs(a[::2, None] - np.arange(5)[None]), cv_algorithms.pairwise_diff(a[::2], np.arange(5)))
+        self.assertEqual((0, 300), cv_algorithms.pairwise_diff(a[:0], b).shape)
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_diff(a.reshape(1, -1), b)
+
+    def test_knn(self):
+        rng = np.random.default_rng(1)
+        # Many equal values & distances
+        a = rng.integers(-20, 20, 50) / 4
+        b = rng.integers(-20, 20, 80) / 4
+        dist = np.abs(a[:, None] - b[None])
+        for k, max_distance in [(1, None), (4, None), (100, None), (3, 0.5), (5, 0)]:
+            indices, distances = cv_algorithms.pairwise_diff_knn(a, b, k=k, max_distance=max_distance, num_threads=2)
+            self.assertEqual((50, k), indices.shape)
+            self.assertEqual(np.float64, distances.dtype)
+            for i in range(a.size):
+                order = np.lexsort((np.arange(b.size), dist[i]))
+                if max_distance is not None:
+                    order = order[dist[i, order] <= max_distance]
+                order = order[:k]
+                assert_array_equal(order, indices[i, :order.size])
+                assert_array_equal(dist[i, order], distances[i, :order.size])
+                assert_array_equal(-1, indices[i, order.size:])
+                assert_array_equal(np.inf, distances[i, order.size:])
+        indices, distances = cv_algorithms.pairwise_diff_knn(a.astype(np.float32), b.astype(np.float32), k=2)
+        self.assertEqual(np.float32, distances.dtype)
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_diff_knn(a, b, k=0)
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_diff_knn(a, np.append(b, np.nan))
+
 class TestColorspaceDistance(unittest.TestCase):
     def test_rgb_distance(self):
         img = np.zeros((10,10,3))
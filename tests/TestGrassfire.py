@@ -8,4 +8,164 @@ class TestGrassfire(object):
         "Test grassfire transform"
         mask = np.zeros((10,10), dtype=np.uint8)
         # Currently just test whether it crashes
-        cv_algorithms.grassfire(mask)
\ No newline at end of file
+        cv_algorithms.grassfire(mask)
+
+    def test_grassfire_roi(self):
+        "Pixels outside the ROI are background"
+        mask = np.zeros((10,12), dtype=np.uint8)
+        mask[1:9, 2:11] = 255
+        result = cv_algorithms.grassfire(mask, roi=(4, 2, 5, 6))
+        expected = np.zeros((10,12), dtype=np.uint32)
+        expected[2:8, 4:9] = cv_algorithms.grassfire(mask[2:8, 4:9])
+        assert (result == expected).all()
+
+    def test_grassfire_out(self):
+        mask = np.zeros((10,12), dtype=np.uint8)
+        mask[1:9, 2:11] = 255
+        # out does not need to be initialized
+        out = np.full((10,12), 77, dtype=np.uint32)
+        assert cv_algorithms.grassfire(mask, out=out) is out
+        assert (out == cv_algorithms.grassfire(mask)).all()
+        cv_algorithms.grassfire(mask, roi=(4, 2, 5, 6), out=out)
+        assert (out == cv_algorithms.grassfire(mask, roi=(4, 2, 5, 6))).all()
+
+    def test_grassfire_strided(self):
+        "Views are processed without copying them"
+        mask = np.zeros((10,12,3), dtype=np.uint8)
+        mask[1:9, 2:11, 2] = 255
+        mask[3:5, 4:6, 2] = 0
+        cv_algorithms.reset_input_copies()
+        for view in [mask[:, :, 2], mask[::-1, 1:, 2], mask[::2, ::-3, 2]]:
+            expected = cv_algorithms.grassfire(np.ascontiguousarray(view))
+            assert (cv_algorithms.grassfire(view) == expected).all()
+        assert cv_algorithms.input_copies() == {}
+
+    def test_grassfire_metrics(self):
+        "Compare all metrics to a brute-force distance computation"
+        rng = np.random.default_rng(3)
+        mask = (rng.random((23, 31)) > 0.1).astype(np.uint8)
+        # Pixels outside the image are background
+        padded = np.pad(mask != 0, 1)
+        bg_y, bg_x = np.nonzero(~padded)
+        for metric in cv_algorithms.GrassfireMetric:
+            result = cv_algorithms.grassfire(mask, metric=metric)
+            expected = np.zeros(mask.shape)
+            for y, x in zip(*np.nonzero(mask)):
+                dy, dx = np.abs(bg_y - y - 1), np.abs(bg_x - x - 1)
+                expected[y, x] = {
+                    cv_algorithms.GrassfireMetric.Cityblock: dy + dx,
+                    cv_algorithms.GrassfireMetric.Chessboard: np.maximum(dy, dx),
+                    cv_algorithms.GrassfireMetric.Euclidean: np.sqrt(dy * dy + dx * dx)
+                }[metric].min()
+            assert np.allclose(expected, result)
+            # ROI and views behave like for the default metric
+            roi = cv_algorithms.grassfire(mask, roi=(4, 2, 20, 15), metric=metric)
+            assert (roi[2:17, 4:24] == cv_algorithms.grassfire(mask[2:17, 4:24], metric=metric)).all()
+            assert (roi[:2] == 0).all()
+
+    def test_grassfire_euclidean_dtype(self):
+        mask = np.full((5, 7), 255, dtype=np.uint8)
+        result = cv_algorithms.grassfire(mask, metric=cv_algorithms.GrassfireMetric.Euclidean)
+        assert result.dtype == np.float32
+        assert result[2, 3] == 3
+        # Rounded for integer dtypes, dtype taken from out
+        out = np.zeros((5, 7), dtype=np.uint16)
+        cv_algorithms.grassfire(mask, metric=cv_algorithms.GrassfireMetric.Euclidean, out=out)
+        assert (out == np.round(result)).all()
+
+    def test_grassfire_dtype(self):
+        mask = np.full((600, 700), 255, dtype=np.uint8)
+        expected = cv_algorithms.grassfire(mask)
+        for method in cv_algorithms.GrassfireMethod:
+            # Saturation
+            result = cv_algorithms.grassfire(mask, dtype=np.uint8, method=method)
+            assert result.dtype == np.uint8
+            assert (result == np.minimum(expected, 255)).all()
+            assert (cv_algorithms.grassfire(mask, dtype=np.float32, method=method) == expected).all()
+            # Overflow check
+            try:
+                cv_algorithms.grassfire(mask, dtype=np.uint8, saturate=False, method=method)
+                assert False, "ValueError expected"
+            except ValueError:
+                pass
+            assert (cv_algorithms.grassfire(mask, dtype=np.uint16, saturate=False, method=method) == expected).all()
+            # No overflow if the distances are limited by max_distance
+            result = cv_algorithms.grassfire(mask, dtype=np.uint8, max_distance=100, saturate=False, method=method)
+            assert (result == np.minimum(expected, 100)).all()
+        try:
+            cv_algorithms.grassfire(mask, dtype=np.int32)
+            assert False, "ValueError expected"
+        except ValueError:
+            pass
+
+    def test_grassfire_separable(self):
+        "The parallel separable method matches the two-pass method"
+        rng = np.random.default_rng(4)
+        mask = (rng.random((61, 47)) > 0.05).astype(np.uint8)
+        for metric in cv_algorithms.GrassfireMetric:
+            expected = cv_algorithms.grassfire(mask, metric=metric)
+            for num_threads in [1, 3]:
+                result = cv_algorithms.grassfire(mask, metric=metric, num_threads=num_threads,
+                                                 method=cv_algorithms.GrassfireMethod.Separable)
+                assert (expected == result).all()
+                roi = (3, 5, 40, 50)
+                assert (cv_algorithms.grassfire(mask, roi=roi, metric=metric) ==
+                        cv_algorithms.grassfire(mask, roi=roi, metric=metric, num_threads=num_threads,
+                                                method=cv_algorithms.GrassfireMethod.Separable)).all()
+
+    def test_grassfire_update(self):
+        "Incremental updates give the same result as recomputing"
+        rng = np.random.default_rng(6)
+        mask = (rng.random((40, 50)) > 0.15).astype(np.uint8) * 255
+        for metric in [cv_algorithms.GrassfireMetric.Cityblock, cv_algorithms.GrassfireMetric.Chessboard]:
+            dist = cv_algorithms.grassfire(mask, metric=metric)
+            # Erase, then paint over a larger area
+            erased = mask.copy()
+            erased[10:15, 20:24] = 0
+            cv_algorithms.grassfire_update(erased, dist, (20, 10, 4, 5), metric=metric)
+            assert (dist == cv_algorithms.grassfire(erased, metric=metric)).all()
+            painted = erased.copy()
+            painted[5:20, 15:30] = 255
+            pixels = [(y, x) for y in range(5, 20) for x in range(15, 30)]
+            cv_algorithms.grassfire_update(painted, dist, pixels, metric=metric)
+            assert (dist == cv_algorithms.grassfire(painted, metric=metric)).all()
+            # Unchanged pixels don't cause any updates
+            assert cv_algorithms.grassfire_update(painted, dist, metric=metric) == 0
+        try:
+            cv_algorithms.grassfire_update(mask, dist, [(40, 0)])
+            assert False, "ValueError expected"
+        except ValueError:
+            pass
+        # Errors about the distance map name the dist parameter
+        for wrong in [dist[:-1], dist.astype(np.float32)]:
+            try:
+                cv_algorithms.grassfire_update(mask, wrong)
+                assert False, "ValueError expected"
+            except ValueError as ex:
+                assert str(ex).startswith("dist ")
+
+    def test_grassfire3d(self):
+        "3D distances are the shortest paths through 6-, 18- or 26-neighbours"
+        rng = np.random.default_rng(7)
+        volume = (rng.random((7, 9, 11)) > 0.1).astype(np.uint8)
+        # Brute force: Distance to every background voxel, including the border
+        padded = np.pad(volume, 1)
+        bg = np.argwhere(padded == 0) - 1
+        fg = np.argwhere(volume != 0)
+        diff = np.abs(fg[:, None, :] - bg[None, :, :])
+        l1, linf = diff.sum(axis=2), diff.max(axis=2)
+        steps = {6: l1, 18: np.maximum(linf, (l1 + 1) // 2), 26: linf}
+        for connectivity, dist in steps.items():
+            expected = np.zeros(volume.shape, dtype=np.uint32)
+            expected[tuple(fg.T)] = dist.min(axis=1)
+            for method in cv_algorithms.GrassfireMethod:
+                for num_threads in [1, 3]:
+                    result = cv_algorithms.grassfire3d(volume, connectivity, method=method,
+                                                       num_threads=num_threads)
+                    assert result.dtype == np.uint32
+                    assert (expected == result).all()
+        try:
+            cv_algorithms.grassfire3d(volume, 8)
+            assert False, "ValueError expected"
+        except ValueError:
+            pass
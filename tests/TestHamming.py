@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from numpy.testing import assert_array_equal
+import cv_algorithms
+import numpy as np
+import unittest
+
+
+def hamming_reference(a, b):
+    a = a.view(np.uint8).reshape(a.shape[0], -1)
+    b = b.view(np.uint8).reshape(b.shape[0], -1)
+    return np.unpackbits(a[:, None] ^ b[None], axis=2).sum(axis=2)
+
+
+class TestHamming(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_pairwise_hamming(self):
+        for row_bytes in (1, 5, 32, 64, 100):
+            a = self.rng.integers(0, 256, (37, row_bytes), dtype=np.uint8)
+            b = self.rng.integers(0, 256, (1500, row_bytes), dtype=np.uint8)
+            expected = hamming_reference(a, b)
+            assert_array_equal(cv_algorithms.pairwise_hamming(a, b), expected)
+            assert_array_equal(cv_algorithms.pairwise_hamming(a, b, num_threads=3), expected)
+
+    def test_pairwise_hamming_dtypes(self):
+        a = self.rng.integers(0, 2**63, (10, 4), dtype=np.uint64)
+        b = self.rng.integers(0, 2**63, (20, 4), dtype=np.uint64)
+        assert_array_equal(cv_algorithms.pairwise_hamming(a, b), hamming_reference(a, b))
+        # Non-contiguous input
+        assert_array_equal(cv_algorithms.pairwise_hamming(a[::2, 1:3], b[:, :2]),
+                           hamming_reference(a[::2, 1:3].copy(), b[:, :2].copy()))
+        # Output array
+        out = np.empty((10, 20), dtype=np.uint32)
+        self.assertIs(cv_algorithms.pairwise_hamming(a, b, out=out), out)
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_hamming(a, b[:, :3])
+        with self.assertRaises(ValueError):
+            cv_algorithms.pairwise_hamming(a.astype(np.int64), b)
+
+    def test_hamming_knn(self):
+        a = self.rng.integers(0, 256, (50, 32), dtype=np.uint8)
+        b = self.rng.integers(0, 256, (3000, 32), dtype=np.uint8)
+        b[:50:2] = a[::2] # Exact duplicates
+        distances = hamming_reference(a, b)
+        order = np.argsort(distances, axis=1, kind="stable")
+        for k in (1, 4):
+            for num_threads in (1, 4):
+                indices, dist = cv_algorithms.hamming_knn(a, b, k=k, num_threads=num_threads)
+                assert_array_equal(indices, order[:, :k])
+                assert_array_equal(dist, np.take_along_axis(distances, order[:, :k], axis=1))
+        assert_array_equal(dist[::2, 0], 0)
+
+    def test_hamming_knn_max_distance(self):
+        a = self.rng.integers(0, 256, (20, 8), dtype=np.uint8)
+        b = self.rng.integers(0, 256, (40, 8), dtype=np.uint8)
+        distances = hamming_reference(a, b)
+        indices, dist = cv_algorithms.hamming_knn(a, b, k=50, max_distance=28)
+        for i in range(a.shape[0]):
+            matches = np.nonzero(distances[i] <= 28)[0]
+            matches = matches[np.argsort(distances[i, matches], kind="stable")]
+            assert_array_equal(indices[i, :matches.size], matches)
+            assert_array_equal(indices[i, matches.size:], -1)
+            assert_array_equal(dist[i, matches.size:], 2**32 - 1)
+        with self.assertRaises(ValueError):
+            cv_algorithms.hamming_knn(a, b, k=0)
+
+    def test_empty(self):
+        a = self.rng.integers(0, 2**32, (5, 2), dtype=np.uint32)
+        empty = np.zeros((0, 2), dtype=np.uint32)
+        self.assertEqual(cv_algorithms.pairwise_hamming(empty, a).shape, (0, 5))
+        self.assertEqual(cv_algorithms.pairwise_hamming(a, empty).shape, (5, 0))
+        indices, dist = cv_algorithms.hamming_knn(empty, a, k=2)
+        self.assertEqual(indices.shape, (0, 2))
+        self.assertEqual(dist.shape, (0, 2))
+        indices, dist = cv_algorithms.hamming_knn(a, empty, k=2)
+        assert_array_equal(indices, -1)
+        assert_array_equal(dist, 2**32 - 1)
+        self.assertEqual(indices.shape, (5, 2))
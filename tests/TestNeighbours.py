@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import tempfile
 import cv_algorithms
 from cv_algorithms import Neighbours, Direction
 import numpy as np
@@ -127,4 +129,136 @@ class TestNeighbours(unittest.TestCase):
     def test_direction_str(self):
         self.assertEqual("↑", str(Direction.North))
         self.assertEqual(Direction.North, Direction.from_unicode("↑"))
-        self.assertEqual([Direction.SouthEast, Direction.North], Direction.from_unicode("↘↑"))
\ No newline at end of file
+        self.assertEqual([Direction.SouthEast, Direction.North], Direction.from_unicode("↘↑"))
+
+    def test_binary_neighbours_roi(self):
+        rng = np.random.RandomState(0)
+        img = ((rng.rand(20, 30) > 0.5) * 255).astype(np.uint8)
+        full = cv_algorithms.binary_neighbours(img)
+        result = cv_algorithms.binary_neighbours(img, roi=(3, 5, 10, 8))
+        self.assertTrue((result[5:13, 3:13] == full[5:13, 3:13]).all())
+        result[5:13, 3:13] = 0
+        self.assertFalse(result.any())
+        with self.assertRaises(ValueError):
+            cv_algorithms.binary_neighbours(img, roi=(-1, 0, 5, 5))
+
+    def test_binary_neighbours_out(self):
+        rng = np.random.RandomState(1)
+        img = ((rng.rand(20, 30) > 0.5) * 255).astype(np.uint8)
+        out = np.full(img.shape, 123, dtype=np.uint8)
+        self.assertIs(out, cv_algorithms.binary_neighbours(img, out=out))
+        self.assertTrue((out == cv_algorithms.binary_neighbours(img)).all())
+        with self.assertRaises(ValueError):
+            cv_algorithms.binary_neighbours(img, out=np.zeros(img.shape, dtype=np.uint32))
+
+    def test_binary_neighbours_strided(self):
+        img = np.zeros((20, 30), dtype=np.uint8)
+        img[np.random.default_rng(1).random(img.shape) > 0.5] = 255
+        cv_algorithms.reset_input_copies()
+        for view in [img[:, 5:25], img[::-1, ::2], img.T]:
+            expected = cv_algorithms.binary_neighbours(np.ascontiguousarray(view))
+            np.testing.assert_array_equal(expected, cv_algorithms.binary_neighbours(view))
+        self.assertEqual({}, cv_algorithms.input_copies())
+
+    def test_binary_neighbours_vectorized(self):
+        # The vectorized implementation matches the per-pixel reference
+        from cv_algorithms.neighbours import _binary_neighbours_reference
+        rng = np.random.default_rng(2)
+        for shape in [(1, 1), (1, 40), (40, 1), (3, 17), (37, 70)]:
+            img = (rng.random(shape) > 0.5).astype(np.uint8) * rng.integers(1, 256, shape, dtype=np.uint8)
+            for view in [img, img[::-1, ::-1], img.T]:
+                np.testing.assert_array_equal(_binary_neighbours_reference(view),
+                                              cv_algorithms.binary_neighbours(view))
+        roi = (5, 3, 33, 20)
+        np.testing.assert_array_equal(_binary_neighbours_reference(img, roi=roi),
+                                      cv_algorithms.binary_neighbours(img, roi=roi))
+
+    def test_binary_neighbours_histogram(self):
+        rng = np.random.default_rng(3)
+        img = (rng.random((37, 70)) > 0.6).astype(np.uint8) * 255
+        roi = (5, 3, 33, 20)
+        for view, roi in [(img, None), (img, roi), (img[::-1, ::2], None)]:
+            codes = cv_algorithms.binary_neighbours(view, roi=roi)
+            x, y, w, h = roi or (0, 0, view.shape[1], view.shape[0])
+            codes, fg = codes[y:y+h, x:x+w], view[y:y+h, x:x+w] != 0
+            hist = cv_algorithms.binary_neighbours_histogram(view, roi=roi)
+            self.assertEqual(np.uint64, hist.dtype)
+            np.testing.assert_array_equal(np.bincount(codes.ravel(), minlength=256), hist)
+            np.testing.assert_array_equal(np.bincount(codes[fg], minlength=256),
+                                          cv_algorithms.binary_neighbours_histogram(view, roi=roi, foreground_only=True))
+
+    def test_binary_neighbours_match(self):
+        rng = np.random.default_rng(4)
+        img = (rng.random((37, 70)) > 0.6).astype(np.uint8) * 255
+        codes = cv_algorithms.binary_neighbours(img)
+        selected = [0, 1, 2, 4, 8, 16, 32, 64, 128]
+        expected = np.isin(codes, selected) & (img != 0)
+        self.assertEqual(expected.sum(), cv_algorithms.binary_neighbours_match(img, selected))
+        count, coords = cv_algorithms.binary_neighbours_match(img, selected, return_coords=True)
+        self.assertEqual(expected.sum(), count)
+        np.testing.assert_array_equal(np.argwhere(expected), coords)
+        # Lookup table, background pixels & ROI
+        table = np.zeros(256, dtype=bool)
+        table[selected] = True
+        count, coords = cv_algorithms.binary_neighbours_match(img, table, roi=(10, 5, 20, 30),
+                                                              foreground_only=False, return_coords=True)
+        expected = np.zeros(img.shape, dtype=bool)
+        expected[5:35, 10:30] = np.isin(codes, selected)[5:35, 10:30]
+        np.testing.assert_array_equal(np.argwhere(expected), coords)
+        self.assertEqual((0, 2), cv_algorithms.binary_neighbours_match(img, [], return_coords=True)[1].shape)
+        with self.assertRaises(ValueError):
+            cv_algorithms.binary_neighbours_match(img, [256])
+
+    def test_binary_neighbours_chunked(self):
+        rng = np.random.default_rng(5)
+        img = (rng.random((41, 70)) > 0.6).astype(np.uint8) * 255
+        selected = [0, 1, 2, 4, 8, 16, 32, 64, 128]
+        for view, roi in [(img, None), (img, (5, 3, 33, 20)), (img[::-1, ::2], None)]:
+            for chunk_size in [1, 200]:
+                np.testing.assert_array_equal(cv_algorithms.binary_neighbours(view, roi=roi),
+                                              cv_algorithms.binary_neighbours(view, roi=roi, chunk_size=chunk_size))
+                np.testing.assert_array_equal(cv_algorithms.binary_neighbours_histogram(view, roi=roi),
+                                              cv_algorithms.binary_neighbours_histogram(view, roi=roi, chunk_size=chunk_size))
+                count, coords = cv_algorithms.binary_neighbours_match(view, selected, roi=roi, return_coords=True)
+                chunked_count, chunked_coords = cv_algorithms.binary_neighbours_match(
+                    view, selected, roi=roi, return_coords=True, chunk_size=chunk_size)
+                self.assertEqual(count, chunked_count)
+                np.testing.assert_array_equal(coords, chunked_coords)
+
+    def test_binary_neighbours_memmap(self):
+        rng = np.random.default_rng(6)
+        img = (rng.random((200, 300)) > 0.6).astype(np.uint8) * 255
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = np.memmap(os.path.join(tmpdir, "img.bin"), dtype=np.uint8, mode="w+", shape=img.shape)
+            src[:] = img
+            out = np.memmap(os.path.join(tmpdir, "out.bin"), dtype=np.uint8, mode="w+", shape=img.shape)
+            cv_algorithms.binary_neighbours(src, out=out, chunk_size=4096)
+            np.testing.assert_array_equal(cv_algorithms.binary_neighbours(img), out)
+            np.testing.assert_array_equal(cv_algorithms.binary_neighbours_histogram(img),
+                                          cv_algorithms.binary_neighbours_histogram(src))
+            del src, out
+
+    def test_neighbours_arrays(self):
+        rng = np.random.default_rng(5)
+        img = (rng.random((20, 30)) > 0.5).astype(np.uint8) * 255
+        neighbours = cv_algorithms.binary_neighbours(img)
+        masks = Neighbours.direction_masks(neighbours)
+        self.assertEqual((20, 30, 8), masks.shape)
+        for direction in Direction:
+            expected = np.vectorize(lambda pixel: Neighbours.is_direction(direction, pixel))(neighbours)
+            np.testing.assert_array_equal(expected, Neighbours.is_direction_array(direction, neighbours))
+            np.testing.assert_array_equal(expected, masks[..., direction - 1])
+        counts = Neighbours.count_directions(neighbours)
+        np.testing.assert_array_equal(masks.sum(axis=2), counts)
+        self.assertEqual(list(Neighbours.iterate_directions(neighbours[3, 4])),
+                         [d for d in Direction if masks[3, 4, d - 1]])
+        # Coordinates, one direction for all or one per pixel
+        coords = np.argwhere(img)
+        shifted = Neighbours.coords_array(Direction.NorthEast, coords)
+        np.testing.assert_array_equal(coords + [-1, 1], shifted)
+        directions = rng.integers(1, 9, len(coords))
+        shifted = Neighbours.coords_array(directions, coords)
+        for (y, x), direction, result in zip(coords, directions, shifted):
+            self.assertEqual(Neighbours.coords(Direction(direction), y, x), tuple(result))
+        with self.assertRaises(ValueError):
+            Neighbours.coords_array(np.zeros(len(coords)), coords)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from numpy.testing import assert_array_equal
+import cv_algorithms
+from cv_algorithms import PackedBinary
+import numpy as np
+import unittest
+
+class TestPackedBinary(unittest.TestCase):
+    def test_pack_unpack(self):
+        rng = np.random.RandomState(0)
+        for width in (1, 63, 64, 65, 130):
+            img = ((rng.rand(7, width) > 0.5) * 255).astype(np.uint8)
+            packed = PackedBinary.pack(img)
+            self.assertEqual((7, width), packed.shape)
+            self.assertEqual((width + 63) // 64, packed.words_per_row)
+            self.assertEqual(np.count_nonzero(img), packed.count_nonzero())
+            assert_array_equal(img, packed.unpack())
+            assert_array_equal((img != 0) * 1, packed.unpack(1))
+
+    def test_bit_layout(self):
+        img = np.zeros((2, 70), dtype=np.uint8)
+        img[0, 0] = 1
+        img[1, 65] = 17 # Any non-zero value is foreground
+        packed = PackedBinary.pack(img)
+        assert_array_equal([[1, 0], [0, 2]], packed.data)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            PackedBinary.pack(np.zeros((10, 10), dtype=np.uint16))
+        with self.assertRaises(ValueError):
+            PackedBinary(np.zeros((10, 2), dtype=np.uint64), 10)
+        # Bits past the width must not be set
+        data = np.zeros((3, 2), dtype=np.uint64)
+        data[1, 1] = 1 << 5
+        PackedBinary(data, 70)
+        with self.assertRaises(ValueError):
+            PackedBinary(data, 69)
+
+    def test_pack_view(self):
+        img = np.zeros((9, 150, 2), dtype=np.uint8)
+        img[np.random.default_rng(2).random(img.shape) > 0.5] = 255
+        for view in [img[:, :, 1], img[::-1, 3:, 0]]:
+            self.assertEqual(PackedBinary.pack(np.ascontiguousarray(view)), PackedBinary.pack(view))
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import cv_algorithms
+import unittest
+
+class TestParallel(unittest.TestCase):
+    def tearDown(self):
+        cv_algorithms.set_num_threads(1)
+
+    def test_num_threads(self):
+        self.assertEqual(1, cv_algorithms.get_num_threads())
+        cv_algorithms.set_num_threads(4)
+        self.assertEqual(4, cv_algorithms.get_num_threads())
+        cv_algorithms.set_num_threads(0)
+        self.assertEqual(0, cv_algorithms.get_num_threads())
+        with self.assertRaises(ValueError):
+            cv_algorithms.set_num_threads(-1)
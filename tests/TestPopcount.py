@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import io
+import os
+import tempfile
 from numpy.testing import assert_array_equal
 import cv2
 import cv_algorithms
@@ -96,3 +98,79 @@ class TestPopcount(unittest.TestCase):
         o[1,1] = 64
         assert_array_equal(o, cv_algorithms.popcount(i))
 
+
+    def test_popcount_out(self):
+        i = np.arange(256, dtype=np.uint8).reshape(16, 16)
+        out = np.full((16, 16), 99, dtype=np.uint8)
+        self.assertIs(out, cv_algorithms.popcount(i, out=out))
+        assert_array_equal(cv_algorithms.popcount(i), out)
+        with self.assertRaises(ValueError):
+            cv_algorithms.popcount(i, out=np.zeros((16, 15), dtype=np.uint8))
+
+    def test_popcount_strided(self):
+        arr = np.arange(4 * 5 * 6, dtype=np.uint32).reshape(4, 5, 6) * 0x01010101
+        cv_algorithms.reset_input_copies()
+        for view in [arr[:, :, ::2], arr[1:3, 1:4, 1:], arr[:, 2, :], arr[::-1], arr.transpose(1, 0, 2)]:
+            assert_array_equal(cv_algorithms.popcount(np.ascontiguousarray(view)),
+                               cv_algorithms.popcount(view))
+        self.assertEqual({}, cv_algorithms.input_copies())
+        # Unaligned arrays need to be copied
+        unaligned = np.zeros(41, dtype=np.uint8)[1:].view(np.uint32)
+        unaligned[:] = np.arange(10)
+        assert_array_equal(cv_algorithms.popcount(np.arange(0, 10, 2, dtype=np.uint32)),
+                           cv_algorithms.popcount(unaligned[::2]))
+        self.assertEqual(1, cv_algorithms.input_copies()["popcount"]["count"])
+
+    def test_popcount_sum(self):
+        rng = np.random.default_rng(0)
+        arr = rng.integers(0, 2**63, (4, 5, 70), dtype=np.uint64)
+        for view in [arr, arr[:, :, ::3], arr.transpose(1, 0, 2), arr[2], arr[0, 0], arr.view(np.uint8)]:
+            counts = cv_algorithms.popcount(view).astype(np.uint64)
+            self.assertEqual(counts.sum(), cv_algorithms.popcount_sum(view))
+            for axis in range(-view.ndim, view.ndim):
+                result = cv_algorithms.popcount_sum(view, axis=axis)
+                self.assertEqual(np.uint64, result.dtype)
+                assert_array_equal(counts.sum(axis=axis), result)
+        # Blocks, including incomplete blocks at the border
+        counts = cv_algorithms.popcount(arr).astype(np.uint64)
+        blocks = cv_algorithms.popcount_sum(arr, block=(2, 16))
+        self.assertEqual((4, 3, 5), blocks.shape)
+        for by in range(3):
+            for bx in range(5):
+                assert_array_equal(counts[:, 2*by:2*by+2, 16*bx:16*bx+16].sum(axis=(1, 2)), blocks[:, by, bx])
+        self.assertEqual(0, cv_algorithms.popcount_sum(np.zeros((0, 3), dtype=np.uint8)))
+        with self.assertRaises(ValueError):
+            cv_algorithms.popcount_sum(arr, axis=3)
+        with self.assertRaises(ValueError):
+            cv_algorithms.popcount_sum(arr, block=(0, 1))
+
+    def test_popcount_chunked(self):
+        rng = np.random.default_rng(1)
+        arr = rng.integers(0, 2**63, (3, 21, 30), dtype=np.uint64)
+        for view in [arr, arr[:, ::2, 1:], arr.view(np.uint8)]:
+            assert_array_equal(cv_algorithms.popcount(view), cv_algorithms.popcount(view, chunk_size=100))
+            self.assertEqual(cv_algorithms.popcount_sum(view), cv_algorithms.popcount_sum(view, chunk_size=100))
+            for axis in range(view.ndim):
+                assert_array_equal(cv_algorithms.popcount_sum(view, axis=axis),
+                                   cv_algorithms.popcount_sum(view, axis=axis, chunk_size=100))
+            assert_array_equal(cv_algorithms.popcount_sum(view, block=(4, 7)),
+                               cv_algorithms.popcount_sum(view, block=(4, 7), chunk_size=100))
+        with self.assertRaises(ValueError):
+            cv_algorithms.popcount(arr, chunk_size=-1)
+
+    def test_popcount_memmap(self):
+        rng = np.random.default_rng(2)
+        arr = rng.integers(0, 256, (300, 1000), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = np.memmap(os.path.join(tmpdir, "src.bin"), dtype=np.uint8, mode="w+", shape=arr.shape)
+            src[:] = arr
+            src.flush()
+            src = np.memmap(os.path.join(tmpdir, "src.bin"), dtype=np.uint8, mode="r", shape=arr.shape)
+            out = np.memmap(os.path.join(tmpdir, "out.bin"), dtype=np.uint8, mode="w+", shape=arr.shape)
+            cv_algorithms.popcount(src, out=out, chunk_size=4096)
+            assert_array_equal(cv_algorithms.popcount(arr), out)
+            # Default chunk size for memmaps
+            self.assertEqual(cv_algorithms.popcount_sum(arr), cv_algorithms.popcount_sum(src))
+            assert_array_equal(cv_algorithms.popcount_sum(arr, axis=0),
+                               cv_algorithms.popcount_sum(src, axis=0, chunk_size=4096))
+            del src, out
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import cv2
+import cv_algorithms
+from cv_algorithms import SkeletonNodeType, SkeletonPixelType, Direction
+import numpy as np
+from numpy.testing import assert_array_equal
+import unittest
+
+class TestSkeleton(unittest.TestCase):
+    def test_cross(self):
+        img = np.zeros((12, 20), dtype=np.uint8)
+        img[5, 2:15] = 255
+        img[1:11, 8] = 255
+        img[0, 18] = 255
+        graph = cv_algorithms.skeleton_graph(img)
+        assert_array_equal([[1, 8], [5, 2], [5, 14], [10, 8]], graph.endpoints)
+        assert_array_equal([[5, 8]], graph.junctions)
+        self.assertEqual(SkeletonNodeType.Isolated, graph.node_types[0])
+        self.assertEqual(4, graph.num_edges)
+        junction = np.where(graph.node_types == SkeletonNodeType.Junction)[0][0]
+        self.assertTrue((graph.edges == junction).any(axis=1).all())
+        # Every edge starts & ends at its nodes
+        for i in range(graph.num_edges):
+            edge = graph.edge(i)
+            assert_array_equal(graph.nodes[graph.edges[i, 0]], edge[0])
+            assert_array_equal(graph.nodes[graph.edges[i, 1]], edge[-1])
+        self.assertEqual([Direction.South] * 4, graph.edge_directions(0))
+
+    def test_loop(self):
+        img = np.zeros((10, 10), dtype=np.uint8)
+        cv2.circle(img, (5, 5), 3, 255, 1)
+        graph = cv_algorithms.skeleton_graph(img)
+        self.assertEqual(0, len(graph.nodes))
+        assert_array_equal([[-1, -1]], graph.edges)
+        edge = graph.edge(0)
+        # Closed loop covering all pixels
+        assert_array_equal(edge[0], edge[-1])
+        self.assertEqual(np.count_nonzero(img), len(edge) - 1)
+
+    def test_line_pixel_between_nodes(self):
+        # Thick cluster: The line pixel [5, 4] is only reachable via other lines
+        img = np.array([[0, 0, 0, 0, 0, 0, 0],
+                        [0, 0, 0, 1, 1, 0, 0],
+                        [0, 1, 0, 1, 1, 1, 0],
+                        [0, 0, 1, 1, 1, 1, 0],
+                        [0, 1, 1, 1, 0, 1, 0],
+                        [0, 0, 1, 0, 1, 0, 0],
+                        [0, 0, 0, 0, 0, 0, 0]], dtype=np.uint8) * 255
+        graph = cv_algorithms.skeleton_graph(img)
+        # It is not emitted as closed loop but as edge between two nodes
+        self.assertFalse((graph.edges == -1).any())
+        edges = [i for i in range(graph.num_edges) if [5, 4] in graph.edge(i).tolist()]
+        self.assertEqual(1, len(edges))
+        start, end = graph.edges[edges[0]]
+        self.assertNotEqual(start, end)
+        assert_array_equal([graph.nodes[start], [5, 4], graph.nodes[end]], graph.edge(edges[0]))
+        for i in range(graph.num_edges):
+            steps = np.abs(np.diff(graph.edge(i).astype(int), axis=0))
+            self.assertEqual(1, steps.max())
+
+    def test_thinned_image(self):
+        img = cv2.imread("examples/thinning-example.png", cv2.IMREAD_GRAYSCALE)
+        img = cv2.threshold(img, 180, 255, cv2.THRESH_BINARY)[1]
+        graph = cv_algorithms.skeleton_graph(cv_algorithms.guo_hall(img))
+        self.assertGreater(len(graph.endpoints), 0)
+        self.assertGreater(len(graph.junctions), 0)
+        self.assertEqual(len(graph.edge_coords), graph.edge_lengths.sum())
+        # All edges are 8-connected
+        for i in range(graph.num_edges):
+            steps = np.abs(np.diff(graph.edge(i).astype(int), axis=0))
+            self.assertEqual(1, steps.max())
+        for thinned in [cv_algorithms.guo_hall(img), cv_algorithms.zhang_suen(img)]:
+            graph = cv_algorithms.skeleton_graph(thinned)
+            # Only closed loops have no start & end node
+            self.assertFalse(((graph.edges == -1).sum(axis=1) == 1).any())
+            # Every line pixel lies on an edge
+            lines = cv_algorithms.skeleton_points(thinned, include_lines=True).lines
+            on_edges = set(map(tuple, graph.edge_coords.tolist()))
+            self.assertEqual([], [tuple(p) for p in lines.tolist() if tuple(p) not in on_edges])
+
+    def test_points(self):
+        img = np.zeros((12, 20), dtype=np.uint8)
+        img[5, 2:15] = 255
+        img[1:11, 8] = 255
+        img[0, 18] = 255
+        # Staircase ending in a diagonal step: No junctions
+        img[8, 12] = img[9, 12] = img[9, 13] = img[10, 13] = img[10, 14] = 255
+        points = cv_algorithms.skeleton_points(img[:, ::-1][:, ::-1], include_lines=True)
+        assert_array_equal([[0, 18]], points.isolated)
+        assert_array_equal([[1, 8], [5, 2], [5, 14], [8, 12], [10, 8], [10, 14]], points.endpoints)
+        assert_array_equal([[5, 8]], points[SkeletonPixelType.Junction])
+        self.assertEqual(np.count_nonzero(img) - 8, points.num_lines)
+        self.assertEqual(points.num_lines, len(points.lines))
+        # Every foreground pixel is classified exactly once
+        all_points = np.concatenate([points[t] for t in SkeletonPixelType])
+        self.assertEqual(np.count_nonzero(img), len(np.unique(all_points, axis=0)))
+        # Same classification as the nodes of skeleton_graph()
+        thinned = cv_algorithms.guo_hall(cv2.threshold(cv2.imread(
+            "examples/thinning-example.png", cv2.IMREAD_GRAYSCALE), 180, 255, cv2.THRESH_BINARY)[1])
+        points = cv_algorithms.skeleton_points(thinned)
+        graph = cv_algorithms.skeleton_graph(thinned)
+        self.assertIsNone(points.lines)
+        assert_array_equal(graph.endpoints, points.endpoints)
+        # Every junction pixel belongs to a junction node: skeleton_graph() merges
+        # 8-connected junction pixels into a node at their first pixel in raster order
+        mask = np.zeros(thinned.shape, dtype=np.uint8)
+        mask[tuple(points.junctions.T)] = 1
+        labels = cv2.connectedComponents(mask, connectivity=8)[1]
+        graph_junctions = set(map(tuple, graph.junctions.tolist()))
+        for y, x in points.junctions.tolist():
+            first = np.argwhere(labels == labels[y, x])[0]
+            self.assertIn(tuple(first), graph_junctions)
@@ -5,6 +5,7 @@ import cv2
 import cv_algorithms
 import numpy as np
 import unittest
+from numpy.testing import assert_array_equal
 
 class TestThinning(unittest.TestCase):
     def setUp(self) -> None:
@@ -38,3 +39,234 @@ class TestThinning(unittest.TestCase):
         # Currently just run and see if it crashes
         result = cv_algorithms.zhang_suen(self.img_thresh)
         self._checkThinningImage(result)
+
+    def testFrontierMatchesRaster(self):
+        "Frontier thinning must produce exactly the raster result"
+        for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+            raster = fn(self.img_thresh)
+            frontier = fn(self.img_thresh, method=cv_algorithms.ThinningMethod.Frontier)
+            assert_array_equal(raster, frontier)
+
+    def testFrontierRandom(self):
+        "Frontier thinning on random blobs, including the image border"
+        rng = np.random.RandomState(0)
+        for _ in range(10):
+            img = ((rng.rand(37, 53) > 0.3) * 255).astype(np.uint8)
+            img = cv2.dilate(img, np.ones((3, 3), np.uint8))
+            for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+                assert_array_equal(fn(img),
+                    fn(img, method=cv_algorithms.ThinningMethod.Frontier))
+
+    def testThinningTable(self):
+        "The exported deletion tables must match one raster sub-iteration"
+        img = self.img_thresh.copy()
+        for algorithm, fn in ((cv_algorithms.ThinningAlgorithm.GuoHall, cv_algorithms.guo_hall),
+                              (cv_algorithms.ThinningAlgorithm.ZhangSuen, cv_algorithms.zhang_suen)):
+            table = cv_algorithms.thinning_table(algorithm)
+            self.assertEqual((2, 256), table.shape)
+            self.assertEqual(bool, table.dtype)
+            # Isolated pixels & fully surrounded pixels are never deleted
+            self.assertFalse(table[:, 0].any())
+            self.assertFalse(table[:, 255].any())
+            # Apply the first sub-iteration using numpy
+            deletable = table[0][cv_algorithms.binary_neighbours(img)] & (img != 0)
+            deletable[[0, -1], :] = False
+            deletable[:, [0, -1]] = False
+            self.assertTrue(deletable.any())
+            # Applying the tables to the result must not delete anything
+            result = fn(img)
+            for parity in (0, 1):
+                deletable = table[parity][cv_algorithms.binary_neighbours(result)] & (result != 0)
+                self.assertFalse(deletable[1:-1, 1:-1].any())
+
+    def testParallelMatchesSerial(self):
+        "Multi-threaded raster thinning must produce exactly the serial result"
+        rng = np.random.RandomState(1)
+        img = ((rng.rand(257, 91) > 0.4) * 255).astype(np.uint8)
+        for src in (self.img_thresh, img):
+            for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+                serial = fn(src, num_threads=1)
+                for num_threads in (2, 3, 7):
+                    assert_array_equal(serial, fn(src, num_threads=num_threads))
+
+    def testBatchMatchesSingle(self):
+        "Batch thinning must produce the same result as thinning every image"
+        rng = np.random.RandomState(2)
+        imgs = ((rng.rand(20, 32, 32) > 0.4) * 255).astype(np.uint8)
+        for fn, batch_fn in ((cv_algorithms.guo_hall, cv_algorithms.guo_hall_batch),
+                             (cv_algorithms.zhang_suen, cv_algorithms.zhang_suen_batch)):
+            expected = np.stack([fn(img) for img in imgs])
+            assert_array_equal(expected, batch_fn(imgs))
+            assert_array_equal(expected, batch_fn(list(imgs)))
+            assert_array_equal(expected, batch_fn(imgs, num_threads=3))
+            assert_array_equal(expected, batch_fn(imgs,
+                method=cv_algorithms.ThinningMethod.Frontier, num_threads=2))
+        # The input must not be modified unless inplace=True
+        orig = imgs.copy()
+        cv_algorithms.guo_hall_batch(imgs)
+        assert_array_equal(orig, imgs)
+        cv_algorithms.guo_hall_batch(imgs, inplace=True)
+        self.assertFalse((orig == imgs).all())
+
+    def testBatchEmpty(self):
+        "An empty stack is returned as is, an empty list can't be stacked"
+        empty = np.zeros((0, 32, 32), dtype=np.uint8)
+        for batch_fn in (cv_algorithms.guo_hall_batch, cv_algorithms.zhang_suen_batch):
+            self.assertEqual(batch_fn(empty).shape, (0, 32, 32))
+            with self.assertRaises(ValueError):
+                batch_fn([])
+            with self.assertRaises(ValueError):
+                batch_fn(np.zeros((0, 2, 32), dtype=np.uint8))
+
+    def testPackedMatchesRaster(self):
+        "Word-parallel thinning must produce exactly the raster result"
+        rng = np.random.RandomState(3)
+        img = ((rng.rand(45, 131) > 0.4) * 255).astype(np.uint8)
+        for src in (self.img_thresh, img):
+            for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+                raster = fn(src)
+                assert_array_equal(raster, fn(src, method=cv_algorithms.ThinningMethod.Packed))
+                packed = cv_algorithms.PackedBinary.pack(src)
+                result = fn(packed)
+                self.assertIsInstance(result, cv_algorithms.PackedBinary)
+                assert_array_equal(raster, result.unpack())
+                # Not modified unless inplace=True
+                assert_array_equal(src, packed.unpack())
+
+    def testROI(self):
+        "Thinning a ROI only modifies the ROI and matches thinning the crop"
+        rng = np.random.RandomState(4)
+        img = np.zeros((60, 90), dtype=np.uint8)
+        img[20:40, 30:70] = ((rng.rand(20, 40) > 0.3) * 255).astype(np.uint8)
+        img[5:10, 2:20] = 255
+        roi = (25, 15, 50, 30) # x, y, width, height
+        for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+            # Thinning the crop with one pixel of border is equivalent
+            expected = img.copy()
+            expected[14:46, 24:76] = fn(img[14:46, 24:76])
+            for method in cv_algorithms.ThinningMethod:
+                assert_array_equal(expected, fn(img, roi=roi, method=method))
+            assert_array_equal(expected, fn(img, roi=roi, num_threads=2))
+            packed = cv_algorithms.PackedBinary.pack(img)
+            assert_array_equal(expected, fn(packed, roi=roi).unpack())
+            # The full image ROI is the default
+            assert_array_equal(fn(img), fn(img, roi=(0, 0, 90, 60)))
+        with self.assertRaises(ValueError):
+            cv_algorithms.guo_hall(img, roi=(80, 0, 20, 10))
+
+    def testStats(self):
+        "All methods report the same iterations & deletions"
+        expected, stats = cv_algorithms.guo_hall(self.img_thresh, return_stats=True)
+        self.assertIsInstance(stats, cv_algorithms.ThinningStats)
+        self.assertTrue(stats.converged)
+        self.assertEqual(2 * stats.iterations, len(stats.deletions))
+        # The last iteration does not delete anything
+        self.assertEqual(0, stats.deletions[-2:].sum())
+        removed = np.count_nonzero(self.img_thresh) - np.count_nonzero(expected)
+        self.assertEqual(removed, stats.pixels_removed)
+        self.assertGreater(stats.bytes_touched, 0)
+        for method in cv_algorithms.ThinningMethod:
+            result, mstats = cv_algorithms.guo_hall(self.img_thresh, method=method, return_stats=True)
+            assert_array_equal(expected, result)
+            self.assertEqual(stats.iterations, mstats.iterations)
+            assert_array_equal(stats.deletions, mstats.deletions)
+
+    def testStatsEmptyROI(self):
+        "All methods report one empty iteration for an empty ROI"
+        for roi in [(10, 10, 0, 20), (10, 10, 20, 0)]:
+            for fn in (cv_algorithms.guo_hall, cv_algorithms.zhang_suen):
+                for method in cv_algorithms.ThinningMethod:
+                    result, stats = fn(self.img_thresh, roi=roi, method=method, return_stats=True)
+                    assert_array_equal(self.img_thresh, result)
+                    self.assertTrue(stats.converged)
+                    self.assertEqual(1, stats.iterations)
+                    assert_array_equal([0, 0], stats.deletions)
+                packed = cv_algorithms.PackedBinary.pack(self.img_thresh)
+                stats = fn(packed, roi=roi, return_stats=True)[1]
+                assert_array_equal([0, 0], stats.deletions)
+
+    def testMaxIterations(self):
+        expected, stats = cv_algorithms.zhang_suen(self.img_thresh, return_stats=True)
+        for method in cv_algorithms.ThinningMethod:
+            result, capped = cv_algorithms.zhang_suen(
+                self.img_thresh, method=method, max_iterations=2, return_stats=True)
+            self.assertEqual(2, capped.iterations)
+            self.assertFalse(capped.converged)
+            assert_array_equal(stats.deletions[:4], capped.deletions)
+            # Continuing from the intermediate result yields the final result
+            assert_array_equal(expected, cv_algorithms.zhang_suen(result, method=method))
+        # A cap that is not reached does not change anything
+        result, capped = cv_algorithms.zhang_suen(
+            self.img_thresh, max_iterations=stats.iterations, return_stats=True)
+        self.assertTrue(capped.converged)
+        assert_array_equal(expected, result)
+        with self.assertRaises(ValueError):
+            cv_algorithms.zhang_suen(self.img_thresh, max_iterations=0)
+
+    def testOutAndWorkspace(self):
+        ws = cv_algorithms.Workspace()
+        self.assertEqual(0, ws.nbytes)
+        out = np.empty_like(self.img_thresh)
+        orig = self.img_thresh.copy()
+        for method in cv_algorithms.ThinningMethod:
+            expected = cv_algorithms.guo_hall(self.img_thresh, method=method)
+            result = cv_algorithms.guo_hall(self.img_thresh, method=method, out=out, workspace=ws)
+            self.assertIs(out, result)
+            assert_array_equal(expected, out)
+            assert_array_equal(orig, self.img_thresh)
+            assert_array_equal(cv_algorithms.zhang_suen(self.img_thresh, method=method),
+                cv_algorithms.zhang_suen(self.img_thresh, method=method, workspace=ws))
+            # The buffers are only allocated once
+            nbytes = ws.nbytes
+            cv_algorithms.guo_hall(self.img_thresh, method=method, out=out, workspace=ws)
+            self.assertEqual(nbytes, ws.nbytes)
+        self.assertGreater(ws.nbytes, 0)
+        packed = cv_algorithms.PackedBinary.pack(self.img_thresh)
+        packed_out = cv_algorithms.PackedBinary.pack(np.zeros_like(self.img_thresh))
+        self.assertIs(packed_out, cv_algorithms.guo_hall(packed, out=packed_out))
+        assert_array_equal(cv_algorithms.guo_hall(self.img_thresh), packed_out.unpack())
+        with self.assertRaises(ValueError):
+            cv_algorithms.guo_hall(self.img_thresh, out=np.empty((3, 3), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            cv_algorithms.guo_hall(self.img_thresh, out=out, inplace=True)
+
+    def testInplaceView(self):
+        # In-place thinning of a non-contiguous view modifies the view
+        img = np.zeros((self.img_thresh.shape[0], self.img_thresh.shape[1], 3), dtype=np.uint8)
+        img[:, :, 1] = self.img_thresh
+        view = img[:, :, 1]
+        cv_algorithms.reset_input_copies()
+        self.assertIs(view, cv_algorithms.guo_hall(view, inplace=True))
+        assert_array_equal(cv_algorithms.guo_hall(self.img_thresh), img[:, :, 1])
+        self.assertEqual(1, cv_algorithms.input_copies()["thinning"]["count"])
+        # Not in-place, the copy is the result
+        cv_algorithms.reset_input_copies()
+        cv_algorithms.zhang_suen(img[:, ::2, 0])
+        self.assertEqual({}, cv_algorithms.input_copies())
+
+    def testThinning3D(self):
+        # A box is thinned to its center line
+        box = np.zeros((20, 20, 40), dtype=np.uint8)
+        box[5:15, 5:15, 5:35] = 255
+        result = cv_algorithms.thinning3d(box)
+        self.assertEqual(255, box[10, 10, 10])
+        points = np.argwhere(result)
+        self.assertEqual({(10, 10)}, set(map(tuple, points[:, :2].tolist())))
+        self.assertTrue((result[result != 0] == 255).all())
+        # Lines are not shortened
+        assert_array_equal(result, cv_algorithms.thinning3d(result))
+        # The hole of a torus is preserved: A closed curve without ends
+        z, y, x = np.ogrid[:40, :40, :40]
+        torus = ((np.sqrt((x - 20)**2 + (y - 20)**2) - 12)**2 + (z - 20)**2 < 25).astype(np.uint8)
+        result = cv_algorithms.thinning3d(torus)
+        points = np.argwhere(result)
+        self.assertGreater(len(points), 50)
+        for point in points:
+            neighbours = result[tuple(slice(c - 1, c + 2) for c in point)]
+            self.assertGreaterEqual(neighbours.sum(), 3)
+        # Parallel & in-place on a view
+        volume = np.zeros((2,) + torus.shape, dtype=np.uint8)
+        volume[1] = torus
+        view = volume[1, :, :, ::-1]
+        self.assertIs(view, cv_algorithms.thinning3d(view, inplace=True, num_threads=3))
+        assert_array_equal(cv_algorithms.thinning3d(torus[:, :, ::-1]), view)